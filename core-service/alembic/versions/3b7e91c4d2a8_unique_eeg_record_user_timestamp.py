@@ -0,0 +1,40 @@
+"""unique eeg_records user_id, timestamp
+
+Revision ID: 3b7e91c4d2a8
+Revises: fd442042a1e3
+Create Date: 2026-10-16 09:12:44.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e91c4d2a8'
+down_revision: Union[str, Sequence[str], None] = 'fd442042a1e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop rows duplicated by replayed Kafka messages, keeping the first insert
+    op.execute(
+        """
+        DELETE FROM eeg_records a
+        USING eeg_records b
+        WHERE a.user_id = b.user_id
+          AND a.timestamp = b.timestamp
+          AND a.id > b.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_eeg_records_user_timestamp', 'eeg_records', ['user_id', 'timestamp']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_eeg_records_user_timestamp', 'eeg_records', type_='unique')
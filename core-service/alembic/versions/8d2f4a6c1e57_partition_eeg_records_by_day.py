@@ -0,0 +1,121 @@
+"""partition eeg_records by day, covering (user_id, timestamp) index
+
+Revision ID: 8d2f4a6c1e57
+Revises: 3b7e91c4d2a8
+Create Date: 2026-10-16 11:40:27.903115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4a6c1e57'
+down_revision: Union[str, Sequence[str], None] = '3b7e91c4d2a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Daily partitions created ahead of today (kept topped up by the app/lambda)
+DAYS_AHEAD = 14
+
+COLUMNS = (
+    "id, user_id, timestamp, focus_label, stress_label, wellness_label, "
+    "created_at, created_by, updated_at, updated_by"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Move the plain table aside; keep its id sequence for the new table
+    op.execute("ALTER TABLE eeg_records RENAME TO eeg_records_unpartitioned")
+    op.execute("ALTER SEQUENCE eeg_records_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE eeg_records_unpartitioned DROP CONSTRAINT IF EXISTS uq_eeg_records_user_timestamp")
+    op.execute("ALTER TABLE eeg_records_unpartitioned DROP CONSTRAINT IF EXISTS eeg_records_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_eeg_records_id")
+    op.execute("DROP INDEX IF EXISTS ix_eeg_records_user_id")
+
+    op.execute(
+        """
+        CREATE TABLE eeg_records (
+            id INTEGER NOT NULL DEFAULT nextval('eeg_records_id_seq'),
+            user_id INTEGER,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            focus_label FLOAT,
+            stress_label FLOAT,
+            wellness_label FLOAT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            created_by INTEGER,
+            updated_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_by INTEGER,
+            CONSTRAINT eeg_records_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """
+    )
+    op.execute("ALTER SEQUENCE eeg_records_id_seq OWNED BY eeg_records.id")
+    op.execute(
+        """
+        CREATE UNIQUE INDEX ix_eeg_records_user_id_timestamp
+            ON eeg_records (user_id, timestamp)
+            INCLUDE (focus_label, stress_label, wellness_label)
+        """
+    )
+    op.execute("CREATE TABLE eeg_records_default PARTITION OF eeg_records DEFAULT")
+
+    # One partition per day from the oldest existing row through DAYS_AHEAD days from now
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            day date;
+        BEGIN
+            FOR day IN
+                SELECT generate_series(
+                    LEAST(COALESCE((SELECT min(timestamp)::date FROM eeg_records_unpartitioned), current_date), current_date),
+                    current_date + {DAYS_AHEAD},
+                    interval '1 day'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF eeg_records FOR VALUES FROM (%L) TO (%L)',
+                    'eeg_records_p' || to_char(day, 'YYYYMMDD'), day, day + 1
+                );
+            END LOOP;
+        END $$
+        """
+    )
+
+    op.execute(f"INSERT INTO eeg_records ({COLUMNS}) SELECT {COLUMNS} FROM eeg_records_unpartitioned")
+    op.execute("DROP TABLE eeg_records_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE eeg_records RENAME TO eeg_records_partitioned")
+    op.execute("ALTER SEQUENCE eeg_records_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE eeg_records_partitioned DROP CONSTRAINT eeg_records_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_eeg_records_user_id_timestamp")
+
+    op.create_table(
+        'eeg_records',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('eeg_records_id_seq')"), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('focus_label', sa.Float(), nullable=True),
+        sa.Column('stress_label', sa.Float(), nullable=True),
+        sa.Column('wellness_label', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_by', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id', name='eeg_records_pkey'),
+    )
+    op.execute("ALTER SEQUENCE eeg_records_id_seq OWNED BY eeg_records.id")
+    op.create_index('ix_eeg_records_id', 'eeg_records', ['id'], unique=False)
+    op.create_index('ix_eeg_records_user_id', 'eeg_records', ['user_id'], unique=False)
+    op.create_unique_constraint('uq_eeg_records_user_timestamp', 'eeg_records', ['user_id', 'timestamp'])
+
+    op.execute(f"INSERT INTO eeg_records ({COLUMNS}) SELECT {COLUMNS} FROM eeg_records_partitioned")
+    # Drops every partition with it
+    op.execute("DROP TABLE eeg_records_partitioned CASCADE")
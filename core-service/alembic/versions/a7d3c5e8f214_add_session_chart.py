@@ -0,0 +1,30 @@
+"""store the precomputed chart series on sessions
+
+Revision ID: a7d3c5e8f214
+Revises: e6b03d9a5c21
+Create Date: 2026-10-16 16:05:31.207415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3c5e8f214'
+down_revision: Union[str, Sequence[str], None] = 'e6b03d9a5c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULL for sessions tracked before this; their details are still built from eeg_records
+    op.add_column('sessions', sa.Column('chart', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sessions', 'chart')
@@ -0,0 +1,54 @@
+"""add eeg daily threshold counts
+
+Revision ID: b8e4f1c2d937
+Revises: a7d3c5e8f214
+Create Date: 2026-10-16 21:40:12.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4f1c2d937'
+down_revision: Union[str, Sequence[str], None] = 'a7d3c5e8f214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'eeg_daily_threshold_counts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('high_focus', sa.Integer(), nullable=False),
+        sa.Column('low_stress', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'date', name='uq_threshold_count_user_date'),
+    )
+    op.create_index(op.f('ix_eeg_daily_threshold_counts_id'), 'eeg_daily_threshold_counts', ['id'], unique=False)
+
+    # Backfill today (UTC); earlier days are credited from the daily aggregates
+    op.execute(
+        """
+        INSERT INTO eeg_daily_threshold_counts (user_id, date, high_focus, low_stress)
+        SELECT user_id, CAST(timestamp AS date),
+               count(*) FILTER (WHERE focus_label > 2.0),
+               count(*) FILTER (WHERE stress_label < 1.0)
+        FROM eeg_records
+        WHERE user_id IS NOT NULL
+          AND timestamp >= CAST(timezone('utc', now()) AS date)
+          AND timestamp < CAST(timezone('utc', now()) AS date) + 1
+        GROUP BY user_id, CAST(timestamp AS date)
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_eeg_daily_threshold_counts_id'), table_name='eeg_daily_threshold_counts')
+    op.drop_table('eeg_daily_threshold_counts')
@@ -0,0 +1,74 @@
+"""add eeg minute/hour rollups
+
+Revision ID: c41a7e2b9f03
+Revises: 8d2f4a6c1e57
+Create Date: 2026-10-16 13:05:51.274906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a7e2b9f03'
+down_revision: Union[str, Sequence[str], None] = '8d2f4a6c1e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUPS = (
+    ('eeg_minute_rollups', 'uq_minute_rollup_user_bucket', 'minute'),
+    ('eeg_hour_rollups', 'uq_hour_rollup_user_bucket', 'hour'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, constraint, unit in ROLLUPS:
+        op.create_table(
+            table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('sample_count', sa.Integer(), nullable=False),
+            sa.Column('focus_sum', sa.Float(), nullable=False),
+            sa.Column('focus_min', sa.Float(), nullable=False),
+            sa.Column('focus_max', sa.Float(), nullable=False),
+            sa.Column('stress_sum', sa.Float(), nullable=False),
+            sa.Column('stress_min', sa.Float(), nullable=False),
+            sa.Column('stress_max', sa.Float(), nullable=False),
+            sa.Column('wellness_sum', sa.Float(), nullable=False),
+            sa.Column('wellness_min', sa.Float(), nullable=False),
+            sa.Column('wellness_max', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'bucket', name=constraint),
+        )
+        op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+
+        # Backfill from the raw records still present
+        op.execute(
+            f"""
+            INSERT INTO {table} (
+                user_id, bucket, sample_count,
+                focus_sum, focus_min, focus_max,
+                stress_sum, stress_min, stress_max,
+                wellness_sum, wellness_min, wellness_max
+            )
+            SELECT user_id, date_trunc('{unit}', timestamp), count(*),
+                   sum(focus_label), min(focus_label), max(focus_label),
+                   sum(stress_label), min(stress_label), max(stress_label),
+                   sum(wellness_label), min(wellness_label), max(wellness_label)
+            FROM eeg_records
+            WHERE user_id IS NOT NULL
+              AND focus_label IS NOT NULL AND stress_label IS NOT NULL AND wellness_label IS NOT NULL
+            GROUP BY user_id, date_trunc('{unit}', timestamp)
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, _, _ in reversed(ROLLUPS):
+        op.drop_index(op.f(f'ix_{table}_id'), table_name=table)
+        op.drop_table(table)
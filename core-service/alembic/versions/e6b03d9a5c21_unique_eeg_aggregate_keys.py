@@ -0,0 +1,42 @@
+"""unique keys on daily/monthly/yearly eeg aggregates
+
+Revision ID: e6b03d9a5c21
+Revises: c41a7e2b9f03
+Create Date: 2026-10-16 14:22:08.641377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b03d9a5c21'
+down_revision: Union[str, Sequence[str], None] = 'c41a7e2b9f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, old index, new unique constraint, key columns)
+KEYS = (
+    ('daily_eeg_records', 'idx_daily_user_date', 'uq_daily_user_date', ['user_id', 'date']),
+    ('monthly_eeg_records', 'idx_monthly_user_year_month', 'uq_monthly_user_year_month', ['user_id', 'year', 'month']),
+    ('yearly_eeg_records', 'idx_yearly_user_year', 'uq_yearly_user_year', ['user_id', 'year']),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, index, constraint, columns in KEYS:
+        # Keep the newest row where earlier runs left duplicates
+        match = " AND ".join(f"a.{c} = b.{c}" for c in columns)
+        op.execute(f"DELETE FROM {table} a USING {table} b WHERE {match} AND a.id < b.id")
+        op.drop_index(index, table_name=table, if_exists=True)
+        op.create_unique_constraint(constraint, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, index, constraint, columns in KEYS:
+        op.drop_constraint(constraint, table, type_='unique')
+        op.create_index(index, table, columns, unique=False)
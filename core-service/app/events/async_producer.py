@@ -0,0 +1,30 @@
+"""
+Process-wide batched, non-blocking Kafka producer (niura_kafka.async_producer)
+built from this service's Kafka config.
+"""
+
+import threading
+from typing import Optional
+
+from niura_kafka.async_producer import AsyncKafkaProducer
+
+from app.events.kafka_config import get_kafka_config
+
+_producer: Optional[AsyncKafkaProducer] = None
+_producer_lock = threading.Lock()
+
+
+def get_producer() -> AsyncKafkaProducer:
+    """Return the process-wide producer, creating it on first use."""
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = AsyncKafkaProducer(get_kafka_config())
+    return _producer
+
+
+def close_producer(timeout: float = 10.0) -> None:
+    """Flush and stop the process-wide producer, if one was created."""
+    if _producer is not None:
+        _producer.close(timeout)
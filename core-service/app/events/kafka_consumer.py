@@ -1,75 +1,107 @@
 from confluent_kafka import Consumer
-import os, json, logging, threading
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.eeg_record import EEGRecord
+import os, json, logging
+from app.services.eeg_ingest_service import save_eeg_rows
 from datetime import datetime
 from app.events.kafka_config import get_kafka_config
+from niura_kafka.consumer_runtime import PartitionedConsumer, dead_letter_topic
+from app.events.async_producer import close_producer, get_producer
 
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
 
+# Each worker writes the messages fetched for its partitions in one INSERT:
+# up to this many messages, waiting at most this long for them to arrive
+EEG_INSERT_BATCH_MESSAGES = int(os.getenv("EEG_INSERT_BATCH_MESSAGES", "500"))
+EEG_INSERT_FLUSH_INTERVAL = float(os.getenv("EEG_INSERT_FLUSH_INTERVAL", "1.0"))
+EEG_INSERT_RETRY_BACKOFF = float(os.getenv("EEG_INSERT_RETRY_BACKOFF", "2.0"))
+# Messages that still cannot be stored after the runtime's retries go here
+EEG_PROCESSED_DLQ_TOPIC = os.getenv("EEG_PROCESSED_DLQ_TOPIC", "eeg.processed.data.dlq")
+
 conf = get_kafka_config(is_consumer=True)
 conf["group.id"] = "core-service-consumer"
+conf["enable.auto.commit"] = False
+
+runtime = None
+
+
+def processed_eeg_rows(data: dict) -> list:
+    """Turn one processed EEG Kafka message into eeg_records row dicts."""
+    user_id = int(data.get("user_id"))
+    records = data.get("records", [])
+    logging.info(f"📥 Received processed EEG data for user {user_id}: {len(records)} records")
+
+    if not records:
+        logging.warning(f"⚠️ No records found in EEG payload for user {user_id}")
+        return []
+
+    now = datetime.utcnow()
+    return [
+        {
+            "user_id": user_id,
+            "timestamp": datetime.fromisoformat(rec["timestamp"]),
+            "focus_label": float(rec["focus_label"]),
+            "stress_label": float(rec["stress_label"]),
+            "wellness_label": float(rec["wellness_label"]),
+            "created_at": now,
+            "created_by": user_id,
+            "updated_at": now,
+            "updated_by": user_id,
+        }
+        for rec in records
+    ]
 
-consumer = Consumer(conf)
-consumer.subscribe(["eeg.processed.data"])
 
 def handle_processed_eeg(data: dict):
     """Handle processed EEG data received from Kafka and save it in core_db."""
     try:
-        user_id = int(data.get("user_id"))
-        records = data.get("records", [])
-        logging.info(f"📥 Received processed EEG data for user {user_id}: {len(records)} records")
-
-        if not records:
-            logging.warning(f"⚠️ No records found in EEG payload for user {user_id}")
-            return
-
-        db: Session = SessionLocal()
-        eeg_db_records = []
-
-        for rec in records:
-            eeg = EEGRecord(
-                user_id=user_id,
-                timestamp=datetime.fromisoformat(rec["timestamp"]),
-                focus_label=float(rec["focus_label"]),
-                stress_label=float(rec["stress_label"]),
-                wellness_label=float(rec["wellness_label"]),
-                created_at=datetime.utcnow(),
-                created_by=user_id,
-                updated_at=datetime.utcnow(),
-                updated_by=user_id,
-            )
-            eeg_db_records.append(eeg)
-
-        db.add_all(eeg_db_records)
-        db.commit()
-        db.close()
-
-        logging.info(f"✅ Saved {len(eeg_db_records)} EEG records for user {user_id} in core_db")
-
+        rows = processed_eeg_rows(data)
+        if rows:
+            save_eeg_rows(rows)
+            logging.info(f"✅ Saved {len(rows)} EEG records for user {rows[0]['user_id']} in core_db")
     except Exception as e:
         logging.exception(f"❌ Error while saving processed EEG data: {str(e)}")
 
 
-def consume_loop():
-    logging.info("👂 Core-service consuming topic 'eeg.processed.data'")
-    while True:
+def handle_messages(messages: list) -> None:
+    """
+    PartitionedConsumer handler: write a batch of processed EEG messages in one transaction.
+
+    Raising makes the runtime retry the batch; offsets are committed only
+    after the insert commits, and ON CONFLICT makes the retry idempotent.
+    A batch that keeps failing is retried message by message, and messages
+    that fail on their own go to EEG_PROCESSED_DLQ_TOPIC.
+    """
+    rows = []
+    for msg in messages:
         try:
-            msg = consumer.poll(1.0)
-            if msg is None:
-                continue
-            if msg.error():
-                logging.error(f"Kafka error: {msg.error()}")
-                continue
-            data = json.loads(msg.value().decode("utf-8"))
-            handle_processed_eeg(data)
+            rows.extend(processed_eeg_rows(json.loads(msg.value().decode("utf-8"))))
         except Exception as e:
-            logging.exception(f"Error in consume_loop: {e}")
+            # Malformed message: skip it (its offset is committed with the batch)
+            logging.exception(f"❌ Skipping invalid processed EEG message: {e}")
+
+    if rows:
+        save_eeg_rows(rows)
+    logging.info(f"✅ Saved {len(rows)} EEG records from {len(messages)} messages in core_db")
 
 
 def start_consumer():
-    """Start Kafka consumer in a background thread."""
+    """Start the partition-parallel Kafka consumer."""
+    global runtime
     logging.info("🚀 Starting Core-service Kafka consumer...")
-    t = threading.Thread(target=consume_loop, daemon=True)
-    t.start()
+    runtime = PartitionedConsumer(
+        Consumer(conf),
+        ["eeg.processed.data"],
+        handle_messages,
+        name="core-processed-consumer",
+        batch_size=EEG_INSERT_BATCH_MESSAGES,
+        batch_timeout=EEG_INSERT_FLUSH_INTERVAL,
+        retry_backoff=EEG_INSERT_RETRY_BACKOFF,
+        dead_letter=dead_letter_topic(get_producer(), EEG_PROCESSED_DLQ_TOPIC),
+    )
+    runtime.start()
+
+
+def stop_consumer():
+    """Write fetched messages, commit their offsets and leave the group."""
+    if runtime is not None:
+        runtime.stop()
+    close_producer()
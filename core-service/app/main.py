@@ -1,12 +1,14 @@
 from asyncio import create_task
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import aggregation, eeg_controller, goals_controller
-from app.events.kafka_consumer import start_consumer
+from app.events.kafka_consumer import start_consumer, stop_consumer
 from app.core.logging_config import setup_json_logger
 from app.core.request_logger import ContextLoggingMiddleware, RequestLoggingMiddleware
-from app.database import Base, engine
+from app.database import Base, engine, SessionLocal
+from app.services.eeg_partition_service import ensure_eeg_record_partitions
 
 
 logger = setup_json_logger()
@@ -16,10 +18,17 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Core service starting up")
     Base.metadata.create_all(bind=engine)
     logger.info("✅ Database initialized")
+    db = SessionLocal()
+    try:
+        ensure_eeg_record_partitions(db)
+    finally:
+        db.close()
     # ℹ️  Kafka topics are created manually via bastion host (see backEnd/KAFKA_SETUP.md)
     start_consumer()  # ✅ Start consuming from existing topics
     yield
     logger.info("🛑 Core service shutting down")
+    await run_in_threadpool(stop_consumer)
+    logger.info("🛑 Kafka consumer stopped")
 
 # Create FastAPI app with lifespan management
 app = FastAPI(
@@ -1,3 +1,3 @@
 from app.database import Base
 from .eeg_record import EEGRecord
-from .eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord, EEGRecordsBackup
\ No newline at end of file
+from .eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord, EEGRecordsBackup, EEGMinuteRollup, EEGHourRollup, EEGDailyThresholdCount
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, Date,  Index
+from sqlalchemy import Column, Integer, Float, Date, DateTime, Index, UniqueConstraint
 from app.database import Base
 
 class DailyEEGRecord(Base):
@@ -13,7 +13,7 @@ class DailyEEGRecord(Base):
     
 
     __table_args__ = (
-        Index('idx_daily_user_date', 'user_id', 'date'),
+        UniqueConstraint('user_id', 'date', name='uq_daily_user_date'),
     )
 
 class MonthlyEEGRecord(Base):
@@ -29,7 +29,7 @@ class MonthlyEEGRecord(Base):
     
     
     __table_args__ = (
-        Index('idx_monthly_user_year_month', 'user_id', 'year', 'month'),
+        UniqueConstraint('user_id', 'year', 'month', name='uq_monthly_user_year_month'),
     )
 
 class YearlyEEGRecord(Base):
@@ -45,7 +45,7 @@ class YearlyEEGRecord(Base):
 
     
     __table_args__ = (
-        Index('idx_yearly_user_year', 'user_id', 'year'),
+        UniqueConstraint('user_id', 'year', name='uq_yearly_user_year'),
     )
 
 class EEGRecordsBackup(Base):
@@ -66,3 +66,65 @@ class EEGRecordsBackup(Base):
         Index('idx_backup_user_date', 'user_id', 'backup_date'),
         Index('idx_backup_timestamp', 'timestamp'),
     )
+
+
+class EEGMinuteRollup(Base):
+    """Per-user, per-minute running totals of eeg_records, maintained on ingest."""
+    __tablename__ = "eeg_minute_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    bucket = Column(DateTime, nullable=False)  # start of the minute
+    sample_count = Column(Integer, nullable=False)
+    focus_sum = Column(Float, nullable=False)
+    focus_min = Column(Float, nullable=False)
+    focus_max = Column(Float, nullable=False)
+    stress_sum = Column(Float, nullable=False)
+    stress_min = Column(Float, nullable=False)
+    stress_max = Column(Float, nullable=False)
+    wellness_sum = Column(Float, nullable=False)
+    wellness_min = Column(Float, nullable=False)
+    wellness_max = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'bucket', name='uq_minute_rollup_user_bucket'),
+    )
+
+class EEGHourRollup(Base):
+    """Per-user, per-hour running totals of eeg_records, maintained on ingest."""
+    __tablename__ = "eeg_hour_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    bucket = Column(DateTime, nullable=False)  # start of the hour
+    sample_count = Column(Integer, nullable=False)
+    focus_sum = Column(Float, nullable=False)
+    focus_min = Column(Float, nullable=False)
+    focus_max = Column(Float, nullable=False)
+    stress_sum = Column(Float, nullable=False)
+    stress_min = Column(Float, nullable=False)
+    stress_max = Column(Float, nullable=False)
+    wellness_sum = Column(Float, nullable=False)
+    wellness_min = Column(Float, nullable=False)
+    wellness_max = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'bucket', name='uq_hour_rollup_user_bucket'),
+    )
+
+class EEGDailyThresholdCount(Base):
+    """
+    Per-user, per-day count of records above the HIGH_FOCUS / LOW_STRESS_EPISODES
+    goal thresholds, maintained on ingest so today's goal credit is incremental.
+    """
+    __tablename__ = "eeg_daily_threshold_counts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    high_focus = Column(Integer, nullable=False)  # records with focus_label > 2.0
+    low_stress = Column(Integer, nullable=False)  # records with stress_label < 1.0
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'date', name='uq_threshold_count_user_date'),
+    )
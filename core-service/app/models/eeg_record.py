@@ -1,16 +1,37 @@
-from sqlalchemy import Column, Integer, Float, DateTime
+from sqlalchemy import Column, Integer, Float, DateTime, Index, DDL, event
 from app.database import Base
 
 class EEGRecord(Base):
     __tablename__ = "eeg_records"
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    timestamp = Column(DateTime, nullable=False)
+    # (id, timestamp) primary key: a partitioned table's keys must include the partition column
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer)
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
     focus_label = Column(Float)
     stress_label = Column(Float)
     wellness_label = Column(Float)
     created_at = Column(DateTime)
     created_by = Column(Integer)
     updated_at = Column(DateTime)
-    updated_by = Column(Integer)
\ No newline at end of file
+    updated_by = Column(Integer)
+
+    __table_args__ = (
+        # One row per user per timestamp (the Kafka consumer inserts with
+        # ON CONFLICT DO NOTHING); INCLUDE makes user/time-range reads index-only
+        Index(
+            'ix_eeg_records_user_id_timestamp', 'user_id', 'timestamp',
+            unique=True,
+            postgresql_include=['focus_label', 'stress_label', 'wellness_label'],
+        ),
+        # Daily range partitions (see app.services.eeg_partition_service)
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+
+# Rows outside the pre-created daily partitions land here instead of failing
+event.listen(
+    EEGRecord.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS eeg_records_default PARTITION OF eeg_records DEFAULT"),
+)
@@ -7,6 +7,7 @@ from sqlalchemy import (
     Float,
     Boolean,
 )  # Add Boolean here
+from sqlalchemy.dialects.postgresql import JSONB
 from app.database import Base
 
 
@@ -48,5 +49,7 @@ class Session(Base):
     focus = Column(Float, nullable=True)
     stress = Column(Float, nullable=True)
     wellness = Column(Float, nullable=True)
+    # Chart series computed when the session is tracked (see SessionService.get_session_chart)
+    chart = Column(JSONB, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, onupdate=datetime.now)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from app.database import get_db
 from app.services.eeg_aggregation_service import EEGAggregationService
+from app.services.goals_service import GoalsService
 from datetime import datetime, date
 from typing import Optional
 
@@ -19,6 +20,9 @@ class MonthlyAggregationRequest(BaseModel):
 class YearlyAggregationRequest(BaseModel):
     year: int = Field(..., description="Year (e.g., 2025)")
 
+class GoalReconcileRequest(BaseModel):
+    user_id: Optional[int] = Field(None, description="Only this user's goals (default: all users)")
+
 @router.post("/daily")
 async def trigger_daily_aggregation(
     request: DailyAggregationRequest,
@@ -98,6 +102,25 @@ async def trigger_yearly_aggregation(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/goals/reconcile")
+async def trigger_goal_reconciliation(
+    request: GoalReconcileRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Recompute goal progress from the source tables (also runs with daily aggregation)
+    Send data in request body: {"user_id": 42} or {} for all users
+    """
+    try:
+        changed = GoalsService(db).reconcile_progress(request.user_id)
+        return {
+            "message": "Goal progress reconciled",
+            "goals_changed": changed,
+            "status": "success"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/status")
 async def get_aggregation_status(db: Session = Depends(get_db)):
     """Get status of aggregation tables"""
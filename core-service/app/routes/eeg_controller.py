@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 import logging
 from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Query
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal
 from app.models.sessions import (
     Event,
     Session,
@@ -24,12 +24,19 @@ from app.schemas.sessions import (
     EventUpdate,
 )
 from app.services.eeg_service import EEGService
+from app.services.aggregate_cache import aggregate_cache
 from app.services.goals_service import GoalsService
+from app.services.goal_progress_service import apply_session_goal_progress
 from app.schemas.eeg import EEGBatchIn
 from app.models.eeg_record import EEGRecord
 from app.schemas.eeg import EEGRecordOut
 from app.schemas.recommendation import RecommendationsResponse
-from app.services.session_service import SessionService
+from app.services.session_service import (
+    SESSION_CHART_MAX_POINTS,
+    SESSION_CHART_POINTS,
+    SessionService,
+    chart_from_stored,
+)
 from app.models.sessions import Task
 from app.schemas.sessions import TaskCreate, TaskResponse, TaskUpdate
 from app.schemas.session_tracking import SessionTrackingRequest
@@ -116,7 +123,10 @@ def get_eeg_aggregated(
     user_id = int(current_user.get("sub"))
 
     service = EEGService(db)
-    result = service.get_aggregated_data(user_id, range)
+    now = datetime.now()
+    result = aggregate_cache.get_or_compute(
+        user_id, range, now, lambda: service.get_aggregated_data(user_id, range, now)
+    )
     return result
 
 
@@ -247,6 +257,7 @@ def create_session(
         created_at=now,
     )
     db.add(new_session)
+    apply_session_goal_progress(db, new_session)
     db.commit()
     db.refresh(new_session)
     return {"message": "Session created", "session_id": new_session.id}
@@ -531,6 +542,12 @@ from datetime import datetime, timezone
 @router.post("/sessions/track")
 def track_session(
     request: SessionTrackingRequest,
+    points: int = Query(SESSION_CHART_POINTS, ge=3, le=SESSION_CHART_MAX_POINTS, description="Chart points to return"),
+    method: Literal["mean", "minmax", "lttb"] = Query(
+        "mean",
+        description="Downsampling method for the chart; minmax returns each bucket's min and max "
+                    "labelled with the bucket's first and last timestamp (an even number of points)",
+    ),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user_payload),
 ):
@@ -599,172 +616,27 @@ def track_session(
                 f"Using calculated duration from timestamps: {total_duration_seconds} seconds"
             )
 
-        # 2) Collect EEG records from timestamps (normalize datetimes!)
-        all_eeg_records = []
-        for interval in session_data.timestamps:
-            start = to_utc_naive(interval.start)
-            end = to_utc_naive(interval.end)
-            if end is None:
-                continue
-
-            # Optional: quick log to verify the window used
-            print("Querying EEG between:", start.isoformat(), "and", end.isoformat())
-
-            records = (
-                db.query(EEGRecord)
-                .filter(
-                    and_(
-                        EEGRecord.user_id == user_id,
-                        EEGRecord.timestamp >= start,
-                        EEGRecord.timestamp <= end,
-                    )
-                )
-                .order_by(EEGRecord.timestamp.asc())
-                .all()
-            )
-            all_eeg_records.extend(records)
-
-        # 3) Aggregate EEG data by second and average labels
-        seconds_data: dict[datetime, dict] = {}
-        for rec in all_eeg_records:
-            key = rec.timestamp.replace(microsecond=0)
-            bucket = seconds_data.setdefault(
-                key,
-                {
-                    "focus_values": [],
-                    "stress_values": [],
-                    "wellness_values": [],
-                    "timestamp": key,
-                },
-            )
-            if rec.focus_label is not None:
-                bucket["focus_values"].append(rec.focus_label)
-            if rec.stress_label is not None:
-                bucket["stress_values"].append(rec.stress_label)
-            if rec.wellness_label is not None:
-                bucket["wellness_values"].append(rec.wellness_label)
-
-        # Helper function to aggregate data for frontend graphs
-        # If duration <= 10 seconds, return actual timestamps
-        # If duration > 10 seconds, aggregate into exactly 10 points
-        def aggregate_for_frontend_graph(seconds_data_dict):
-            if not seconds_data_dict:
-                return [], [], [], []
-
-            sorted_keys = sorted(seconds_data_dict.keys())
-            total_points = len(sorted_keys)
-
-            # If we have 10 or fewer points (e.g., 3, 5, 8, 10 seconds), return all actual timestamps
-            if total_points <= 10:
-                focus_data, stress_data, wellness_data, timestamps = [], [], [], []
-                for key in sorted_keys:
-                    info = seconds_data_dict[key]
-                    avg_f = (
-                        sum(info["focus_values"]) / len(info["focus_values"])
-                        if info["focus_values"]
-                        else 0
-                    )
-                    avg_s = (
-                        sum(info["stress_values"]) / len(info["stress_values"])
-                        if info["stress_values"]
-                        else 0
-                    )
-                    avg_w = (
-                        sum(info["wellness_values"]) / len(info["wellness_values"])
-                        if info["wellness_values"]
-                        else 0
-                    )
-                    focus_data.append(avg_f)
-                    stress_data.append(avg_s)
-                    wellness_data.append(avg_w)
-                    timestamps.append(key.strftime("%Y-%m-%dT%H:%M:%S"))
-                return focus_data, stress_data, wellness_data, timestamps
-
-            # For longer durations (e.g., 110 seconds, 1 hour), aggregate into exactly 10 buckets
-            focus_data, stress_data, wellness_data, timestamps = [], [], [], []
-            bucket_size = total_points / 10
-
-            for i in range(10):
-                start_idx = int(i * bucket_size)
-                end_idx = int((i + 1) * bucket_size) if i < 9 else total_points
-
-                bucket_focus_values = []
-                bucket_stress_values = []
-                bucket_wellness_values = []
-                bucket_timestamps = []
-
-                # Collect all values in this bucket
-                for idx in range(start_idx, end_idx):
-                    key = sorted_keys[idx]
-                    info = seconds_data_dict[key]
-
-                    if info["focus_values"]:
-                        bucket_focus_values.extend(info["focus_values"])
-                    if info["stress_values"]:
-                        bucket_stress_values.extend(info["stress_values"])
-                    if info["wellness_values"]:
-                        bucket_wellness_values.extend(info["wellness_values"])
-                    bucket_timestamps.append(key)
-
-                # Calculate averages for this bucket
-                avg_focus = (
-                    sum(bucket_focus_values) / len(bucket_focus_values)
-                    if bucket_focus_values
-                    else 0
-                )
-                avg_stress = (
-                    sum(bucket_stress_values) / len(bucket_stress_values)
-                    if bucket_stress_values
-                    else 0
-                )
-                avg_wellness = (
-                    sum(bucket_wellness_values) / len(bucket_wellness_values)
-                    if bucket_wellness_values
-                    else 0
-                )
-
-                # Use the middle timestamp of the bucket as representative timestamp
-                middle_timestamp = (
-                    bucket_timestamps[len(bucket_timestamps) // 2]
-                    if bucket_timestamps
-                    else sorted_keys[start_idx]
-                )
-
-                focus_data.append(avg_focus)
-                stress_data.append(avg_stress)
-                wellness_data.append(avg_wellness)
-                timestamps.append(middle_timestamp.strftime("%Y-%m-%dT%H:%M:%S"))
-
-            return focus_data, stress_data, wellness_data, timestamps
-
-        # Get aggregated data for frontend graphing
+        # 2) Chart points and averages for every interval in one query (normalize datetimes!)
+        # If the session has <= points seconds of data, each second is a point;
+        # otherwise the seconds are downsampled to `points` points
+        intervals = [
+            (to_utc_naive(interval.start), to_utc_naive(interval.end))
+            for interval in session_data.timestamps
+            if interval.end is not None
+        ]
+        chart = SessionService(db).get_session_chart(user_id, intervals, points, method)
+
         all_focus, all_stress, all_wellness, all_timestamps = (
-            aggregate_for_frontend_graph(seconds_data)
+            chart["focus_data"], chart["stress_data"], chart["wellness_data"], chart["timestamps"]
         )
 
         # Determine if data was aggregated or returned as-is
-        was_aggregated = len(seconds_data) > 10
-
-        # Calculate overall averages from all raw data (not just the 10 points)
-        all_focus_raw, all_stress_raw, all_wellness_raw = [], [], []
-        for key in sorted(seconds_data.keys()):
-            info = seconds_data[key]
-            if info["focus_values"]:
-                all_focus_raw.extend(info["focus_values"])
-            if info["stress_values"]:
-                all_stress_raw.extend(info["stress_values"])
-            if info["wellness_values"]:
-                all_wellness_raw.extend(info["wellness_values"])
-
-        overall_avg_focus = (
-            sum(all_focus_raw) / len(all_focus_raw) if all_focus_raw else 0
-        )
-        overall_avg_stress = (
-            sum(all_stress_raw) / len(all_stress_raw) if all_stress_raw else 0
-        )
-        overall_avg_wellness = (
-            sum(all_wellness_raw) / len(all_wellness_raw) if all_wellness_raw else 0
-        )
+        was_aggregated = chart["seconds"] > points
+
+        # Overall averages come from all raw data (not just the chart points)
+        overall_avg_focus = chart["avg_focus"]
+        overall_avg_stress = chart["avg_stress"]
+        overall_avg_wellness = chart["avg_wellness"]
 
         # 4) Compute hours, minutes, seconds from total duration
         duration_seconds = int(total_duration_seconds)
@@ -782,10 +654,12 @@ def track_session(
             focus=overall_avg_focus,
             stress=overall_avg_stress,
             wellness=overall_avg_wellness,
+            chart=chart["stored"],
             created_at=now,
             updated_at=now,
         )
         db.add(new_session)
+        apply_session_goal_progress(db, new_session)
         db.commit()
         db.refresh(new_session)
 
@@ -803,7 +677,7 @@ def track_session(
             "avg_focus": overall_avg_focus,
             "avg_stress": overall_avg_stress,
             "avg_wellness": overall_avg_wellness,
-            "eeg_records_count": len(all_eeg_records),  # raw rows matched
+            "eeg_records_count": chart["records"],  # raw rows matched
             "aggregated_data_points": len(all_focus),  # number of points returned
             "was_aggregated": was_aggregated,  # true if data was averaged, false if actual timestamps returned
             "focus_data": all_focus,
@@ -820,6 +694,12 @@ def track_session(
 @router.get("/sessions/{session_id}/details")
 def get_session_details(
     session_id: int,
+    points: int = Query(SESSION_CHART_POINTS, ge=3, le=SESSION_CHART_MAX_POINTS, description="Chart points to return"),
+    method: Literal["mean", "minmax", "lttb"] = Query(
+        "mean",
+        description="Downsampling method for the chart; minmax returns each bucket's min and max "
+                    "labelled with the bucket's first and last timestamp (an even number of points)",
+    ),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user_payload),
 ):
@@ -838,111 +718,24 @@ def get_session_details(
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Get EEG records for the session time period
-    # We'll get records from session start time to end time
-    session_start = session.date
-    session_end = datetime.combine(
-        session.date.date(), session.date.time()
-    ) + timedelta(minutes=session.duration)
+    if session.chart is not None:
+        # Series stored when the session was tracked: one row read, survives raw-data retention
+        chart = chart_from_stored(session.chart, points, method)
+        was_aggregated = chart["seconds"] > points
+    else:
+        # Sessions tracked before charts were stored: rebuild from the raw records
+        # for the session time period (while they are still retained)
+        session_start = session.date
+        session_end = datetime.combine(
+            session.date.date(), session.date.time()
+        ) + timedelta(minutes=session.duration)
+        chart = SessionService(db).get_records_chart(user_id, session_start, session_end, points, method)
+        was_aggregated = chart["records"] > points
 
-    eeg_records = (
-        db.query(EEGRecord)
-        .filter(
-            and_(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= session_start,
-                EEGRecord.timestamp <= session_end,
-            )
-        )
-        .order_by(EEGRecord.timestamp.asc())
-        .all()
-    )
-
-    # Helper function to aggregate EEG data for frontend graphs
-    # If records <= 10, return actual timestamps
-    # If records > 10, aggregate into exactly 10 points
-    def aggregate_eeg_for_frontend_graph(eeg_records_list):
-        if not eeg_records_list:
-            return [], [], [], []
-
-        total_records = len(eeg_records_list)
-
-        # If we have 10 or fewer records (short duration), return all actual timestamps
-        if total_records <= 10:
-            focus_data, stress_data, wellness_data, timestamps = [], [], [], []
-            for record in eeg_records_list:
-                if record.focus_label is not None:
-                    focus_data.append(record.focus_label)
-                if record.stress_label is not None:
-                    stress_data.append(record.stress_label)
-                if record.wellness_label is not None:
-                    wellness_data.append(record.wellness_label)
-                timestamps.append(record.timestamp.isoformat())
-            return focus_data, stress_data, wellness_data, timestamps
-
-        # For longer sessions, aggregate into exactly 10 buckets
-        focus_data, stress_data, wellness_data, timestamps = [], [], [], []
-        bucket_size = total_records / 10
-
-        for i in range(10):
-            start_idx = int(i * bucket_size)
-            end_idx = int((i + 1) * bucket_size) if i < 9 else total_records
-
-            bucket_focus_values = []
-            bucket_stress_values = []
-            bucket_wellness_values = []
-            bucket_timestamps = []
-
-            # Collect all values in this bucket
-            for idx in range(start_idx, end_idx):
-                record = eeg_records_list[idx]
-                if record.focus_label is not None:
-                    bucket_focus_values.append(record.focus_label)
-                if record.stress_label is not None:
-                    bucket_stress_values.append(record.stress_label)
-                if record.wellness_label is not None:
-                    bucket_wellness_values.append(record.wellness_label)
-                bucket_timestamps.append(record.timestamp)
-
-            # Calculate averages for this bucket
-            avg_focus = (
-                sum(bucket_focus_values) / len(bucket_focus_values)
-                if bucket_focus_values
-                else 0
-            )
-            avg_stress = (
-                sum(bucket_stress_values) / len(bucket_stress_values)
-                if bucket_stress_values
-                else 0
-            )
-            avg_wellness = (
-                sum(bucket_wellness_values) / len(bucket_wellness_values)
-                if bucket_wellness_values
-                else 0
-            )
-
-            # Use the middle timestamp of the bucket as representative timestamp
-            middle_timestamp = (
-                bucket_timestamps[len(bucket_timestamps) // 2]
-                if bucket_timestamps
-                else eeg_records_list[start_idx].timestamp
-            )
-
-            focus_data.append(avg_focus)
-            stress_data.append(avg_stress)
-            wellness_data.append(avg_wellness)
-            timestamps.append(middle_timestamp.isoformat())
-
-        return focus_data, stress_data, wellness_data, timestamps
-
-    # Get aggregated EEG data for frontend plotting
     focus_data, stress_data, wellness_data, timestamps = (
-        aggregate_eeg_for_frontend_graph(eeg_records)
+        chart["focus_data"], chart["stress_data"], chart["wellness_data"], chart["timestamps"]
     )
 
-    # Determine if data was aggregated or returned as-is
-    was_aggregated = len(eeg_records) > 10
-
     return {
         "session_id": session.id,
         "label": session.label,
@@ -954,7 +747,7 @@ def get_session_details(
         "stress_data": stress_data,
         "wellness_data": wellness_data,
         "timestamps": timestamps,
-        "eeg_records_count": len(eeg_records),
+        "eeg_records_count": chart["records"],
         "aggregated_data_points": len(focus_data),  # number of points returned
         "was_aggregated": was_aggregated,  # true if data was averaged, false if actual timestamps returned
     }
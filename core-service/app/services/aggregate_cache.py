@@ -0,0 +1,146 @@
+"""
+Read-through cache for /eeg/aggregate chart responses.
+
+Entries are keyed by (user_id, range, bucket epoch), where the epoch is the
+start of the period the chart covers (today, this week, this month, ...).
+Each user also has a generation number that the Kafka consumer bumps when it
+stores new records for them; the generation is part of the key, so bumping
+it invalidates every cached chart for that user at once.
+
+Layers: an in-process LRU, plus Redis when REDIS_URL is set and the redis
+package is installed, so entries and invalidations are shared between
+workers. Entries also expire after EEG_AGGREGATE_CACHE_TTL seconds, since
+nightly aggregation (not only ingest) can change a chart.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # Redis is optional; the in-process LRU works on its own
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+EEG_AGGREGATE_CACHE_SIZE = int(os.getenv("EEG_AGGREGATE_CACHE_SIZE", "10000"))
+EEG_AGGREGATE_CACHE_TTL = int(os.getenv("EEG_AGGREGATE_CACHE_TTL", "300"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+def range_bucket(range: str, now: datetime) -> Optional[datetime]:
+    """
+    Return the start of the period a chart range covers at `now`, or None
+    for ranges that are not cached.
+    """
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if range in ("hourly", "daily"):
+        return day
+    if range == "weekly":
+        return day - timedelta(days=day.weekday())
+    if range == "monthly":
+        return day.replace(day=1)
+    if range == "yearly":
+        return day.replace(month=1, day=1)
+    if range == "quarterly":
+        return day.replace(day=1) - timedelta(days=90)
+    return None
+
+
+class AggregateCache:
+    def __init__(self, maxsize: int = EEG_AGGREGATE_CACHE_SIZE, ttl: int = EEG_AGGREGATE_CACHE_TTL,
+                 redis_url: Optional[str] = REDIS_URL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = Lock()
+        self._redis = redis.Redis.from_url(redis_url) if (redis is not None and redis_url) else None
+
+    @staticmethod
+    def _generation_key(user_id: int) -> str:
+        return f"eeg:agg:gen:{user_id}"
+
+    @staticmethod
+    def _value_key(key: tuple) -> str:
+        return "eeg:agg:{}:{}:{}:{}".format(*key)
+
+    def _generation(self, user_id: int) -> int:
+        if self._redis is not None:
+            return int(self._redis.get(self._generation_key(user_id)) or 0)
+        return self._generations.get(user_id, 0)
+
+    def _get_local(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key: tuple, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, user_id: int, range: str, now: datetime, compute: Callable[[], Any]):
+        """Return the cached chart for (user, range, current bucket), computing it on a miss."""
+        start = range_bucket(range, now)
+        if start is None:
+            return compute()
+
+        try:
+            key = (user_id, self._generation(user_id), range, int(start.timestamp()))
+        except Exception as e:
+            logger.warning(f"⚠️ Aggregate cache unavailable, computing directly: {e}")
+            return compute()
+
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(self._value_key(key))
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._set_local(key, value)
+                    return value
+            except Exception as e:
+                logger.warning(f"⚠️ Aggregate cache read failed: {e}")
+
+        value = compute()
+        self._set_local(key, value)
+        if self._redis is not None:
+            try:
+                self._redis.set(self._value_key(key), json.dumps(value, default=str), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Aggregate cache write failed: {e}")
+        return value
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop every cached chart for a user (new records were stored)."""
+        if self._redis is not None:
+            try:
+                self._redis.incr(self._generation_key(user_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Aggregate cache invalidation failed for user {user_id}: {e}")
+        # Old-generation entries are never looked up again and age out of the LRU
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+aggregate_cache = AggregateCache()
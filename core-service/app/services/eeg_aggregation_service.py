@@ -1,12 +1,28 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, text
+from sqlalchemy import func, and_, text, cast, Date, Numeric, literal
+from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime, timedelta, date
 from app.models.eeg_record import EEGRecord
 from app.models.eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord, EEGRecordsBackup
+from app.services.eeg_partition_service import ensure_eeg_record_partitions, drop_eeg_record_partition
+from app.services.eeg_rollup_service import prune_minute_rollups
+from app.services.aggregate_cache import aggregate_cache
+from app.services.goals_service import GoalsService
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _avg2(column):
+    """round(avg(column), 2) computed in SQL."""
+    return func.round(cast(func.avg(column), Numeric), 2)
+
+
+def _on_day(target_date: date):
+    """Range filter for one day of EEGRecord rows (lets Postgres prune to that day's partition)."""
+    day_start = datetime.combine(target_date, datetime.min.time())
+    return and_(EEGRecord.timestamp >= day_start, EEGRecord.timestamp < day_start + timedelta(days=1))
+
 class EEGAggregationService:
     def __init__(self, db: Session):
         self.db = db
@@ -19,9 +35,13 @@ class EEGAggregationService:
         logger.info(f"Starting daily aggregation for date: {target_date}")
         
         try:
+            # Keep daily partitions created ahead of incoming data
+            ensure_eeg_record_partitions(self.db)
+            prune_minute_rollups(self.db)
+
             # Check if we have data for the target date
             data_count = self.db.query(EEGRecord).filter(
-                func.date(EEGRecord.timestamp) == target_date
+                _on_day(target_date)
             ).count()
             
             logger.info(f"Found {data_count} records for {target_date}")
@@ -30,7 +50,7 @@ class EEGAggregationService:
             if data_count == 0 and use_fallback:
                 today = datetime.now().date()
                 today_count = self.db.query(EEGRecord).filter(
-                    func.date(EEGRecord.timestamp) == today
+                    _on_day(today)
                 ).count()
                 
                 if today_count > 0:
@@ -44,18 +64,20 @@ class EEGAggregationService:
                 logger.warning(f"No EEG data found for {target_date}")
                 return
             
-            # Get all users who have EEG records for the target date
-            users_with_data = self.db.query(EEGRecord.user_id).filter(
-                func.date(EEGRecord.timestamp) == target_date
-            ).distinct().all()
-
-            aggregated_users = 0
-            for user_tuple in users_with_data:
-                user_id = user_tuple[0]
-                await self._aggregate_daily_for_user(user_id, target_date)
-                aggregated_users += 1
+            # One INSERT ... SELECT ... GROUP BY user_id for every user
+            aggregated = await self._aggregate_daily(target_date)
+            for user_id in aggregated:
+                aggregate_cache.invalidate(user_id)
+            aggregated_users = len(aggregated)
             
             logger.info(f"Aggregated data for {aggregated_users} users on {target_date}")
+
+            # Correct incremental goal progress while the day's raw records still exist
+            try:
+                GoalsService(self.db).reconcile_progress()
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"Goal progress reconciliation failed: {str(e)}")
             
             # Only backup and clean if we're processing older data (not today)
             if target_date < datetime.now().date():
@@ -71,96 +93,66 @@ class EEGAggregationService:
             self.db.rollback()
             raise
 
-    async def _aggregate_daily_for_user(self, user_id: int, target_date: date):
-        """Aggregate daily data for a specific user"""
-        # Calculate averages for the day
-        daily_stats = self.db.query(
-            func.avg(EEGRecord.focus_label).label('avg_focus'),
-            func.avg(EEGRecord.stress_label).label('avg_stress'),
-            func.avg(EEGRecord.wellness_label).label('avg_wellness'),
-            func.count(EEGRecord.id).label('record_count')
-        ).filter(
-            and_(
-                EEGRecord.user_id == user_id,
-                func.date(EEGRecord.timestamp) == target_date
+    async def _aggregate_daily(self, target_date: date):
+        """Upsert the day's averages for every user in one statement. Returns the user ids aggregated."""
+        averages = (
+            self.db.query(
+                EEGRecord.user_id,
+                literal(target_date).label('date'),
+                _avg2(EEGRecord.focus_label),
+                _avg2(EEGRecord.stress_label),
+                _avg2(EEGRecord.wellness_label)
             )
-        ).first()
-
-        if daily_stats and daily_stats.avg_focus is not None:
-            # Check if record already exists
-            existing_record = self.db.query(DailyEEGRecord).filter(
-                and_(
-                    DailyEEGRecord.user_id == user_id,
-                    DailyEEGRecord.date == target_date
-                )
-            ).first()
-
-            focus_val = round(daily_stats.avg_focus, 2)
-            stress_val = round(daily_stats.avg_stress, 2)
-            wellness_val = round(daily_stats.avg_wellness, 2)
-
-            if existing_record:
-                # Update existing record
-                existing_record.focus = focus_val
-                existing_record.stress = stress_val
-                existing_record.wellness = wellness_val
-                logger.info(f"Updated daily record for user {user_id} on {target_date}: F={focus_val}, S={stress_val}, W={wellness_val} (from {daily_stats.record_count} records)")
-            else:
-                # Create new record
-                daily_record = DailyEEGRecord(
-                    user_id=user_id,
-                    date=target_date,
-                    focus=focus_val,
-                    stress=stress_val,
-                    wellness=wellness_val
-                )
-                self.db.add(daily_record)
-                logger.info(f"Created daily record for user {user_id} on {target_date}: F={focus_val}, S={stress_val}, W={wellness_val} (from {daily_stats.record_count} records)")
-
-            self.db.commit()
-        else:
-            logger.warning(f"No valid data found for user {user_id} on {target_date}")
+            .filter(_on_day(target_date), EEGRecord.focus_label.isnot(None))
+            .group_by(EEGRecord.user_id)
+        )
+        stmt = insert(DailyEEGRecord).from_select(
+            ['user_id', 'date', 'focus', 'stress', 'wellness'], averages
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_daily_user_date',
+            set_={
+                'focus': stmt.excluded.focus,
+                'stress': stmt.excluded.stress,
+                'wellness': stmt.excluded.wellness,
+            }
+        ).returning(DailyEEGRecord.user_id)
+
+        user_ids = [row.user_id for row in self.db.execute(stmt)]
+        self.db.commit()
+        logger.info(f"Upserted daily records for {len(user_ids)} users on {target_date}")
+        return user_ids
 
     async def _backup_and_clean_eeg_records(self, target_date: date):
-        """Move EEG records to backup table and delete from main table"""
+        """Copy the day's EEG records to the backup table, then drop them from the main table"""
         try:
-            # Get records to backup
-            records_to_backup = self.db.query(EEGRecord).filter(
-                func.date(EEGRecord.timestamp) == target_date
-            ).all()
-            
-            if not records_to_backup:
+            # Copied inside Postgres with one INSERT ... SELECT; no rows pass through Python
+            copy = insert(EEGRecordsBackup).from_select(
+                ['original_id', 'user_id', 'timestamp', 'focus_label', 'stress_label', 'wellness_label', 'backup_date'],
+                self.db.query(
+                    EEGRecord.id,
+                    EEGRecord.user_id,
+                    cast(EEGRecord.timestamp, Date),
+                    EEGRecord.focus_label,
+                    EEGRecord.stress_label,
+                    EEGRecord.wellness_label,
+                    literal(datetime.now().date())
+                ).filter(_on_day(target_date))
+            )
+            backup_count = self.db.execute(copy).rowcount
+
+            if not backup_count:
+                self.db.rollback()
                 logger.info(f"No records to backup for {target_date}")
                 return
 
-            logger.info(f"Backing up {len(records_to_backup)} records for {target_date}")
-
-            # Create backup records
-            backup_count = 0
-            for record in records_to_backup:
-                backup_record = EEGRecordsBackup(
-                    original_id=record.id,
-                    user_id=record.user_id,
-                    timestamp=record.timestamp.date(),
-                    focus_label=record.focus_label,
-                    stress_label=record.stress_label,
-                    wellness_label=record.wellness_label,
-                    backup_date=datetime.now().date()
-                )
-                self.db.add(backup_record)
-                backup_count += 1
-
             # Commit backup records first
             self.db.commit()
             logger.info(f"✅ Created {backup_count} backup records")
 
-            # Delete from main table
-            deleted_count = self.db.query(EEGRecord).filter(
-                func.date(EEGRecord.timestamp) == target_date
-            ).delete(synchronize_session=False)
-
-            self.db.commit()
-            logger.info(f"🗑️ Deleted {deleted_count} records from main table for {target_date}")
+            # Drop the day's partition instead of deleting row by row
+            drop_eeg_record_partition(self.db, target_date)
+            logger.info(f"🗑️ Dropped {backup_count} records from main table for {target_date}")
             
         except Exception as e:
             logger.error(f"Error in backup_and_clean for {target_date}: {str(e)}")
@@ -191,22 +183,8 @@ class EEGAggregationService:
                 logger.warning(f"No daily records found for {year}-{month:02d}")
                 return
 
-            # Get all users who have daily records for the target month
-            users_with_data = self.db.query(DailyEEGRecord.user_id).filter(
-                and_(
-                    func.extract('year', DailyEEGRecord.date) == year,
-                    func.extract('month', DailyEEGRecord.date) == month
-                )
-            ).distinct().all()
-
-            logger.info(f"Processing {len(users_with_data)} users for {year}-{month:02d}")
-
-            aggregated_users = 0
-            for user_tuple in users_with_data:
-                user_id = user_tuple[0]
-                await self._aggregate_monthly_for_user(user_id, year, month)
-                aggregated_users += 1
-
+            # One INSERT ... SELECT ... GROUP BY user_id for every user
+            aggregated_users = await self._aggregate_monthly(year, month)
             logger.info(f"Aggregated monthly data for {aggregated_users} users")
 
             # Clean up daily records for this month after successful aggregation
@@ -219,64 +197,37 @@ class EEGAggregationService:
             self.db.rollback()
             raise
 
-    async def _aggregate_monthly_for_user(self, user_id: int, year: int, month: int):
-        """Aggregate monthly data for a specific user"""
-        try:
-            # Calculate averages for the month
-            monthly_stats = self.db.query(
-                func.avg(DailyEEGRecord.focus).label('avg_focus'),
-                func.avg(DailyEEGRecord.stress).label('avg_stress'),
-                func.avg(DailyEEGRecord.wellness).label('avg_wellness'),
-                func.count(DailyEEGRecord.id).label('daily_count')
-            ).filter(
-                and_(
-                    DailyEEGRecord.user_id == user_id,
-                    func.extract('year', DailyEEGRecord.date) == year,
-                    func.extract('month', DailyEEGRecord.date) == month
-                )
-            ).first()
-
-            if monthly_stats and monthly_stats.avg_focus is not None:
-                # Check if record already exists
-                existing_record = self.db.query(MonthlyEEGRecord).filter(
-                    and_(
-                        MonthlyEEGRecord.user_id == user_id,
-                        MonthlyEEGRecord.year == year,
-                        MonthlyEEGRecord.month == month
-                    )
-                ).first()
-
-                focus_val = round(monthly_stats.avg_focus, 2)
-                stress_val = round(monthly_stats.avg_stress, 2)
-                wellness_val = round(monthly_stats.avg_wellness, 2)
-
-                if existing_record:
-                    # Update existing record
-                    existing_record.focus = focus_val
-                    existing_record.stress = stress_val
-                    existing_record.wellness = wellness_val
-                    logger.info(f"Updated monthly record for user {user_id} for {year}-{month:02d}: F={focus_val}, S={stress_val}, W={wellness_val} (from {monthly_stats.daily_count} daily records)")
-                else:
-                    # Create new record
-                    monthly_record = MonthlyEEGRecord(
-                        user_id=user_id,
-                        year=year,
-                        month=month,
-                        focus=focus_val,
-                        stress=stress_val,
-                        wellness=wellness_val
-                    )
-                    self.db.add(monthly_record)
-                    logger.info(f"Created monthly record for user {user_id} for {year}-{month:02d}: F={focus_val}, S={stress_val}, W={wellness_val} (from {monthly_stats.daily_count} daily records)")
-
-                self.db.commit()
-            else:
-                logger.warning(f"No valid monthly data found for user {user_id} for {year}-{month:02d}")
-
-        except Exception as e:
-            logger.error(f"Error aggregating monthly data for user {user_id} for {year}-{month:02d}: {str(e)}")
-            self.db.rollback()
-            raise
+    async def _aggregate_monthly(self, year: int, month: int) -> int:
+        """Upsert the month's averages for every user in one statement. Returns the number of users."""
+        month_start = date(year, month, 1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        averages = (
+            self.db.query(
+                DailyEEGRecord.user_id,
+                literal(year).label('year'),
+                literal(month).label('month'),
+                _avg2(DailyEEGRecord.focus),
+                _avg2(DailyEEGRecord.stress),
+                _avg2(DailyEEGRecord.wellness)
+            )
+            .filter(DailyEEGRecord.date >= month_start, DailyEEGRecord.date < next_month)
+            .group_by(DailyEEGRecord.user_id)
+        )
+        stmt = insert(MonthlyEEGRecord).from_select(
+            ['user_id', 'year', 'month', 'focus', 'stress', 'wellness'], averages
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_monthly_user_year_month',
+            set_={
+                'focus': stmt.excluded.focus,
+                'stress': stmt.excluded.stress,
+                'wellness': stmt.excluded.wellness,
+            }
+        )
+
+        result = self.db.execute(stmt)
+        self.db.commit()
+        return result.rowcount
 
     async def _cleanup_daily_records(self, year: int, month: int):
         """Delete daily records for the specified month after monthly aggregation"""
@@ -319,14 +270,9 @@ class EEGAggregationService:
             year = datetime.now().year - 1
 
         try:
-            # Get all users who have monthly records for the target year
-            users_with_data = self.db.query(MonthlyEEGRecord.user_id).filter(
-                MonthlyEEGRecord.year == year
-            ).distinct().all()
-
-            for user_tuple in users_with_data:
-                user_id = user_tuple[0]
-                await self._aggregate_yearly_for_user(user_id, year)
+            # One INSERT ... SELECT ... GROUP BY user_id for every user
+            aggregated_users = await self._aggregate_yearly(year)
+            logger.info(f"Aggregated yearly data for {aggregated_users} users")
 
             logger.info(f"Yearly aggregation completed for {year}")
 
@@ -335,43 +281,31 @@ class EEGAggregationService:
             self.db.rollback()
             raise
 
-    async def _aggregate_yearly_for_user(self, user_id: int, year: int):
-        """Aggregate yearly data for a specific user"""
-        # Calculate averages for the year
-        yearly_stats = self.db.query(
-            func.avg(MonthlyEEGRecord.focus).label('avg_focus'),
-            func.avg(MonthlyEEGRecord.stress).label('avg_stress'),
-            func.avg(MonthlyEEGRecord.wellness).label('avg_wellness')
-        ).filter(
-            and_(
-                MonthlyEEGRecord.user_id == user_id,
-                MonthlyEEGRecord.year == year
+    async def _aggregate_yearly(self, year: int) -> int:
+        """Upsert the year's averages for every user in one statement. Returns the number of users."""
+        averages = (
+            self.db.query(
+                MonthlyEEGRecord.user_id,
+                literal(year).label('year'),
+                _avg2(MonthlyEEGRecord.focus),
+                _avg2(MonthlyEEGRecord.stress),
+                _avg2(MonthlyEEGRecord.wellness)
             )
-        ).first()
-
-        if yearly_stats and yearly_stats.avg_focus is not None:
-            # Check if record already exists
-            existing_record = self.db.query(YearlyEEGRecord).filter(
-                and_(
-                    YearlyEEGRecord.user_id == user_id,
-                    YearlyEEGRecord.year == year
-                )
-            ).first()
-
-            if existing_record:
-                # Update existing record
-                existing_record.focus = round(yearly_stats.avg_focus, 2)
-                existing_record.stress = round(yearly_stats.avg_stress, 2)
-                existing_record.wellness = round(yearly_stats.avg_wellness, 2)
-            else:
-                # Create new record
-                yearly_record = YearlyEEGRecord(
-                    user_id=user_id,
-                    year=year,
-                    focus=round(yearly_stats.avg_focus, 2),
-                    stress=round(yearly_stats.avg_stress, 2),
-                    wellness=round(yearly_stats.avg_wellness, 2)
-                )
-                self.db.add(yearly_record)
-
-            self.db.commit()
+            .filter(MonthlyEEGRecord.year == year)
+            .group_by(MonthlyEEGRecord.user_id)
+        )
+        stmt = insert(YearlyEEGRecord).from_select(
+            ['user_id', 'year', 'focus', 'stress', 'wellness'], averages
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_yearly_user_year',
+            set_={
+                'focus': stmt.excluded.focus,
+                'stress': stmt.excluded.stress,
+                'wellness': stmt.excluded.wellness,
+            }
+        )
+
+        result = self.db.execute(stmt)
+        self.db.commit()
+        return result.rowcount
@@ -0,0 +1,49 @@
+"""
+Storage of processed EEG records.
+
+The single write path for eeg_records, shared by the Kafka consumer and the
+HTTP upload endpoint (EEGService.process_and_label_records): inserts are
+idempotent, and the rollups, goal progress and chart cache follow every
+inserted batch.
+"""
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.eeg_record import EEGRecord
+from app.services.aggregate_cache import aggregate_cache
+from app.services.eeg_rollup_service import apply_eeg_rollups
+from app.services.goal_progress_service import apply_eeg_goal_progress
+
+
+def save_eeg_rows(rows: list) -> None:
+    """
+    Insert eeg_records rows in one transaction.
+
+    Uses a multi-row INSERT ... ON CONFLICT (user_id, timestamp) DO NOTHING,
+    so replaying a Kafka message never creates duplicate rows. The rows that
+    were actually inserted are folded into the minute/hour rollups and the
+    users' goal progress in the same transaction.
+    """
+    table = EEGRecord.__table__
+    stmt = (
+        insert(table)
+        .on_conflict_do_nothing(index_elements=["user_id", "timestamp"])
+        .returning(table.c.user_id, table.c.timestamp, table.c.focus_label, table.c.stress_label, table.c.wellness_label)
+    )
+    db: Session = SessionLocal()
+    try:
+        inserted = db.execute(stmt, rows).all()
+        apply_eeg_rollups(db, inserted)
+        apply_eeg_goal_progress(db, inserted)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    # Charts for these users are stale now
+    for user_id in {row.user_id for row in inserted}:
+        aggregate_cache.invalidate(user_id)
@@ -0,0 +1,81 @@
+"""
+Daily range partitions for eeg_records.
+
+eeg_records is partitioned by RANGE (timestamp) with one partition per UTC
+day (eeg_records_pYYYYMMDD) plus eeg_records_default for anything outside the
+pre-created range. Partitions are created ahead of time at startup and by the
+daily aggregation, and retention drops a whole day's partition instead of
+running a DELETE over the table.
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+EEG_PARTITION_DAYS_AHEAD = int(os.getenv("EEG_PARTITION_DAYS_AHEAD", "14"))
+
+
+def partition_name(day: date) -> str:
+    return f"eeg_records_p{day:%Y%m%d}"
+
+
+def ensure_eeg_record_partitions(db: Session, start: Optional[date] = None, days_ahead: int = EEG_PARTITION_DAYS_AHEAD) -> int:
+    """
+    Create daily partitions from start (default: today, UTC) through days_ahead days later.
+
+    Returns the number of partitions that were missing and have been created.
+    """
+    start = start or datetime.utcnow().date()
+    created = 0
+    for offset in range(days_ahead + 1):
+        day = start + timedelta(days=offset)
+        name = partition_name(day)
+        exists = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists:
+            continue
+        try:
+            db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF eeg_records "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            db.commit()
+            created += 1
+        except Exception as e:
+            # Typically: rows for this day already sit in eeg_records_default
+            db.rollback()
+            logger.warning(f"⚠️ Could not create partition {name}: {e}")
+    if created:
+        logger.info(f"🗂️ Created {created} eeg_records partitions from {start}")
+    return created
+
+
+def drop_eeg_record_partition(db: Session, day: date) -> bool:
+    """
+    Remove all eeg_records rows for a UTC day.
+
+    Detaches and drops the day's partition; rows for that day that ended up
+    in the default partition are deleted. Returns True if a partition was dropped.
+    """
+    name = partition_name(day)
+    day_start = datetime.combine(day, datetime.min.time())
+    params = {"start": day_start, "end": day_start + timedelta(days=1)}
+    try:
+        exists = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists:
+            db.execute(text(f"ALTER TABLE eeg_records DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+        db.execute(
+            text("DELETE FROM eeg_records_default WHERE timestamp >= :start AND timestamp < :end"),
+            params,
+        )
+        db.commit()
+        return bool(exists)
+    except Exception:
+        db.rollback()
+        raise
@@ -0,0 +1,89 @@
+"""
+Incremental minute/hour rollups of eeg_records.
+
+The Kafka consumer folds every newly inserted batch of EEG records into
+eeg_minute_rollups and eeg_hour_rollups in the same transaction, so dashboard
+queries read one row per bucket instead of scanning raw samples. Rollups keep
+sum/count/min/max per metric; averages are sum / sample_count.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.eeg_aggregates import EEGMinuteRollup, EEGHourRollup
+
+logger = logging.getLogger(__name__)
+
+# Minute buckets are only needed for recent, fine-grained views
+EEG_MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv("EEG_MINUTE_ROLLUP_RETENTION_DAYS", "7"))
+
+METRICS = ("focus", "stress", "wellness")
+
+
+def _bucket_rows(records: Iterable, truncate) -> List[Dict]:
+    """Collapse (user_id, timestamp, focus, stress, wellness) tuples into one row per (user, bucket)."""
+    buckets: Dict[Tuple[int, datetime], Dict] = {}
+    for user_id, timestamp, *values in records:
+        key = (user_id, truncate(timestamp))
+        row = buckets.get(key)
+        if row is None:
+            row = {"user_id": key[0], "bucket": key[1], "sample_count": 0}
+            for metric, value in zip(METRICS, values):
+                row[f"{metric}_sum"] = 0.0
+                row[f"{metric}_min"] = value
+                row[f"{metric}_max"] = value
+            buckets[key] = row
+        row["sample_count"] += 1
+        for metric, value in zip(METRICS, values):
+            row[f"{metric}_sum"] += value
+            row[f"{metric}_min"] = min(row[f"{metric}_min"], value)
+            row[f"{metric}_max"] = max(row[f"{metric}_max"], value)
+    return list(buckets.values())
+
+
+def _upsert(db: Session, model, rows: List[Dict]) -> None:
+    """Add bucket totals to existing rollup rows (or create them)."""
+    if not rows:
+        return
+    stmt = insert(model.__table__)
+    table = model.__table__.c
+    update = {"sample_count": table.sample_count + stmt.excluded.sample_count}
+    for metric in METRICS:
+        update[f"{metric}_sum"] = table[f"{metric}_sum"] + stmt.excluded[f"{metric}_sum"]
+        update[f"{metric}_min"] = func.least(table[f"{metric}_min"], stmt.excluded[f"{metric}_min"])
+        update[f"{metric}_max"] = func.greatest(table[f"{metric}_max"], stmt.excluded[f"{metric}_max"])
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=["user_id", "bucket"], set_=update),
+        # Stable order so concurrent consumers lock rows in the same sequence
+        sorted(rows, key=lambda r: (r["user_id"], r["bucket"])),
+    )
+
+
+def apply_eeg_rollups(db: Session, records: Iterable) -> None:
+    """
+    Fold newly inserted records into the minute and hour rollups.
+
+    records: (user_id, timestamp, focus_label, stress_label, wellness_label)
+    tuples for rows that were actually inserted (not ON CONFLICT skips), so
+    replayed messages are not counted twice. The caller commits.
+    """
+    records = list(records)
+    if not records:
+        return
+    _upsert(db, EEGMinuteRollup, _bucket_rows(records, lambda ts: ts.replace(second=0, microsecond=0)))
+    _upsert(db, EEGHourRollup, _bucket_rows(records, lambda ts: ts.replace(minute=0, second=0, microsecond=0)))
+
+
+def prune_minute_rollups(db: Session, retention_days: int = EEG_MINUTE_ROLLUP_RETENTION_DAYS) -> int:
+    """Delete minute buckets older than the retention window. Returns the number removed."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = db.query(EEGMinuteRollup).filter(EEGMinuteRollup.bucket < cutoff).delete(synchronize_session=False)
+    db.commit()
+    logger.info(f"🗑️ Pruned {deleted} minute rollups older than {cutoff}")
+    return deleted
@@ -6,8 +6,9 @@ import tempfile
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
 from app.models.eeg_record import EEGRecord
-from app.models.eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord
+from app.models.eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord, EEGHourRollup
 from app.schemas.eeg import EEGRecordIn
+from app.services.eeg_ingest_service import save_eeg_rows
 from datetime import datetime, timedelta, date
 from typing import List
 
@@ -18,8 +19,8 @@ class EEGService:
         self.db = db
 
     
-    def get_aggregated_data(self, user_id: int, range: str):
-        now = datetime.now()
+    def get_aggregated_data(self, user_id: int, range: str, now: datetime = None):
+        now = now or datetime.now()
         
         if range == "weekly":
             return self._get_weekly_data(user_id, now)
@@ -312,21 +313,20 @@ class EEGService:
         start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_today = start_of_today + timedelta(days=1)
         
-        # Query data grouped by hour for today only
+        # One pre-aggregated row per hour for today only
         query = (
             self.db.query(
-                func.date_trunc('hour', EEGRecord.timestamp).label('hour'),
-                func.avg(EEGRecord.focus_label).label('focus_avg'),
-                func.avg(EEGRecord.stress_label).label('stress_avg'),
-                func.avg(EEGRecord.wellness_label).label('wellness_avg')
+                EEGHourRollup.bucket.label('hour'),
+                (EEGHourRollup.focus_sum / EEGHourRollup.sample_count).label('focus_avg'),
+                (EEGHourRollup.stress_sum / EEGHourRollup.sample_count).label('stress_avg'),
+                (EEGHourRollup.wellness_sum / EEGHourRollup.sample_count).label('wellness_avg')
             )
             .filter(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= start_of_today,
-                EEGRecord.timestamp < end_of_today
+                EEGHourRollup.user_id == user_id,
+                EEGHourRollup.bucket >= start_of_today,
+                EEGHourRollup.bucket < end_of_today
             )
-            .group_by('hour')
-            .order_by('hour')
+            .order_by(EEGHourRollup.bucket)
         )
         
         # Create a dictionary for easy lookup
@@ -392,21 +392,20 @@ class EEGService:
         start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_today = start_of_today + timedelta(days=1)
         
-        # Query data grouped by hour for today only
+        # One pre-aggregated row per hour for today only
         query = (
             self.db.query(
-                func.date_trunc('hour', EEGRecord.timestamp).label('hour'),
-                func.avg(EEGRecord.focus_label).label('focus_avg'),
-                func.avg(EEGRecord.stress_label).label('stress_avg'),
-                func.avg(EEGRecord.wellness_label).label('wellness_avg')
+                EEGHourRollup.bucket.label('hour'),
+                (EEGHourRollup.focus_sum / EEGHourRollup.sample_count).label('focus_avg'),
+                (EEGHourRollup.stress_sum / EEGHourRollup.sample_count).label('stress_avg'),
+                (EEGHourRollup.wellness_sum / EEGHourRollup.sample_count).label('wellness_avg')
             )
             .filter(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= start_of_today,
-                EEGRecord.timestamp < end_of_today
+                EEGHourRollup.user_id == user_id,
+                EEGHourRollup.bucket >= start_of_today,
+                EEGHourRollup.bucket < end_of_today
             )
-            .group_by('hour')
-            .order_by('hour')
+            .order_by(EEGHourRollup.bucket)
         )
         
         # Create a dictionary for easy lookup
@@ -471,18 +470,19 @@ class EEGService:
         """Returns quarterly data (last 3 months)"""
         start = (now.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - timedelta(days=90))
         
+        samples = func.sum(EEGHourRollup.sample_count)
         query = (
             self.db.query(
-                extract('year', EEGRecord.timestamp).label('year'),
-                extract('month', EEGRecord.timestamp).label('month'),
-                func.avg(EEGRecord.focus_label).label('focus_label'),
-                func.avg(EEGRecord.stress_label).label('stress_label'),
-                func.avg(EEGRecord.wellness_label).label('wellness_label')
+                extract('year', EEGHourRollup.bucket).label('year'),
+                extract('month', EEGHourRollup.bucket).label('month'),
+                (func.sum(EEGHourRollup.focus_sum) / samples).label('focus_label'),
+                (func.sum(EEGHourRollup.stress_sum) / samples).label('stress_label'),
+                (func.sum(EEGHourRollup.wellness_sum) / samples).label('wellness_label')
             )
             .filter(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= start,
-                EEGRecord.timestamp <= now
+                EEGHourRollup.user_id == user_id,
+                EEGHourRollup.bucket >= start,
+                EEGHourRollup.bucket <= now
             )
             .group_by('year', 'month')
             .order_by('year', 'month')
@@ -521,16 +521,15 @@ class EEGService:
         # Calculate average focus from daily records
         avg_focus = sum(record.focus for record in daily_records) / len(daily_records)
         
-        # For detailed hourly analysis, we still need to use raw EEG records
-        # but only for recent data or when daily aggregates aren't sufficient
+        # Hour-of-day focus from the hourly rollups (same average as over raw records)
         query = (
             self.db.query(
-                extract('hour', EEGRecord.timestamp).label('hour'),
-                func.avg(EEGRecord.focus_label).label('avg_focus')
+                extract('hour', EEGHourRollup.bucket).label('hour'),
+                (func.sum(EEGHourRollup.focus_sum) / func.sum(EEGHourRollup.sample_count)).label('avg_focus')
             )
             .filter(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= thirty_days_ago
+                EEGHourRollup.user_id == user_id,
+                EEGHourRollup.bucket >= thirty_days_ago.replace(minute=0, second=0, microsecond=0)
             )
             .group_by('hour')
             .order_by('hour')
@@ -794,6 +793,15 @@ class EEGService:
         return recommendations
     
     def process_and_label_records(self, records, user_id):
+        """
+        Label raw records and store them like the Kafka consumer does.
+
+        Goes through save_eeg_rows, so a resent batch is ignored instead of
+        failing on the (user_id, timestamp) key, and the rollups, goal
+        progress and chart cache are updated for the inserted rows.
+        """
+        now = datetime.utcnow()
+        rows = []
         results = []
         for record in records:
             # Replace these with your actual ML model predictions
@@ -801,17 +809,17 @@ class EEGService:
             stress = random.uniform(0, 3)
             wellness = random.uniform(0, 100)
             
-            # Save to DB
-            eeg = EEGRecord(
-                user_id=user_id,
-                timestamp=record.timestamp,
-                focus_label=focus,
-                stress_label=stress,
-                wellness_label=wellness,
-                created_by=user_id,
-                updated_by=user_id
-            )
-            self.db.add(eeg)
+            rows.append({
+                "user_id": user_id,
+                "timestamp": record.timestamp,
+                "focus_label": focus,
+                "stress_label": stress,
+                "wellness_label": wellness,
+                "created_at": now,
+                "created_by": user_id,
+                "updated_at": now,
+                "updated_by": user_id,
+            })
             
             results.append({
                 "timestamp": record.timestamp,
@@ -820,7 +828,8 @@ class EEGService:
                 "wellness": wellness
             })
         
-        self.db.commit()
+        if rows:
+            save_eeg_rows(rows)
         return results
     
     def get_time_of_day_aggregate(self, user_id: int):
@@ -838,43 +847,46 @@ class EEGService:
             ("Evening", 18, 21),  # 18:00 - 21:59
             ("Night", 22, 23),    # 22:00 - 23:59 (append to Night)
         ]
-        # Query all today's records
-        records = (
-            self.db.query(EEGRecord)
+        # Today's hourly rollups, one row per hour
+        rollups = (
+            self.db.query(EEGHourRollup)
             .filter(
-                EEGRecord.user_id == user_id,
-                EEGRecord.timestamp >= start_of_day,
-                EEGRecord.timestamp < end_of_day
+                EEGHourRollup.user_id == user_id,
+                EEGHourRollup.bucket >= start_of_day,
+                EEGHourRollup.bucket < end_of_day
             )
             .all()
         )
-        # Prepare bucketed data
+        # Prepare bucketed totals: [samples, focus_sum, stress_sum]
         bucket_map = {
-            "Night": [],
-            "Morning": [],
-            "Midday": [],
-            "Afternoon": [],
-            "Evening": []
+            "Night": [0, 0.0, 0.0],
+            "Morning": [0, 0.0, 0.0],
+            "Midday": [0, 0.0, 0.0],
+            "Afternoon": [0, 0.0, 0.0],
+            "Evening": [0, 0.0, 0.0]
         }
-        for r in records:
-            hour = r.timestamp.hour
+        for r in rollups:
+            hour = r.bucket.hour
             if 0 <= hour <= 4 or 22 <= hour <= 23:
-                bucket_map["Night"].append(r)
+                totals = bucket_map["Night"]
             elif 5 <= hour <= 9:
-                bucket_map["Morning"].append(r)
+                totals = bucket_map["Morning"]
             elif 10 <= hour <= 13:
-                bucket_map["Midday"].append(r)
+                totals = bucket_map["Midday"]
             elif 14 <= hour <= 17:
-                bucket_map["Afternoon"].append(r)
-            elif 18 <= hour <= 21:
-                bucket_map["Evening"].append(r)
+                totals = bucket_map["Afternoon"]
+            else:
+                totals = bucket_map["Evening"]
+            totals[0] += r.sample_count
+            totals[1] += r.focus_sum
+            totals[2] += r.stress_sum
         # Calculate averages
         result = []
         for bucket in ["Morning", "Midday", "Afternoon", "Evening", "Night"]:
-            recs = bucket_map[bucket]
-            if recs:
-                focus_avg = round(sum(r.focus_label for r in recs) / len(recs), 2)
-                stress_avg = round(sum(r.stress_label for r in recs) / len(recs), 2)
+            samples, focus_sum, stress_sum = bucket_map[bucket]
+            if samples:
+                focus_avg = round(focus_sum / samples, 2)
+                stress_avg = round(stress_sum / samples, 2)
             else:
                 focus_avg = 0.0
                 stress_avg = 0.0
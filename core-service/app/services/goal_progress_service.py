@@ -0,0 +1,172 @@
+"""
+Incremental goal progress.
+
+goals.current is kept up to date when data arrives instead of being
+recomputed on every read:
+
+    MINUTES               the Kafka consumer adds the newly inserted EEG
+                          records that match each goal, in the insert's
+                          transaction (replayed messages insert nothing, so
+                          they add nothing)
+    SESSIONS              +1 when a session is created inside the goal window
+    HIGH_FOCUS,           counted per day (daily aggregates plus a threshold on
+    LOW_STRESS_EPISODES   today's records): the consumer adds each batch's
+                          matching records to eeg_daily_threshold_counts and
+                          credits today (+1) when the batch takes the user's
+                          count across the threshold. Goals created today only
+                          count records after their creation, so those few are
+                          recounted instead.
+
+GoalsService.reconcile_progress recomputes goals from the source tables (admin
+API and the manual daily aggregation). The scheduled nightly job
+(infra/lambda/lambda_function.py) runs the same recompute in SQL before it
+drops the previous day's raw records.
+"""
+
+from datetime import date, datetime
+from typing import Iterable
+
+from sqlalchemy import and_, func, text
+from sqlalchemy.orm import Session
+
+from app.models.goals import Goal, GoalType, TrackingMethod
+from app.services.goals_service import GoalsService
+
+# Matching records per MINUTES goal (same per-goal-type rules as
+# GoalsService._calculate_progress), added to the capped counter
+_MINUTES_PROGRESS_SQL = text("""
+WITH r (user_id, ts, focus, stress) AS (
+    SELECT * FROM unnest(
+        CAST(:user_ids AS integer[]), CAST(:timestamps AS timestamp[]),
+        CAST(:focus AS double precision[]), CAST(:stress AS double precision[])
+    )
+),
+matched AS (
+    SELECT g.id, count(*) AS minutes
+    FROM goals g
+    JOIN r ON r.user_id = g.user_id
+          AND r.ts >= g.start_date AND r.ts <= g.end_date AND r.ts >= g.created_at
+    WHERE g.tracking_method = :minutes AND g.current < g.target
+      AND CASE
+            WHEN g.goal_type = :focus_type THEN r.focus > 0
+            WHEN g.goal_type = :meditation_type THEN r.stress <> 0 AND r.stress < 2.0 AND r.focus > 1.0
+            ELSE r.focus > 0 OR r.stress > 0
+          END
+    GROUP BY g.id
+)
+UPDATE goals g SET current = LEAST(g.target, g.current + matched.minutes)
+FROM matched
+WHERE g.id = matched.id
+""")
+
+# Today's records above the HIGH_FOCUS / LOW_STRESS_EPISODES thresholds, added
+# to the per-day counters; goals are credited for today by the batch whose rows
+# take the counter to 60 (same thresholds as GoalsService._calculate_progress)
+_DAILY_THRESHOLD_PROGRESS_SQL = text("""
+WITH r (user_id, focus, stress) AS (
+    SELECT * FROM unnest(
+        CAST(:user_ids AS integer[]), CAST(:focus AS double precision[]), CAST(:stress AS double precision[])
+    )
+),
+batch AS (
+    SELECT user_id,
+           count(*) FILTER (WHERE focus > 2.0) AS high_focus,
+           count(*) FILTER (WHERE stress < 1.0) AS low_stress
+    FROM r
+    GROUP BY user_id
+),
+counts AS (
+    INSERT INTO eeg_daily_threshold_counts AS c (user_id, date, high_focus, low_stress)
+    SELECT user_id, CAST(:today AS date), high_focus, low_stress
+    FROM batch
+    -- Stable order so concurrent consumers lock rows in the same sequence
+    ORDER BY user_id
+    ON CONFLICT (user_id, date) DO UPDATE
+        SET high_focus = c.high_focus + EXCLUDED.high_focus,
+            low_stress = c.low_stress + EXCLUDED.low_stress
+    RETURNING c.user_id, c.high_focus, c.low_stress
+),
+crossed AS (
+    SELECT counts.user_id,
+           counts.high_focus >= 60 AND counts.high_focus - batch.high_focus < 60 AS high_focus,
+           counts.low_stress >= 60 AND counts.low_stress - batch.low_stress < 60 AS low_stress
+    FROM counts
+    JOIN batch ON batch.user_id = counts.user_id
+)
+UPDATE goals g SET current = LEAST(g.target, g.current + 1)
+FROM crossed
+WHERE g.user_id = crossed.user_id
+  AND ((g.tracking_method = :high_focus AND crossed.high_focus)
+       OR (g.tracking_method = :low_stress AND crossed.low_stress))
+  AND g.current < g.target
+  AND CAST(g.start_date AS date) <= CAST(:today AS date)
+  AND CAST(:today AS date) <= CAST(g.end_date AS date)
+  AND g.created_at < CAST(:today AS timestamp)
+""")
+
+_SESSIONS_PROGRESS_SQL = text("""
+UPDATE goals SET current = LEAST(target, current + 1)
+WHERE user_id = :user_id AND tracking_method = :sessions AND current < target
+  AND CAST(:date AS timestamp) >= CAST(start_date AS date)
+  AND CAST(:date AS timestamp) <= CAST(end_date AS date)
+  AND CAST(:created_at AS timestamp) >= created_at
+""")
+
+
+def apply_eeg_goal_progress(db: Session, records: Iterable) -> None:
+    """
+    Add newly inserted EEG records to the progress of the users' goals.
+
+    records: (user_id, timestamp, focus_label, stress_label, wellness_label)
+    tuples for rows that were actually inserted. The caller commits.
+    """
+    records = list(records)
+    if not records:
+        return
+    db.execute(_MINUTES_PROGRESS_SQL, {
+        "user_ids": [r[0] for r in records],
+        "timestamps": [r[1] for r in records],
+        "focus": [r[2] for r in records],
+        "stress": [r[3] for r in records],
+        "minutes": TrackingMethod.MINUTES.name,
+        "focus_type": GoalType.FOCUS.name,
+        "meditation_type": GoalType.MEDITATION.name,
+    })
+    today = datetime.utcnow().date()
+    _apply_daily_threshold_progress(db, [r for r in records if r[1].date() == today], today)
+
+
+def _apply_daily_threshold_progress(db: Session, records: list, today: date) -> None:
+    """Count today's records towards HIGH_FOCUS / LOW_STRESS_EPISODES goals."""
+    if not records:
+        return
+    db.execute(_DAILY_THRESHOLD_PROGRESS_SQL, {
+        "user_ids": [r[0] for r in records],
+        "focus": [r[2] for r in records],
+        "stress": [r[3] for r in records],
+        "today": today,
+        "high_focus": TrackingMethod.HIGH_FOCUS.name,
+        "low_stress": TrackingMethod.LOW_STRESS_EPISODES.name,
+    })
+
+    # The day's counter includes records from before these goals existed
+    created_today = db.query(Goal).filter(
+        and_(
+            Goal.user_id.in_({r[0] for r in records}),
+            Goal.tracking_method.in_([TrackingMethod.HIGH_FOCUS, TrackingMethod.LOW_STRESS_EPISODES]),
+            Goal.created_at >= datetime.combine(today, datetime.min.time()),
+            func.date(Goal.end_date) >= today,
+            Goal.current < Goal.target,
+        )
+    ).all()
+    GoalsService(db).refresh_progress(created_today)
+
+
+def apply_session_goal_progress(db: Session, session) -> None:
+    """Count a newly created session towards the user's SESSIONS goals. The caller commits."""
+    db.execute(_SESSIONS_PROGRESS_SQL, {
+        "user_id": session.user_id,
+        "date": session.date,
+        "created_at": session.created_at,
+        "sessions": TrackingMethod.SESSIONS.name,
+    })
@@ -1,17 +1,73 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, extract
+from sqlalchemy import and_, func, extract, text
 from datetime import datetime, timedelta, date
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app.models.goals import Goal, GoalType, TrackingMethod
-from app.models.eeg_record import EEGRecord
-from app.models.eeg_aggregates import DailyEEGRecord, MonthlyEEGRecord, YearlyEEGRecord
-from app.models.sessions import Session as SessionModel
 from app.schemas.goals import GoalCreate, GoalUpdate, GoalResponse
 import logging
 
 # Configure logging for goals service
 goals_logger = logging.getLogger("goals_service")
 
+# Progress of every listed goal in one statement: one lateral COUNT per data
+# source, gated on the goal's tracking method so other sources aren't scanned
+_GOAL_PROGRESS_SQL = text("""
+SELECT g.id,
+       LEAST(g.target, CASE g.tracking_method
+           WHEN :sessions THEN s.sessions
+           WHEN :minutes THEN m.minutes
+           WHEN :high_focus THEN d.high_focus_days + CASE WHEN t.high_focus >= 60 THEN 1 ELSE 0 END
+           WHEN :low_stress THEN d.low_stress_days + CASE WHEN t.low_stress >= 60 THEN 1 ELSE 0 END
+           ELSE g.current
+       END) AS progress
+FROM goals g
+LEFT JOIN LATERAL (
+    SELECT count(*) AS sessions
+    FROM sessions s
+    WHERE g.tracking_method = :sessions
+      AND s.user_id = g.user_id
+      AND s.date >= CAST(g.start_date AS date)
+      AND s.date <= CAST(g.end_date AS date)
+      AND s.created_at >= g.created_at
+) s ON true
+LEFT JOIN LATERAL (
+    SELECT count(*) FILTER (WHERE CASE
+               WHEN g.goal_type = :focus_type THEN r.focus_label > 0
+               WHEN g.goal_type = :meditation_type
+                   THEN r.stress_label <> 0 AND r.stress_label < 2.0 AND r.focus_label > 1.0
+               ELSE r.focus_label > 0 OR r.stress_label > 0
+           END) AS minutes
+    FROM eeg_records r
+    WHERE g.tracking_method = :minutes
+      AND r.user_id = g.user_id
+      AND r.timestamp >= GREATEST(g.start_date, g.created_at)
+      AND r.timestamp <= g.end_date
+) m ON true
+LEFT JOIN LATERAL (
+    -- Previous days from the daily aggregates
+    SELECT count(*) FILTER (WHERE d.focus > 2.0) AS high_focus_days,
+           count(*) FILTER (WHERE d.stress < 1.0) AS low_stress_days
+    FROM daily_eeg_records d
+    WHERE g.tracking_method IN (:high_focus, :low_stress)
+      AND d.user_id = g.user_id
+      AND d.date >= GREATEST(CAST(g.start_date AS date), CAST(g.created_at AS date))
+      AND d.date <= LEAST(CAST(g.end_date AS date), CAST(:today AS date) - 1)
+) d ON true
+LEFT JOIN LATERAL (
+    -- Today from the live records
+    SELECT count(*) FILTER (WHERE r.focus_label > 2.0) AS high_focus,
+           count(*) FILTER (WHERE r.stress_label < 1.0) AS low_stress
+    FROM eeg_records r
+    WHERE g.tracking_method IN (:high_focus, :low_stress)
+      AND CAST(g.start_date AS date) <= CAST(:today AS date)
+      AND CAST(:today AS date) <= CAST(g.end_date AS date)
+      AND r.user_id = g.user_id
+      AND r.timestamp >= GREATEST(CAST(:today AS timestamp), g.created_at)
+      AND r.timestamp < CAST(:today AS timestamp) + interval '1 day'
+) t ON true
+WHERE g.id = ANY(:goal_ids)
+""")
+
 class GoalsService:
     def __init__(self, db: Session):
         self.db = db
@@ -33,31 +89,21 @@ class GoalsService:
         self.db.commit()
         self.db.refresh(db_goal)
         
-        # Calculate initial progress with proper session management
+        # Calculate initial progress; ingest keeps it current from here on
         self._update_goal_progress_safe(db_goal)
+        self.db.commit()
         
         return db_goal
 
     def get_user_goals(self, user_id: int) -> List[Goal]:
-        """Get all goals for a user"""
-        goals = self.db.query(Goal).filter(Goal.user_id == user_id).all()
-        
-        # Update progress for all goals with proper session management
-        for goal in goals:
-            self._update_goal_progress_safe(goal)
-        
-        return goals
+        """Get all goals for a user (progress is kept current on ingest, see goal_progress_service)"""
+        return self.db.query(Goal).filter(Goal.user_id == user_id).all()
 
     def get_goal(self, user_id: int, goal_id: int) -> Optional[Goal]:
         """Get a specific goal for a user"""
-        goal = self.db.query(Goal).filter(
+        return self.db.query(Goal).filter(
             and_(Goal.id == goal_id, Goal.user_id == user_id)
         ).first()
-        
-        if goal:
-            self._update_goal_progress_safe(goal)
-        
-        return goal
 
     def update_goal(self, user_id: int, goal_id: int, goal_data: GoalUpdate) -> Optional[Goal]:
         """Update a goal"""
@@ -68,6 +114,8 @@ class GoalsService:
         if not goal:
             return None
         
+        counted_as = (goal.goal_type, goal.tracking_method, goal.start_date, goal.end_date)
+        
         # Update fields if provided
         if goal_data.title is not None:
             goal.title = goal_data.title
@@ -89,8 +137,16 @@ class GoalsService:
         self.db.commit()
         self.db.refresh(goal)
         
-        # Recalculate progress after update with proper session management
-        self._update_goal_progress_safe(goal)
+        # Recalculate progress only if what the goal counts has changed; a
+        # recount of MINUTES goals misses raw records already archived, so it
+        # never lowers them unless the goal now counts something else
+        if (goal.goal_type, goal.tracking_method, goal.start_date, goal.end_date) != counted_as:
+            before = goal.current
+            self._update_goal_progress_safe(goal)
+            same_kind = (goal.goal_type, goal.tracking_method) == counted_as[:2]
+            if goal.tracking_method == TrackingMethod.MINUTES and same_kind and goal.current < before:
+                goal.current = before
+            self.db.commit()
         
         return goal
 
@@ -107,231 +163,88 @@ class GoalsService:
         self.db.commit()
         return True
 
-    def _update_goal_progress_safe(self, goal: Goal) -> None:
-        """
-        Safely update goal progress using the existing database session
-        This prevents connection leaks by reusing the current session
-        """
+    def refresh_progress(self, goals: List[Goal]) -> None:
+        """Recompute progress of these goals from the source tables in one query (flushed, not committed)"""
+        if not goals:
+            return
         try:
-            if goal.tracking_method == TrackingMethod.SESSIONS:
-                progress = self._calculate_sessions_progress(goal)
-            elif goal.tracking_method == TrackingMethod.MINUTES:
-                progress = self._calculate_minutes_progress(goal)
-            elif goal.tracking_method == TrackingMethod.HIGH_FOCUS:
-                progress = self._calculate_high_focus_progress(goal)
-            elif goal.tracking_method == TrackingMethod.LOW_STRESS_EPISODES:
-                progress = self._calculate_low_stress_episodes_progress(goal)
-            else:
-                progress = goal.current  # Keep manual progress
-            
-            if progress != goal.current:
-                goal.current = progress
-                # Use existing session instead of committing here
-                # The commit will happen in the calling method
-                self.db.flush()  # Flush changes without committing
-                
+            # Savepoint, so a failure here doesn't abort the caller's transaction
+            with self.db.begin_nested():
+                progress = self._calculate_progress(goals)
         except Exception as e:
-            goals_logger.error(f"Error updating goal progress for goal {goal.id}: {e}")
-            # Don't raise - just log and continue with existing progress
+            goals_logger.error(f"Error updating goal progress for goals {[goal.id for goal in goals]}: {e}")
+            return  # Don't raise - keep existing progress
 
-    def _update_goal_progress(self, goal: Goal) -> None:
-        """Update goal progress based on tracking method"""
-        if goal.tracking_method == TrackingMethod.SESSIONS:
-            progress = self._calculate_sessions_progress(goal)
-        elif goal.tracking_method == TrackingMethod.MINUTES:
-            progress = self._calculate_minutes_progress(goal)
-        elif goal.tracking_method == TrackingMethod.HIGH_FOCUS:
-            progress = self._calculate_high_focus_progress(goal)
-        elif goal.tracking_method == TrackingMethod.LOW_STRESS_EPISODES:
-            progress = self._calculate_low_stress_episodes_progress(goal)
-        else:
-            progress = goal.current  # Keep manual progress
-        
-        if progress != goal.current:
-            goal.current = progress
-            self.db.commit()
+        changed = False
+        for goal in goals:
+            value = progress.get(goal.id, goal.current)
+            if value != goal.current:
+                goal.current = value
+                changed = True
+        if changed:
+            # The commit happens in the calling method
+            self.db.flush()
 
-    def _calculate_sessions_progress(self, goal: Goal) -> int:
-        """
-        Scenario 1: Calculate progress based on completed sessions in sessions table
-        Goal Type: Focus/Meditation + Tracking Method: Sessions
-        Only counts sessions created AFTER the goal was created
+    def reconcile_progress(self, user_id: Optional[int] = None) -> int:
         """
-        try:
-            # Count sessions in the date range for the user using existing session
-            # Only count sessions that were created after the goal was created
-            sessions_count = self.db.query(SessionModel).filter(
-                and_(
-                    SessionModel.user_id == goal.user_id,
-                    SessionModel.date >= goal.start_date.date(),
-                    SessionModel.date <= goal.end_date.date(),
-                    SessionModel.created_at >= goal.created_at  # Only count sessions after goal creation
-                )
-            ).count()
-            
-            return min(sessions_count, goal.target)
-        except Exception as e:
-            goals_logger.error(f"Error calculating sessions progress: {e}")
-            return goal.current  # Return existing progress on error
+        Periodic correction of the incremental counters: recompute every goal
+        that is active or ended since yesterday (one user's, or everyone's).
 
-    def _calculate_minutes_progress(self, goal: Goal) -> int:
-        """
-        Scenario 2: Calculate progress based on focus/meditation minutes from EEG records
-        Goal Type: Focus/Meditation + Tracking Method: Minutes
-        Only counts EEG records created AFTER the goal was created
+        MINUTES goals are only raised here, never lowered: raw EEG records
+        older than the retention window are gone, so a recount undercounts.
+        Returns the number of goals whose progress changed.
         """
-        try:
-            # Get all EEG records in the date range AND after goal creation using existing session
-            eeg_records = self.db.query(EEGRecord).filter(
-                and_(
-                    EEGRecord.user_id == goal.user_id,
-                    EEGRecord.timestamp >= goal.start_date,
-                    EEGRecord.timestamp <= goal.end_date,
-                    EEGRecord.timestamp >= goal.created_at  # Only count records after goal creation
-                )
-            ).all()
-            
-            # Count minutes based on goal type
-            total_minutes = 0
-            for record in eeg_records:
-                if goal.goal_type == GoalType.FOCUS:
-                    # Count any focus activity (focus_label > 0)
-                    if record.focus_label and record.focus_label > 0:
-                        total_minutes += 1  # Each record represents 1 minute
-                elif goal.goal_type == GoalType.MEDITATION:
-                    # For meditation, we'll count low stress + moderate focus as meditation minutes
-                    if (record.stress_label and record.stress_label < 2.0 and 
-                        record.focus_label and record.focus_label > 1.0):
-                        total_minutes += 1
-                else:  # CUSTOM
-                    # For custom goals, count any activity
-                    if (record.focus_label and record.focus_label > 0) or (record.stress_label and record.stress_label > 0):
-                        total_minutes += 1
-            
-            return min(total_minutes, goal.target)
-        except Exception as e:
-            goals_logger.error(f"Error calculating minutes progress: {e}")
-            return goal.current  # Return existing progress on error
+        since = datetime.combine(datetime.utcnow().date() - timedelta(days=1), datetime.min.time())
+        query = self.db.query(Goal).filter(Goal.end_date >= since)
+        if user_id is not None:
+            query = query.filter(Goal.user_id == user_id)
+
+        goals = query.all()
+        before = {goal.id: goal.current for goal in goals}
+        self.refresh_progress(goals)
 
-    def _calculate_high_focus_progress(self, goal: Goal) -> int:
+        changed = 0
+        for goal in goals:
+            if goal.tracking_method == TrackingMethod.MINUTES and goal.current < before[goal.id]:
+                goal.current = before[goal.id]
+            if goal.current != before[goal.id]:
+                changed += 1
+                goals_logger.info(f"Reconciled goal {goal.id} progress: {before[goal.id]} -> {goal.current}")
+        self.db.commit()
+        goals_logger.info(f"🎯 Reconciled goal progress: {changed} goals changed")
+        return changed
+
+    def _update_goal_progress_safe(self, goal: Goal) -> None:
         """
-        Scenario 3: Calculate progress based on high focus minutes (focus > 2.0)
-        Goal Type: Focus/Meditation + Tracking Method: High Focus
-        Uses live EEG data for current day and aggregated data for previous days
-        Only counts data created AFTER the goal was created
+        Safely update goal progress using the existing database session
+        This prevents connection leaks by reusing the current session
         """
-        try:
-            # Convert goal dates to date objects for comparison
-            start_date = goal.start_date.date() if isinstance(goal.start_date, datetime) else goal.start_date
-            end_date = goal.end_date.date() if isinstance(goal.end_date, datetime) else goal.end_date
-            today = datetime.utcnow().date()
-            goal_created_date = goal.created_at.date() if isinstance(goal.created_at, datetime) else goal.created_at
-            
-            high_focus_count = 0
-            
-            # For previous days, use daily aggregated data (only days after goal creation)
-            if start_date < today:
-                previous_end = min(end_date, today - timedelta(days=1))
-                # Only consider days on or after the goal creation date
-                effective_start = max(start_date, goal_created_date)
-                
-                if effective_start <= previous_end:
-                    high_focus_days = self.db.query(DailyEEGRecord).filter(
-                        and_(
-                            DailyEEGRecord.user_id == goal.user_id,
-                            DailyEEGRecord.date >= effective_start,
-                            DailyEEGRecord.date <= previous_end,
-                            DailyEEGRecord.focus > 2.0
-                        )
-                    ).count()
-                    high_focus_count += high_focus_days
-            
-            # For current day, use live EEG records (only after goal creation timestamp)
-            if start_date <= today <= end_date:
-                today_start = max(
-                    datetime.combine(today, datetime.min.time()),
-                    goal.created_at  # Only count records after goal creation
-                )
-                today_end = datetime.combine(today, datetime.max.time())
-                
-                today_high_focus = self.db.query(EEGRecord).filter(
-                    and_(
-                        EEGRecord.user_id == goal.user_id,
-                        EEGRecord.timestamp >= today_start,
-                        EEGRecord.timestamp <= today_end,
-                        EEGRecord.focus_label > 2.0
-                    )
-                ).count()
-                
-                # Convert records to meaningful units (e.g., minutes)
-                high_focus_minutes = today_high_focus // 60  # Assuming 1 record per second
-                if high_focus_minutes > 0:
-                    high_focus_count += 1
-            
-            return min(high_focus_count, goal.target)
-        except Exception as e:
-            goals_logger.error(f"Error calculating high focus progress: {e}")
-            return goal.current  # Return existing progress on error
+        self.refresh_progress([goal])
 
-    def _calculate_low_stress_episodes_progress(self, goal: Goal) -> int:
+    def _calculate_progress(self, goals: List[Goal]) -> Dict[int, int]:
         """
-        Scenario 4: Calculate progress based on low stress minutes (stress < 1.0)
-        Goal Type: Focus/Meditation + Tracking Method: Low Stress Episodes
-        Uses live EEG data for current day and aggregated data for previous days
-        Only counts data created AFTER the goal was created
+        Progress of each goal (capped at its target), evaluated for all goals in one query.
+        Only data created AFTER each goal was created counts:
+
+        Scenario 1 - Sessions: completed sessions in the goal's date range
+        Scenario 2 - Minutes: EEG records (1 per minute) matching the goal type:
+            focus: focus_label > 0; meditation: low stress (< 2.0) with
+            moderate focus (> 1.0); custom: any focus or stress activity
+        Scenario 3 - High Focus: days with daily average focus > 2.0, plus
+            today if it has at least a minute (60 records) of focus > 2.0
+        Scenario 4 - Low Stress Episodes: the same with stress < 1.0
         """
-        try:
-            # Convert goal dates to date objects for comparison
-            start_date = goal.start_date.date() if isinstance(goal.start_date, datetime) else goal.start_date
-            end_date = goal.end_date.date() if isinstance(goal.end_date, datetime) else goal.end_date
-            today = datetime.utcnow().date()
-            goal_created_date = goal.created_at.date() if isinstance(goal.created_at, datetime) else goal.created_at
-            
-            low_stress_count = 0
-            
-            # For previous days, use daily aggregated data (only days after goal creation)
-            if start_date < today:
-                previous_end = min(end_date, today - timedelta(days=1))
-                # Only consider days on or after the goal creation date
-                effective_start = max(start_date, goal_created_date)
-                
-                if effective_start <= previous_end:
-                    low_stress_days = self.db.query(DailyEEGRecord).filter(
-                        and_(
-                            DailyEEGRecord.user_id == goal.user_id,
-                            DailyEEGRecord.date >= effective_start,
-                            DailyEEGRecord.date <= previous_end,
-                            DailyEEGRecord.stress < 1.0
-                        )
-                    ).count()
-                    low_stress_count += low_stress_days
-            
-            # For current day, use live EEG records (only after goal creation timestamp)
-            if start_date <= today <= end_date:
-                today_start = max(
-                    datetime.combine(today, datetime.min.time()),
-                    goal.created_at  # Only count records after goal creation
-                )
-                today_end = datetime.combine(today, datetime.max.time())
-                
-                today_low_stress = self.db.query(EEGRecord).filter(
-                    and_(
-                        EEGRecord.user_id == goal.user_id,
-                        EEGRecord.timestamp >= today_start,
-                        EEGRecord.timestamp <= today_end,
-                        EEGRecord.stress_label < 1.0
-                    )
-                ).count()
-                
-                # Convert records to meaningful units (e.g., minutes)
-                low_stress_minutes = today_low_stress // 60  # Assuming 1 record per second
-                if low_stress_minutes > 0:
-                    low_stress_count += 1
-            
-            return min(low_stress_count, goal.target)
-        except Exception as e:
-            goals_logger.error(f"Error calculating low stress episodes progress: {e}")
-            return goal.current  # Return existing progress on error
+        rows = self.db.execute(_GOAL_PROGRESS_SQL, {
+            "goal_ids": [goal.id for goal in goals],
+            "today": datetime.utcnow().date(),
+            "sessions": TrackingMethod.SESSIONS.name,
+            "minutes": TrackingMethod.MINUTES.name,
+            "high_focus": TrackingMethod.HIGH_FOCUS.name,
+            "low_stress": TrackingMethod.LOW_STRESS_EPISODES.name,
+            "focus_type": GoalType.FOCUS.name,
+            "meditation_type": GoalType.MEDITATION.name,
+        }).all()
+        return {row.id: int(row.progress) for row in rows}
 
     def get_current_goals_for_display(self, user_id: int) -> List[dict]:
         """Get goals formatted for the current HomeScreen display"""
@@ -1,10 +1,99 @@
 import logging
+import os
+from datetime import datetime
+from typing import List, Tuple
+import numpy as np
 from fastapi import HTTPException
+from sqlalchemy import select, text
+from app.models.eeg_record import EEGRecord
 from app.models.sessions import Session
 from app.schemas.sessions import SessionHistoryOut
+from app.utils.downsampling import bucket_edges, downsample
 
 logger = logging.getLogger(__name__)
 
+# Default and maximum number of chart points a client can ask for
+SESSION_CHART_POINTS = 10
+SESSION_CHART_MAX_POINTS = int(os.getenv("SESSION_CHART_MAX_POINTS", "500"))
+# Resolution of the series kept on sessions.chart (at most this many points)
+SESSION_CHART_STORED_POINTS = max(
+    SESSION_CHART_MAX_POINTS, int(os.getenv("SESSION_CHART_STORED_POINTS", "500"))
+)
+STORED_CHART_VERSION = 2
+
+METRICS = ("focus", "stress", "wellness")
+
+# Per-second sums/counts over every interval (a record inside two overlapping
+# intervals counts twice), in time order; the chart is downsampled from these.
+_SESSION_SECONDS_SQL = """
+WITH intervals (start_ts, end_ts) AS (VALUES {intervals})
+SELECT date_trunc('second', r.timestamp) AS second,
+       sum(r.focus_label) AS focus_sum, count(r.focus_label) AS focus_n,
+       sum(r.stress_label) AS stress_sum, count(r.stress_label) AS stress_n,
+       sum(r.wellness_label) AS wellness_sum, count(r.wellness_label) AS wellness_n,
+       count(*) AS records
+FROM eeg_records r
+JOIN intervals i ON r.timestamp >= i.start_ts AND r.timestamp <= i.end_ts
+WHERE r.user_id = :user_id
+GROUP BY 1
+ORDER BY 1
+"""
+
+
+def _avg(total, n) -> float:
+    return float(total) / n if n else 0
+
+
+def _stored_series(seconds: np.ndarray, means: dict, counts: dict, records: np.ndarray) -> dict:
+    """
+    Compact chart series for sessions.chart: per-second means, bucketed by
+    mean to SESSION_CHART_STORED_POINTS when longer, with offsets in seconds
+    from start. n_<metric> is the number of values behind each point of that
+    metric (the weights when re-downsampling); a point with no values for a
+    metric is stored as null with n 0.
+    """
+    stored = {"v": STORED_CHART_VERSION, "records": int(records.sum()), "seconds": len(seconds)}
+    if not len(seconds):
+        stored.update({"start": None, "offsets": []})
+        stored.update({key: [] for metric in METRICS for key in (metric, f"n_{metric}")})
+        return stored
+
+    indices, series = downsample(seconds, means, SESSION_CHART_STORED_POINTS, "mean", weights=counts)
+    if len(seconds) > SESSION_CHART_STORED_POINTS:
+        starts = bucket_edges(len(seconds), SESSION_CHART_STORED_POINTS)[:-1]
+        counts = {metric: np.add.reduceat(n, starts) for metric, n in counts.items()}
+    stored["start"] = np.datetime_as_string(seconds[0], unit="s")
+    stored["offsets"] = ((seconds[indices] - seconds[0]) // np.timedelta64(1, "s")).tolist()
+    for metric in METRICS:
+        n = counts[metric].astype(int)
+        values = np.round(series[metric], 4).tolist()
+        stored[metric] = [v if k else None for v, k in zip(values, n)]
+        stored[f"n_{metric}"] = n.tolist()
+    return stored
+
+
+def chart_from_stored(stored: dict, points: int = SESSION_CHART_POINTS, method: str = "mean") -> dict:
+    """Chart points from a session's stored series (sessions.chart), no raw records read."""
+    chart = {f"{metric}_data": [] for metric in METRICS}
+    chart.update({"timestamps": [], "records": stored["records"], "seconds": stored["seconds"]})
+    if not stored["offsets"]:
+        return chart
+
+    offsets = np.array(stored["offsets"], dtype="timedelta64[s]")
+    # Version 1 kept one record count for all metrics, and 0 for missing values
+    weights = {
+        metric: np.array(stored.get(f"n_{metric}", stored.get("n")), dtype=float) for metric in METRICS
+    }
+    values = {metric: np.array(stored[metric], dtype=float) for metric in METRICS}  # null -> NaN
+    for metric in METRICS:
+        values[metric][weights[metric] == 0] = np.nan
+    indices, series = downsample(offsets, values, points, method, weights=weights)
+    for metric in METRICS:
+        chart[f"{metric}_data"] = series[metric].tolist()
+    start = np.datetime64(stored["start"], "s")
+    chart["timestamps"] = np.datetime_as_string(start + offsets[indices], unit="s").tolist()
+    return chart
+
 class SessionService:
     def __init__(self, db):
         self.db = db
@@ -27,4 +116,105 @@ class SessionService:
             ]
         except Exception as e:
             logger.exception("Failed to fetch session history for user %s", user_id)
-            raise HTTPException(status_code=500, detail="Failed to fetch session history")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail="Failed to fetch session history")
+
+    def get_session_chart(
+        self,
+        user_id: int,
+        intervals: List[Tuple[datetime, datetime]],
+        points: int = SESSION_CHART_POINTS,
+        method: str = "mean",
+    ):
+        """
+        Chart points and overall averages for a tracked session, in one query.
+
+        intervals: (start, end) pairs, UTC-naive, bounds inclusive. The
+        per-second means are downsampled to `points` with `method` (see
+        app.utils.downsampling). Returns per-point values and labels,
+        overall averages of every record, the matched record count and the
+        number of distinct seconds, plus "stored": the compact series to
+        keep on sessions.chart.
+        """
+        chart = {f"{metric}_data": [] for metric in METRICS}
+        chart.update({"timestamps": [], "records": 0, "seconds": 0})
+        chart.update({f"avg_{metric}": 0 for metric in METRICS})
+        chart["stored"] = _stored_series(np.array([], dtype="datetime64[s]"), {}, {}, np.array([]))
+        if not intervals:
+            return chart
+
+        params = {"user_id": user_id}
+        values = []
+        for i, (start, end) in enumerate(intervals):
+            params[f"start_{i}"], params[f"end_{i}"] = start, end
+            values.append(f"(CAST(:start_{i} AS timestamp), CAST(:end_{i} AS timestamp))")
+        rows = self.db.execute(
+            text(_SESSION_SECONDS_SQL.format(intervals=", ".join(values))), params
+        ).all()
+        if not rows:
+            return chart
+
+        columns = list(zip(*rows))
+        seconds = np.array(columns[0], dtype="datetime64[s]")
+        means, counts = {}, {}
+        for i, metric in enumerate(METRICS):
+            sums = np.array(columns[1 + 2 * i], dtype=float)
+            counts[metric] = np.array(columns[2 + 2 * i], dtype=float)
+            means[metric] = np.divide(
+                sums, counts[metric], out=np.full_like(sums, np.nan), where=counts[metric] > 0
+            )
+            chart[f"avg_{metric}"] = _avg(np.nansum(sums), counts[metric].sum())
+
+        indices, series = downsample(seconds, means, points, method, weights=counts)
+        for metric in METRICS:
+            chart[f"{metric}_data"] = series[metric].tolist()
+        chart["timestamps"] = np.datetime_as_string(seconds[indices], unit="s").tolist()
+        records = np.array(columns[7], dtype=float)
+        chart["records"] = int(records.sum())
+        chart["seconds"] = len(seconds)
+        chart["stored"] = _stored_series(seconds, means, counts, records)
+        return chart
+
+    def get_records_chart(
+        self,
+        user_id: int,
+        start: datetime,
+        end: datetime,
+        points: int = SESSION_CHART_POINTS,
+        method: str = "mean",
+    ):
+        """
+        Chart points from the raw records in [start, end], downsampled to
+        `points` with `method`; reads columns only, not ORM objects.
+        """
+        rows = self.db.execute(
+            select(
+                EEGRecord.timestamp,
+                EEGRecord.focus_label,
+                EEGRecord.stress_label,
+                EEGRecord.wellness_label,
+            )
+            .where(
+                EEGRecord.user_id == user_id,
+                EEGRecord.timestamp >= start,
+                EEGRecord.timestamp <= end,
+            )
+            .order_by(EEGRecord.timestamp.asc())
+        ).all()
+
+        chart = {f"{metric}_data": [] for metric in METRICS}
+        chart.update({"timestamps": [], "records": len(rows)})
+        if not rows:
+            return chart
+
+        columns = list(zip(*rows))
+        timestamps = columns[0]
+        indices, series = downsample(
+            np.array(timestamps, dtype="datetime64[us]"),
+            {metric: np.array(columns[1 + i], dtype=float) for i, metric in enumerate(METRICS)},
+            points,
+            method,
+        )
+        for metric in METRICS:
+            chart[f"{metric}_data"] = series[metric].tolist()
+        chart["timestamps"] = [timestamps[i].isoformat() for i in indices]
+        return chart
@@ -0,0 +1,145 @@
+"""
+Downsampling of chart series to a requested number of points.
+
+Works on column arrays: x (timestamps, any sortable dtype, in order) and one
+float array per metric sharing that axis, with NaN for missing values. Every
+method returns the indices into x to label the output points with (all
+metrics share them, so one timestamps list fits the whole chart) and the
+output values per metric.
+
+    mean    equal-count buckets averaged (optionally weighted), labelled with
+            each bucket's middle element
+    minmax  min/max envelope: points // 2 buckets, two points each (so an odd
+            `points` yields points - 1). Each metric's two extremes are
+            given in the order they occur, but they sit at different
+            positions in different metrics, so the shared labels describe
+            the bucket instead: its first and its last element
+    lttb    Largest-Triangle-Three-Buckets: keeps the points that best preserve
+            the shape of all metrics together (first and last always kept)
+
+Series with no more than `points` elements are returned as-is.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+METHODS = ("mean", "minmax", "lttb")
+
+Columns = Dict[str, np.ndarray]
+
+
+def bucket_edges(n: int, buckets: int) -> np.ndarray:
+    """Start offsets of `buckets` equal-count buckets over n elements, plus n."""
+    return (np.arange(buckets + 1) * n) // buckets
+
+
+def _filled(values: np.ndarray) -> np.ndarray:
+    return np.nan_to_num(values, nan=0.0)
+
+
+def mean(n: int, columns: Columns, points: int, weights: Optional[Columns] = None) -> Tuple[np.ndarray, Columns]:
+    """
+    Average each bucket; weights[name] gives each element's weight (e.g. the
+    number of raw records behind a per-second mean).
+    """
+    edges = bucket_edges(n, points)
+    starts = edges[:-1]
+    out = {}
+    for name, values in columns.items():
+        present = ~np.isnan(values)
+        w = weights[name] if weights is not None else np.ones(n)
+        w = np.where(present, w, 0.0)
+        sums = np.add.reduceat(np.where(present, values, 0.0) * w, starts)
+        counts = np.add.reduceat(w, starts)
+        out[name] = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    return starts + np.diff(edges) // 2, out
+
+
+def minmax(n: int, columns: Columns, points: int) -> Tuple[np.ndarray, Columns]:
+    """
+    Per bucket (points // 2 of them) the minimum and maximum, in time order.
+
+    Returns 2 * (points // 2) points labelled (bucket start, bucket end), not
+    with the positions of the extremes, which differ per metric.
+    """
+    buckets = max(1, points // 2)
+    edges = bucket_edges(n, buckets)
+    starts, ends = edges[:-1], edges[1:] - 1
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    out = {}
+    for name, values in columns.items():
+        # Sorted by (bucket, value): each bucket's first element is its min, last its max
+        low = np.lexsort((np.where(np.isnan(values), np.inf, values), bucket))[starts]
+        high = np.lexsort((np.where(np.isnan(values), -np.inf, values), bucket))[ends]
+        first = np.where(low <= high, low, high)
+        second = np.where(low <= high, high, low)
+        out[name] = _filled(np.column_stack((values[first], values[second])).ravel())
+    # first/second are per metric; the shared labels are the bucket's bounds
+    return np.column_stack((starts, ends)).ravel(), out
+
+
+def lttb(x: np.ndarray, columns: Columns, points: int) -> Tuple[np.ndarray, Columns]:
+    """
+    Largest-Triangle-Three-Buckets over all metrics at once: the triangle
+    areas of the metrics (each scaled to 0..1) are summed, so the kept points
+    are shared by every series.
+    """
+    n = len(x)
+    if x.dtype.kind in "mM":  # timedelta64 / datetime64
+        xs = (x - x[0]) / np.timedelta64(1, "s")
+    else:
+        xs = x.astype(float) - float(x[0])
+    ys = np.vstack([_scaled(values) for values in columns.values()])
+
+    # Inner buckets over elements 1 .. n-2; the last edge is n - 1
+    edges = 1 + (np.arange(points - 1) * (n - 2)) // (points - 2)
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx = xs[next_lo:next_hi].mean()
+        cy = ys[:, next_lo:next_hi].mean(axis=1)
+        area = np.abs(
+            (xs[a] - cx) * (ys[:, lo:hi] - ys[:, a:a + 1])
+            - (xs[a] - xs[lo:hi]) * (cy - ys[:, a])[:, None]
+        ).sum(axis=0)
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected, {name: _filled(values[selected]) for name, values in columns.items()}
+
+
+def _scaled(values: np.ndarray) -> np.ndarray:
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return np.zeros_like(values)
+    low, span = present.min(), present.max() - present.min()
+    return _filled((values - low) / span if span else values - low)
+
+
+def downsample(
+    x: np.ndarray,
+    columns: Columns,
+    points: int,
+    method: str = "mean",
+    weights: Optional[Columns] = None,
+) -> Tuple[np.ndarray, Columns]:
+    """
+    Reduce the series to about `points` points with `method` (one of METHODS).
+
+    Returns (indices into x, {name: values}); missing values come out as 0.
+    weights only apply to "mean". "minmax" returns an even number of points
+    labelled by bucket (see minmax()).
+    """
+    n = len(x)
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method {method!r}; expected one of {METHODS}")
+    if n <= points:
+        return np.arange(n), {name: _filled(values) for name, values in columns.items()}
+    if method == "minmax":
+        return minmax(n, columns, points)
+    if method == "lttb" and points >= 3:
+        return lttb(x, columns, points)
+    return mean(n, columns, points, weights)
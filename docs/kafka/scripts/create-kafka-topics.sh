@@ -61,6 +61,9 @@ echo ""
 declare -A TOPICS=(
     ["eeg.raw.data"]=3
     ["eeg.processed.data"]=3
+    ["eeg.raw.data.dlq"]=1
+    ["eeg.processed.data.dlq"]=1
+    ["eeg.processed.data.gateway.dlq"]=1
     ["user.activity"]=3
     ["alerts.events"]=3
     ["analytics.triggers"]=3
@@ -4,11 +4,28 @@ Separates web layer from processing layer for predictable performance.
 """
 
 import os
+import zlib
 from celery import Celery
 
 # Redis connection for Celery broker and result backend
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Streaming batches carry per-user filter state, so one user's batches must run
+# one at a time, in arrival order. They are routed by user id to eeg_stream.<n>
+# queues, each served by a single concurrency-1 worker (eeg-worker-stream-<n> in
+# docker-compose.yml, or start-worker.sh with STREAM_SHARD=<n>); other tasks
+# stay on eeg_processing. Every shard 0..EEG_STREAM_SHARDS-1 needs its worker.
+EEG_STREAM_SHARDS = int(os.getenv("EEG_STREAM_SHARDS", "2"))
+if EEG_STREAM_SHARDS < 1:
+    raise ValueError("EEG_STREAM_SHARDS must be at least 1: streaming batches need an ordered queue")
+
+
+def eeg_queue(user_id, stream: bool = False) -> str:
+    """Celery queue for an FFT task; a user's streaming batches always map to the same shard."""
+    if not stream:
+        return "eeg_processing"
+    return f"eeg_stream.{zlib.crc32(str(user_id).encode()) % EEG_STREAM_SHARDS}"
+
 # Create Celery app
 celery_app = Celery(
     "eeg_tasks",
@@ -1,8 +1,13 @@
 import sys
 from confluent_kafka import Consumer
-import os, json, threading, logging, requests
+import os, json, logging, base64
 from app.events.kafka_config import get_kafka_config
-from app.utils.s3_raw_backup import save_raw_eeg_to_s3
+from niura_kafka.consumer_runtime import PartitionedConsumer, RetryBatch, dead_letter_topic
+from app.events.async_producer import close_producer, get_producer
+from app.utils.s3_raw_backup import save_raw_eeg_to_s3, save_raw_eeg_frame_to_s3
+from app.utils.eeg_frame import EEG_FRAME_CONTENT_TYPE, check_window_duration, decode_frame
+from app.tasks.eeg_processing import process_eeg_fft, process_eeg_frame_fft
+from app.core.celery_app import eeg_queue
 
 
 logging.basicConfig(
@@ -13,64 +18,132 @@ logging.basicConfig(
 )
 
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
-# Use FFT endpoint for faster processing (can switch back to /bulk for BrainFlow)
-EEG_API_URL=os.getenv("EEG_API_URL", "http://localhost:8002/api/bulk-fft")
+
+# Messages fetched per consume() call / max wait; partitions are handed to
+# worker threads and offsets committed once their messages reach Celery
+CONSUMER_BATCH_SIZE = int(os.getenv("EEG_CONSUMER_BATCH_SIZE", "100"))
+CONSUMER_BATCH_TIMEOUT = float(os.getenv("EEG_CONSUMER_BATCH_TIMEOUT", "0.5"))
+ENQUEUE_RETRY_BACKOFF = float(os.getenv("EEG_ENQUEUE_RETRY_BACKOFF", "2.0"))
+# Messages that still cannot be enqueued after the runtime's retries go here
+EEG_RAW_DLQ_TOPIC = os.getenv("EEG_RAW_DLQ_TOPIC", "eeg.raw.data.dlq")
 
 
 conf = get_kafka_config(is_consumer=True)
 conf["group.id"] = "eeg-service-consumer"
+conf["enable.auto.commit"] = False
 
-consumer = Consumer(conf)
-consumer.subscribe(["eeg.raw.data"])
+runtime = None
+
+
+class InvalidEEGMessage(ValueError):
+    """Message can never be processed; it is logged and its offset committed."""
 
-def consume_loop():
-    logging.info("👂 EEG-service consuming 'eeg.raw.data'")
-    while True:
-        msg = consumer.poll(1.0)
-        if msg is None:
-            continue
-        if msg.error():
-            logging.error(f"Kafka error: {msg.error()}")
-            continue
-        data = json.loads(msg.value().decode("utf-8"))
-        handle_eeg_data(data)
+
+def handle_batch(batch):
+    """
+    Enqueue a micro-batch of Kafka messages in order.
+
+    Returns (handled, error): the number of leading messages that were
+    enqueued or skipped as invalid, and the exception that stopped the batch
+    (None if every message was handled).
+    """
+    for handled, msg in enumerate(batch):
+        try:
+            headers = dict(msg.headers() or [])
+            if headers.get("content-type", b"").decode() == EEG_FRAME_CONTENT_TYPE:
+                # Messages are keyed by user id; older producers only set the header
+                handle_eeg_frame((headers.get("user_id") or msg.key() or b"0").decode("utf-8", "replace"), msg.value())
+            else:
+                try:
+                    data = json.loads(msg.value().decode("utf-8"))
+                except (AttributeError, ValueError) as e:  # empty value / bad UTF-8 / bad JSON
+                    raise InvalidEEGMessage(f"invalid JSON: {e}")
+                handle_eeg_data(data)
+        except InvalidEEGMessage as e:
+            logging.warning(f"⚠️ Skipping EEG message at {msg.topic()}[{msg.partition()}]@{msg.offset()}: {e}")
+        except Exception as e:
+            return handled, e
+    return len(batch), None
+
+def handle_messages(batch):
+    """PartitionedConsumer handler: enqueue a batch, retrying from the first message that failed."""
+    handled, error = handle_batch(batch)
+    if error is not None:
+        # Broker/S3 outage: replay from the first message not handed to Celery
+        raise RetryBatch(handled, error)
+    logging.info(f"✅ Enqueued {len(batch)} EEG messages for FFT processing")
+
+def _user_id(value) -> int:
+    """Parse a message's user id. Raises InvalidEEGMessage if it is not an integer."""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        raise InvalidEEGMessage(f"invalid user_id {value!r}")
 
 def handle_eeg_data(data):
-    """Forward EEG Kafka message to the /bulk endpoint."""
+    """Enqueue a JSON EEG Kafka message on the FFT worker queue."""
+    # Validate everything before the S3 backup and enqueue, so a malformed
+    # message is skipped instead of retried forever
+    if not isinstance(data, dict):
+        raise InvalidEEGMessage(f"expected a JSON object, got {type(data).__name__}")
+    user_id = _user_id(data.get("user_id"))
+    logging.info(f"📩 EEG message received for user {user_id}")
+    eeg_payload = data.get("data") or {}
+    if not isinstance(eeg_payload, dict):
+        raise InvalidEEGMessage(f"expected 'data' to be an object, got {type(eeg_payload).__name__}")
+
+    records = eeg_payload.get("records") or []
+    if not isinstance(records, list) or not records:
+        raise InvalidEEGMessage("no EEG records provided")
     try:
-        logging.info(f"📩 EEG message received for user {data.get('user_id')}")
-        user_id=data.get("user_id")
-        eeg_payload = data.get("data", {})
-        
-
-        save_raw_eeg_to_s3(user_id, eeg_payload) 
-        # Send it to your FastAPI endpoint
-        response = requests.post(
-            EEG_API_URL,
-            json={"batch": {**eeg_payload, "user_id": user_id}},  # ✅ merged inside
-            timeout=10,
-)
+        duration = check_window_duration(eeg_payload.get("duration") or 2)
+    except ValueError as e:
+        raise InvalidEEGMessage(str(e))
 
+    save_raw_eeg_to_s3(user_id, eeg_payload)
 
-       # ✅ Print both status and the returned message
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                logging.info(f"✅ EEG data forwarded successfully → {result}")
-            except Exception:
-                logging.info(f"✅ EEG data forwarded successfully (no JSON body)")
-        else:
-            logging.warning(
-                f"⚠️ Failed to forward EEG data to /bulk: {response.status_code} {response.text}"
-            )
+    stream = bool(eeg_payload.get("stream", False))
+    process_eeg_fft.apply_async(
+        args=[records, user_id, duration, stream],
+        queue=eeg_queue(user_id, stream),
+        ignore_result=True
+    )
 
-        # ✅ Return the actual response content in case other parts need it
-        return response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text
+def handle_eeg_frame(user_id, frame: bytes):
+    """Enqueue a binary EEG frame on the FFT worker queue."""
+    user_id = _user_id(user_id)
+    logging.info(f"📩 EEG frame received for user {user_id} ({len(frame)} bytes)")
+    try:
+        header = decode_frame(frame)
+    except ValueError as e:
+        raise InvalidEEGMessage(str(e))
 
-    except Exception as e:
-        logging.exception(f"❌ Error forwarding EEG data: {e}")
-        return None
+    save_raw_eeg_frame_to_s3(user_id, frame)
+
+    # Celery uses the JSON serializer, so the frame travels base64-encoded
+    process_eeg_frame_fft.apply_async(
+        args=[base64.b64encode(frame).decode("ascii"), user_id, header.duration or 2, header.stream],
+        queue=eeg_queue(user_id, header.stream),
+        ignore_result=True
+    )
 
 def start_consumer():
-    t = threading.Thread(target=consume_loop, daemon=True)
-    t.start()
\ No newline at end of file
+    global runtime
+    runtime = PartitionedConsumer(
+        Consumer(conf),
+        ["eeg.raw.data"],
+        handle_messages,
+        name="eeg-raw-consumer",
+        batch_size=CONSUMER_BATCH_SIZE,
+        batch_timeout=CONSUMER_BATCH_TIMEOUT,
+        retry_backoff=ENQUEUE_RETRY_BACKOFF,
+        dead_letter=dead_letter_topic(get_producer(), EEG_RAW_DLQ_TOPIC),
+    )
+    logging.info("👂 EEG-service consuming 'eeg.raw.data'")
+    runtime.start()
+
+def stop_consumer():
+    """Finish enqueueing fetched messages, commit their offsets and leave the group."""
+    if runtime is not None:
+        runtime.stop()
+    close_producer()
@@ -1,13 +1,20 @@
-from confluent_kafka import Producer
-import os, json, logging
+import os, json, logging, threading
 
-from app.events.kafka_config import get_kafka_config
+from app.events.async_producer import get_producer
 
-producer = Producer(get_kafka_config())
+# Longest a task waits for the broker to acknowledge its processed results
+KAFKA_DELIVERY_TIMEOUT = float(os.getenv("KAFKA_DELIVERY_TIMEOUT", "10.0"))
 
-def send_processed_eeg_event(user_id: int, processed_data: list):
+
+def send_processed_eeg_event(user_id: int, processed_data: list, timeout: float = KAFKA_DELIVERY_TIMEOUT):
     """
     Publishes processed EEG metrics to the 'eeg.processed.data' Kafka topic.
+
+    The message is batched and compressed by the shared producer, but this
+    call waits for the broker's acknowledgement and raises if delivery fails
+    or does not happen within `timeout` seconds, so the calling Celery task
+    is retried instead of being acked with its results lost. A retry may
+    publish the results twice; the consumers store them idempotently.
     """
     topic = "eeg.processed.data"
     payload = {
@@ -16,9 +23,20 @@ def send_processed_eeg_event(user_id: int, processed_data: list):
     }
     value = json.dumps(payload)
 
-    try:
-        producer.produce(topic=topic, value=value)
-        producer.flush()
-        logging.info(f"📤 Published processed EEG data for user {user_id} → {topic}")
-    except Exception as e:
-        logging.exception(f"❌ Failed to publish processed EEG data for user {user_id}: {e}")
+    delivered = threading.Event()
+    errors = []
+
+    def on_delivery(err, msg):
+        if err is not None:
+            errors.append(err)
+        delivered.set()
+
+    # Created lazily so each Celery worker process gets its own producer.
+    # Keyed by user so a user's results stay on one partition, in order.
+    get_producer().produce(topic=topic, value=value, key=str(user_id).encode(), on_delivery=on_delivery)
+
+    if not delivered.wait(timeout):
+        raise TimeoutError(f"processed EEG data for user {user_id} not delivered to {topic} within {timeout}s")
+    if errors:
+        raise errors[0]
+    logging.info(f"📤 Published processed EEG data for user {user_id} → {topic}")
@@ -1,9 +1,10 @@
 from fastapi import FastAPI
-from fastapi.concurrency import asynccontextmanager
+from fastapi.concurrency import asynccontextmanager, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.logging_config import setup_json_logger
 from app.routes import eeg_controller, fft_eeg_controller
-from app.events.kafka_consumer import start_consumer
+from app.events.kafka_consumer import start_consumer, stop_consumer
+from app.utils.s3_raw_backup import close_raw_spool
 from app.core.request_logger import ContextLoggingMiddleware, RequestLoggingMiddleware
 
 
@@ -16,6 +17,10 @@ async def lifespan(app: FastAPI):
     start_consumer()  # ✅ Start consuming from existing topics
     yield
     logger.info("🛑 EEG service shutting down")
+    await run_in_threadpool(stop_consumer)
+    logger.info("🛑 Kafka consumer stopped")
+    await run_in_threadpool(close_raw_spool)
+    logger.info("🛑 Raw EEG spool uploaded")
 
 # Create FastAPI app with lifespan management
 # Performance: Disable automatic OpenAPI docs in production by setting docs_url=None
@@ -9,11 +9,14 @@ PERFORMANCE OPTIMIZATIONS:
 4. Fast enqueue + immediate return pattern
 """
 
+import base64
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import Dict, Any
 from app.schemas.eeg import EEGBatchIn
-from app.tasks.eeg_processing import process_eeg_fft
+from app.tasks.eeg_processing import process_eeg_fft, process_eeg_frame_fft
+from app.core.celery_app import eeg_queue
+from app.utils.eeg_frame import EEG_FRAME_CONTENT_TYPE, check_window_duration, decode_frame
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -24,10 +27,7 @@ logger = logging.getLogger(__name__)
 # ============================================================================
 
 @router.post("/bulk-fft")
-async def create_eeg_records_fft(
-    batch: Dict[str, Any],  # Accept raw dict to skip Pydantic overhead
-    current_user: dict = None
-) -> Dict[str, Any]:
+async def create_eeg_records_fft(request: Request) -> Dict[str, Any]:
     """
     Fast async endpoint: Enqueue EEG processing and return immediately.
     
@@ -46,7 +46,24 @@ async def create_eeg_records_fft(
     
     Alternative to /bulk endpoint - uses lightweight FFT processing
     instead of BrainFlow ML models for faster real-time performance.
+    
+    Accepts either the JSON body {"batch": {...}, "current_user": {...}} or a
+    binary EEG frame (Content-Type: application/x-niura-eeg, see
+    app.utils.eeg_frame) with the user in the X-User-Id header.
     """
+    if request.headers.get("content-type", "").startswith(EEG_FRAME_CONTENT_TYPE):
+        return await _enqueue_eeg_frame(request)
+    
+    # Raw dict body to skip Pydantic overhead
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    batch = payload.get("batch") or {}
+    current_user = payload.get("current_user")
+    
     # Extract user_id (minimal overhead)
     user_id = (
         int(current_user.get("sub"))
@@ -59,14 +76,19 @@ async def create_eeg_records_fft(
     if not records:
         raise HTTPException(status_code=400, detail="No EEG records provided")
     
-    duration = batch.get("duration") or 2
+    try:
+        duration = check_window_duration(batch.get("duration") or 2)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Streaming clients send small consecutive chunks; filter state is kept per user
+    stream = bool(batch.get("stream", False))
     records_count = len(records)
     
     # PERFORMANCE: Pass raw dict directly - no Pydantic conversion
     # Worker will handle validation if needed
     process_eeg_fft.apply_async(
-        args=[records, user_id, duration],
-        queue='eeg_processing',
+        args=[records, user_id, duration, stream],
+        queue=eeg_queue(user_id, stream),
         ignore_result=True
     )
     
@@ -75,14 +97,37 @@ async def create_eeg_records_fft(
         "message": f"EEG records received and queued for FFT processing",
         "records_count": records_count,
         "duration": duration,
-        "processing_method": "FFT",
+        "processing_method": "FFT_STREAM" if stream else "FFT",
         "status": "queued"  # Task submitted successfully
     }
 
 
-# ============================================================================
-# SYNC ENDPOINT - For testing/debugging only
-# ============================================================================
+async def _enqueue_eeg_frame(request: Request) -> Dict[str, Any]:
+    """Validate a binary EEG frame's header and enqueue it for FFT processing."""
+    body = await request.body()
+    try:
+        frame = decode_frame(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    user_id = int(request.headers.get("x-user-id") or frame.user_id)
+    duration = frame.duration or 2
+    
+    # Celery uses the JSON serializer, so the frame travels base64-encoded
+    process_eeg_frame_fft.apply_async(
+        args=[base64.b64encode(body).decode("ascii"), user_id, duration, frame.stream],
+        queue=eeg_queue(user_id, frame.stream),
+        ignore_result=True
+    )
+    
+    return {
+        "message": f"EEG frame received and queued for FFT processing",
+        "records_count": frame.n_samples,
+        "duration": duration,
+        "processing_method": "FFT_STREAM" if frame.stream else "FFT",
+        "status": "queued"
+    }
+
 
 # ============================================================================
 # SYNC ENDPOINT - For testing/debugging only
@@ -100,7 +145,7 @@ async def create_eeg_records_fft_sync(
     WARNING: This endpoint blocks the event loop during processing.
     Use /bulk-fft for production traffic.
     """
-    from app.services.fft_eeg_service import FFTEEGService
+    from app.services.fft_eeg_service import get_fft_service
     
     user_id = (
         int(current_user.get("sub"))
@@ -111,10 +156,13 @@ async def create_eeg_records_fft_sync(
     if not batch.records:
         raise HTTPException(status_code=400, detail="No EEG records provided")
     
-    duration = batch.duration or 2
+    try:
+        duration = check_window_duration(batch.duration or 2)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Process synchronously (blocks event loop - testing only)
-    service = FFTEEGService()
+    service = get_fft_service(duration=duration)
     records_data = [rec.model_dump() for rec in batch.records]
     processed_records = service.process_eeg_records(records_data, duration)
     
@@ -6,17 +6,54 @@ Fast, lightweight alternative to BrainFlow-based processing
 import numpy as np
 from scipy import signal
 from scipy.integrate import simpson
-from typing import Dict, List
-from datetime import datetime
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
 import logging
+import os
+from threading import Lock
+
+from app.utils.eeg_frame import SUPPORTED_SAMPLE_RATES, check_window_duration
+from app.services.stream_state import (
+    StreamOrderError,
+    StreamStateConflict,
+    StreamStateStore,
+    get_stream_state_store,
+)
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_BANDS = {
+    'delta': [0.5, 4.0],
+    'theta': [4.0, 8.0],
+    'alpha': [8.0, 13.0],
+    'beta': [13.0, 30.0],
+    'gamma': [30.0, 45.0]
+}
+
+# Loads of a user's stream state before a batch gives up on concurrent updates
+STREAM_STATE_MAX_ATTEMPTS = 5
+# A batch starting more than this after the stream's last sample restarts the
+# stream instead of filtering across the missing samples
+STREAM_MAX_GAP_SECONDS = float(os.getenv("EEG_STREAM_MAX_GAP_SECONDS", "1.0"))
+
+
+def _parse_timestamp(ts: str) -> datetime:
+    """Parse an ISO sample timestamp; naive timestamps are taken as UTC."""
+    try:
+        parsed = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        raise StreamOrderError(f"Cannot order stream batch by timestamp {ts!r}")
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
 class FFTEEGService:
-    def __init__(self):
+    def __init__(self, fs: int = 250, bands: Optional[Dict[str, List[float]]] = None):
         # Configuration (matching fft_code/config.json)
-        self.fs = 250  # Sample rate
+        self.fs = fs  # Sample rate
         self.vref = 4.5
         self.gain = 24
         self.adc_bits = 24
@@ -34,13 +71,10 @@ class FFTEEGService:
         self.overlap_ratio = 0.5
         
         # Band definitions
-        self.bands = {
-            'delta': [0.5, 4.0],
-            'theta': [4.0, 8.0],
-            'alpha': [8.0, 13.0],
-            'beta': [13.0, 30.0],
-            'gamma': [30.0, 45.0]
-        }
+        self.bands = dict(bands or DEFAULT_BANDS)
+        
+        # Per-window-length Welch taper and band masks (see _window_plan)
+        self._plans = {}
         
         # Initialize filters
         self._init_filters()
@@ -61,10 +95,17 @@ class FFTEEGService:
         for freq in self.notch_freqs:
             b, a = signal.iirnotch(freq, self.notch_q, self.fs)
             self.notch_coeffs.append((b, a))
+
+        # Causal cascade (bandpass + notches) for the streaming path
+        bp_sos = signal.butter(self.bandpass_order, [low, high], btype='band', output='sos')
+        notch_sos = [signal.tf2sos(b, a) for b, a in self.notch_coeffs]
+        self.stream_sos = np.vstack([bp_sos] + notch_sos)
+        self.stream_zi = signal.sosfilt_zi(self.stream_sos)
     
     def _adc_to_uv(self, data: np.ndarray) -> np.ndarray:
         """Convert ADC counts to microvolts."""
-        data_uv = data.astype(np.float64) * self.scale_factor
+        # C order so channel-major (binary frame) input filters identically
+        data_uv = data.astype(np.float64, order='C') * self.scale_factor
         # Remove DC offset
         data_uv -= np.mean(data_uv, axis=0, keepdims=True)
         return data_uv
@@ -80,6 +121,17 @@ class FFTEEGService:
             data = signal.filtfilt(b, a, data, axis=0)
         return data
     
+    def _filter_data_streaming(self, data: np.ndarray, zi: Optional[np.ndarray] = None):
+        """
+        Apply bandpass and notch filters causally, carrying filter state.
+
+        Returns the filtered batch and the final state to pass in with the
+        next batch. A new stream is started in steady state on its first sample.
+        """
+        if zi is None:
+            zi = self.stream_zi[:, :, np.newaxis] * data[0][np.newaxis, np.newaxis, :]
+        return signal.sosfilt(self.stream_sos, data, axis=0, zi=zi)
+
     def _remove_artifacts(self, data: np.ndarray) -> np.ndarray:
         """Simple artifact removal using interpolation."""
         data = data.copy()
@@ -113,25 +165,72 @@ class FFTEEGService:
         
         return data
     
+    def _window_plan(self, window_samples: int) -> Dict:
+        """
+        Return the precomputed analysis plan for a window length.
+
+        Holds the Welch segment length, its Hann taper and the bands x freqs
+        mask matrix, so they are built once per service rather than per call.
+        """
+        plan = self._plans.get(window_samples)
+        if plan is None:
+            nperseg = min(int(self.window_sec * self.fs), window_samples)
+            freqs = np.fft.rfftfreq(nperseg, 1.0 / self.fs)
+            plan = {
+                'nperseg': nperseg,
+                'taper': signal.get_window('hann', nperseg),
+                'band_masks': np.array([(freqs >= low) & (freqs <= high) for low, high in self.bands.values()]),
+            }
+            self._plans[window_samples] = plan
+        return plan
+
+    def prepare(self, duration: int) -> None:
+        """Build the analysis plan for a window duration ahead of the first batch."""
+        self._window_plan(int(duration * self.fs))
+
+    def _compute_bandpowers_batch(self, windows: np.ndarray):
+        """
+        Compute absolute and relative band powers for many windows at once.
+
+        Args:
+            windows: n_windows x window_samples array (channel-averaged signal)
+
+        Returns:
+            (absolute, relative, dominant) where the first two are
+            n_windows x n_bands arrays in self.bands order and dominant is a
+            list of band names.
+        """
+        n_windows, window_samples = windows.shape
+        band_names = list(self.bands)
+
+        plan = self._window_plan(window_samples)
+        freqs, psd = signal.welch(windows, fs=self.fs, window=plan['taper'], nperseg=plan['nperseg'], axis=-1)
+        freq_res = freqs[1] - freqs[0] if len(freqs) > 1 else 1.0
+        total_power = simpson(psd, dx=freq_res, axis=-1)
+
+        absolute = np.zeros((n_windows, len(band_names)))
+        for b, idx in enumerate(plan['band_masks']):
+            if np.any(idx):
+                absolute[:, b] = simpson(psd[:, idx], dx=freq_res, axis=-1)
+
+        relative = np.zeros_like(absolute)
+        positive = total_power > 0
+        relative[positive] = absolute[positive] / total_power[positive, np.newaxis]
+
+        dominant = [band_names[i] for i in np.argmax(relative, axis=1)] if band_names else ['unknown'] * n_windows
+        return absolute, relative, dominant
+
     def _compute_bandpowers(self, data: np.ndarray) -> Dict:
         """Compute absolute and relative band powers."""
         if data.ndim > 1:
             data = np.mean(data, axis=1)
-        
-        nperseg = min(int(self.window_sec * self.fs), len(data))
-        freqs, psd = signal.welch(data, fs=self.fs, nperseg=nperseg)
-        freq_res = freqs[1] - freqs[0] if len(freqs) > 1 else 1.0
-        total_power = simpson(psd, dx=freq_res)
-        
-        absolute, relative = {}, {}
-        for band, (low, high) in self.bands.items():
-            idx = (freqs >= low) & (freqs <= high)
-            power = simpson(psd[idx], dx=freq_res) if np.any(idx) else 0.0
-            absolute[band] = float(power)
-            relative[band] = float(power / total_power) if total_power > 0 else 0.0
-        
-        dominant = max(relative, key=relative.get) if relative else 'unknown'
-        return {'absolute': absolute, 'relative': relative, 'dominant': dominant}
+
+        absolute, relative, dominant = self._compute_bandpowers_batch(data[np.newaxis, :])
+        return {
+            'absolute': {band: float(v) for band, v in zip(self.bands, absolute[0])},
+            'relative': {band: float(v) for band, v in zip(self.bands, relative[0])},
+            'dominant': dominant[0],
+        }
     
     def _compute_metrics(self, bp: Dict) -> Dict:
         """Compute cognitive metrics from band powers."""
@@ -165,6 +264,65 @@ class FFTEEGService:
             'drowsiness': scale_to_0_100(drowsiness_ratio, [0.3, 3.0]),
         }
     
+    @staticmethod
+    def _records_to_array(records: List[Dict]) -> np.ndarray:
+        """Stack the 'eeg' field of dict or Pydantic records into a samples x channels array."""
+        if isinstance(records[0], dict):
+            return np.array([r['eeg'] for r in records], dtype=np.int32)
+        return np.array([r.eeg for r in records], dtype=np.int32)
+
+    @staticmethod
+    def _record_timestamps(records: List[Dict]) -> List[str]:
+        """Return record timestamps as ISO strings."""
+        if isinstance(records[0], dict):
+            timestamps = [r['timestamp'] for r in records]
+        else:
+            timestamps = [r.timestamp for r in records]
+        return [ts.isoformat() if isinstance(ts, datetime) else ts for ts in timestamps]
+
+    def _window_step(self, duration: int) -> int:
+        """Number of samples between consecutive window starts."""
+        return int(int(duration * self.fs) * (1 - self.overlap_ratio))
+
+    def _window_records(self, data_clean: np.ndarray, timestamps: List[str], duration: int) -> List[Dict]:
+        """Run band power and metric computation over overlapping windows."""
+        window_samples = int(duration * self.fs)
+        step = self._window_step(duration)
+        n_samples = data_clean.shape[0]
+
+        if n_samples < window_samples:
+            return []
+
+        if data_clean.ndim > 1:
+            data_clean = np.mean(data_clean, axis=1)
+
+        # All overlapping windows as a strided view, analysed in one batch
+        windows = sliding_window_view(data_clean, window_samples)[::step]
+        _, relative, dominant = self._compute_bandpowers_batch(windows)
+
+        processed_records = []
+        for i in range(windows.shape[0]):
+            rel = {band: float(v) for band, v in zip(self.bands, relative[i])}
+
+            # Compute metrics
+            metrics = self._compute_metrics(rel)
+
+            # Use timestamp from middle of window
+            timestamp = timestamps[i * step + window_samples // 2]
+
+            processed_records.append({
+                'timestamp': timestamp,
+                'focus_label': metrics['focus'],  # Named _label to match existing format
+                'stress_label': metrics['stress'],
+                'wellness_label': metrics['mental_readiness'],
+                'engagement': metrics['engagement'],
+                'drowsiness': metrics['drowsiness'],
+                'bandpowers': {k: round(v * 100, 2) for k, v in rel.items()},
+                'dominant_band': dominant[i]
+            })
+
+        return processed_records
+
     def process_eeg_records(self, records: List[Dict], duration: int = 2) -> List[Dict]:
         """
         Process EEG records and return metrics.
@@ -176,13 +334,20 @@ class FFTEEGService:
         Returns:
             List of processed records with metrics and band powers
         """
+        # Convert records to numpy array
+        # Handle both dict and Pydantic model inputs
+        return self.process_eeg_array(
+            self._records_to_array(records), self._record_timestamps(records), duration
+        )
+
+    def process_eeg_array(self, eeg_data: np.ndarray, timestamps: List[str], duration: int = 2) -> List[Dict]:
+        """
+        Process a samples x channels array of ADC counts and return metrics.
+
+        Entry point shared by JSON records and binary frames; timestamps holds
+        one ISO string per sample.
+        """
         try:
-            # Convert records to numpy array
-            # Handle both dict and Pydantic model inputs
-            if isinstance(records[0], dict):
-                eeg_data = np.array([r['eeg'] for r in records], dtype=np.int32)
-            else:
-                eeg_data = np.array([r.eeg for r in records], dtype=np.int32)
             n_samples, n_channels = eeg_data.shape
             
             logger.info(f"Processing {n_samples} samples, {n_channels} channels with FFT pipeline")
@@ -197,50 +362,7 @@ class FFTEEGService:
             data_clean = self._remove_artifacts(data_filt)
             
             # Step 4: Window-based analysis
-            window_samples = int(duration * self.fs)
-            step = int(window_samples * (1 - self.overlap_ratio))
-            
-            processed_records = []
-            start = 0
-            
-            while start + window_samples <= n_samples:
-                window_data = data_clean[start:start + window_samples]
-                
-                # Compute band powers
-                bp_result = self._compute_bandpowers(window_data)
-                
-                # Compute metrics
-                metrics = self._compute_metrics(bp_result['relative'])
-                
-                # Use timestamp from middle of window
-                mid_idx = start + window_samples // 2
-                # Handle both dict and Pydantic model inputs
-                if isinstance(records[0], dict):
-                    timestamp = (
-                        records[mid_idx]['timestamp']
-                        if mid_idx < len(records)
-                        else records[-1]['timestamp']
-                    )
-                else:
-                    timestamp = (
-                        records[mid_idx].timestamp
-                        if mid_idx < len(records)
-                        else records[-1].timestamp
-                    )
-
-                
-                processed_records.append({
-                    'timestamp': timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
-                    'focus_label': metrics['focus'],  # Named _label to match existing format
-                    'stress_label': metrics['stress'],
-                    'wellness_label': metrics['mental_readiness'],
-                    'engagement': metrics['engagement'],
-                    'drowsiness': metrics['drowsiness'],
-                    'bandpowers': {k: round(v * 100, 2) for k, v in bp_result['relative'].items()},
-                    'dominant_band': bp_result['dominant']
-                })
-                
-                start += step
+            processed_records = self._window_records(data_clean, timestamps, duration)
             
             logger.info(f"Generated {len(processed_records)} processed records")
             return processed_records
@@ -248,4 +370,177 @@ class FFTEEGService:
         except Exception as e:
             logger.error(f"Error in FFT processing: {e}", exc_info=True)
             raise
-            
\ No newline at end of file
+
+    def process_eeg_stream(
+        self,
+        user_id: int,
+        records: List[Dict],
+        duration: int = 2,
+        state_store: Optional[StreamStateStore] = None,
+        batch_id: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Process one batch of a user's continuous stream.
+
+        Unlike process_eeg_records, filtering is causal and resumes from the
+        state left by the previous batch, and samples that did not complete a
+        window are carried over, so batches can be small and need no overlap.
+        Only the new samples are filtered on each call.
+
+        batch_id identifies the batch across retries: a batch whose state was
+        already saved returns its earlier output instead of advancing the
+        stream a second time.
+
+        A batch must start after the stream's last sample: an earlier one
+        raises StreamOrderError, and one that starts more than
+        STREAM_MAX_GAP_SECONDS later restarts the stream.
+        """
+        return self.process_eeg_stream_array(
+            user_id, self._records_to_array(records), self._record_timestamps(records),
+            duration, state_store, batch_id,
+        )
+
+    def process_eeg_stream_array(
+        self,
+        user_id: int,
+        eeg_data: np.ndarray,
+        timestamps: List[str],
+        duration: int = 2,
+        state_store: Optional[StreamStateStore] = None,
+        batch_id: Optional[str] = None,
+    ) -> List[Dict]:
+        """Array form of process_eeg_stream, shared by JSON records and binary frames."""
+        try:
+            store = state_store or get_stream_state_store()
+
+            for attempt in range(1, STREAM_STATE_MAX_ATTEMPTS + 1):
+                state = store.load(user_id)
+                version = state["version"] if state is not None else 0
+                applied = state["applied"] if state is not None else []
+
+                if batch_id is not None:
+                    for applied_id, applied_records in applied:
+                        if applied_id == batch_id:
+                            logger.info(f"Batch {batch_id} of user {user_id} already streamed, returning its records")
+                            return applied_records
+
+                try:
+                    return self._stream_batch(
+                        user_id, eeg_data, timestamps, duration, store, state, version, applied, batch_id
+                    )
+                except StreamStateConflict as e:
+                    logger.warning(
+                        f"Concurrent update of stream state for user {user_id} "
+                        f"(attempt {attempt}/{STREAM_STATE_MAX_ATTEMPTS}): {e}"
+                    )
+
+            raise StreamStateConflict(
+                f"Stream state of user {user_id} kept changing, gave up after {STREAM_STATE_MAX_ATTEMPTS} attempts"
+            )
+
+        except Exception as e:
+            logger.error(f"Error in streaming FFT processing for user {user_id}: {e}", exc_info=True)
+            raise
+
+    def _stream_batch(
+        self,
+        user_id: int,
+        eeg_data: np.ndarray,
+        timestamps: List[str],
+        duration: int,
+        store: StreamStateStore,
+        state: Optional[Dict],
+        version: int,
+        applied: List[list],
+        batch_id: Optional[str],
+    ) -> List[Dict]:
+        """Run one batch from `state` and save the result if it is still at `version`."""
+        n_samples, n_channels = eeg_data.shape
+
+        if state is not None and state["zi"].shape[-1] != n_channels:
+            logger.warning(f"Channel count changed for user {user_id}, restarting stream")
+            state = None
+        elif state is not None and state["fs"] != self.fs:
+            # zi and the carried-over samples belong to the old rate
+            logger.warning(f"Sample rate changed for user {user_id} ({state['fs']} -> {self.fs} Hz), restarting stream")
+            state = None
+
+        if state is not None and state["last_timestamp"] is not None:
+            gap = (_parse_timestamp(timestamps[0]) - _parse_timestamp(state["last_timestamp"])).total_seconds()
+            if gap <= 0:
+                # Already past this point: applying it would run zi and the
+                # tail over out-of-order samples
+                raise StreamOrderError(
+                    f"Stream batch of user {user_id} starts at {timestamps[0]}, "
+                    f"not after the last streamed sample {state['last_timestamp']}"
+                )
+            if gap > STREAM_MAX_GAP_SECONDS:
+                logger.warning(f"{gap:.2f} s gap in stream of user {user_id}, restarting stream")
+                state = None
+
+        # Step 1: Convert to microvolts (no per-batch DC removal; the
+        # bandpass handles DC and a per-batch mean would step at boundaries)
+        data_uv = eeg_data.astype(np.float64, order='C') * self.scale_factor
+
+        # Step 2: Filter, resuming from the previous batch's state
+        data_filt, zi = self._filter_data_streaming(
+            data_uv, state["zi"] if state is not None else None
+        )
+
+        # Step 3: Remove artifacts
+        data_clean = self._remove_artifacts(data_filt)
+
+        # Prepend samples that did not fill a window last time
+        if state is not None and len(state["tail"]):
+            data_clean = np.vstack([state["tail"], data_clean])
+            timestamps = state["timestamps"] + timestamps
+
+        # Step 4: Window-based analysis
+        processed_records = self._window_records(data_clean, timestamps, duration)
+
+        # Keep everything from the next window start onward (< one window)
+        consumed = len(processed_records) * self._window_step(duration)
+        if batch_id is not None:
+            applied = applied + [[batch_id, processed_records]]
+        store.save(
+            user_id, zi, data_clean[consumed:], timestamps[consumed:],
+            fs=self.fs, last_timestamp=timestamps[-1], version=version, applied=applied,
+        )
+
+        logger.info(
+            f"Streamed {n_samples} samples for user {user_id}: "
+            f"{len(processed_records)} records, {data_clean.shape[0] - consumed} samples carried over"
+        )
+        return processed_records
+
+
+# Process-wide pipeline instances, keyed by (sample rate, bands, duration);
+# bounded by the supported sample rates and window lengths
+_service_registry: Dict[tuple, FFTEEGService] = {}
+_registry_lock = Lock()
+
+
+def get_fft_service(fs: int = 250, bands: Optional[Dict[str, List[float]]] = None, duration: int = 2) -> FFTEEGService:
+    """
+    Return a shared FFTEEGService for the given configuration.
+
+    Filter design and window plans are built on first use and then reused by
+    every task and request in the process. Only SUPPORTED_SAMPLE_RATES and
+    windows of up to MAX_WINDOW_SECONDS are accepted (ValueError otherwise),
+    which also bounds the number of cached pipelines.
+    """
+    if fs not in SUPPORTED_SAMPLE_RATES:
+        raise ValueError(f"Unsupported EEG sample rate {fs} Hz")
+    duration = check_window_duration(duration)
+    bands = bands or DEFAULT_BANDS
+    key = (fs, tuple((name, tuple(edges)) for name, edges in bands.items()), duration)
+
+    service = _service_registry.get(key)
+    if service is None:
+        with _registry_lock:
+            service = _service_registry.get(key)
+            if service is None:
+                service = FFTEEGService(fs=fs, bands=bands)
+                service.prepare(duration)
+                _service_registry[key] = service
+    return service
@@ -0,0 +1,137 @@
+"""
+Per-user state for the streaming FFT pipeline.
+
+Stores the IIR filter state (zi) and the trailing samples that have not yet
+filled a full analysis window, so consecutive batches for a user are filtered
+as one continuous signal. Kept in Redis so it survives whichever Celery worker
+process picks up the next batch.
+
+Every saved state carries a version, and save() only succeeds if the state is
+still the version that was loaded (WATCH/MULTI), so two batches of one user
+processed at the same time cannot both build on the same filter state: the
+loser gets StreamStateConflict and recomputes from the winner's state. The
+outputs of the last few batches are kept with their batch id, so a retried
+batch (e.g. a Celery retry after the state was saved) is answered from there
+instead of being applied twice.
+
+The state also records the timestamp of the last sample fed in, so a batch
+that does not continue the stream is caught before it touches the filter
+state (see FFTEEGService.process_eeg_stream).
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# A stream that has been idle this long starts again from a fresh filter state
+STREAM_STATE_TTL = int(os.getenv("EEG_STREAM_STATE_TTL", "30"))
+# Batch ids (with their output) remembered per user for retried batches
+STREAM_STATE_REPLAY_BATCHES = int(os.getenv("EEG_STREAM_STATE_REPLAY_BATCHES", "8"))
+
+
+class StreamStateConflict(Exception):
+    """The user's state changed between load() and save()."""
+
+
+class StreamOrderError(ValueError):
+    """A batch does not follow the last sample of the user's stream."""
+
+
+class StreamStateStore:
+    """Redis-backed store for per-user streaming filter state."""
+
+    def __init__(self, url: str = REDIS_URL, ttl: int = STREAM_STATE_TTL):
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f"eeg:stream:{user_id}"
+
+    def load(self, user_id) -> Optional[Dict[str, Any]]:
+        """
+        Return the saved state for a user, or None if the stream is new or expired.
+
+        The state holds zi, tail, timestamps, fs, last_timestamp (of the last
+        sample fed in), version and applied (a list of [batch_id, records] for
+        the most recent batches).
+        """
+        raw = self._client.get(self._key(user_id))
+        if raw is None:
+            return None
+
+        state = json.loads(raw)
+        zi = np.asarray(state["zi"], dtype=np.float64)
+        tail = np.asarray(state["tail"], dtype=np.float64).reshape(-1, zi.shape[-1])
+        return {
+            "zi": zi,
+            "tail": tail,
+            "timestamps": state["timestamps"],
+            "fs": state.get("fs"),
+            "last_timestamp": state.get("last_timestamp"),
+            "version": state.get("version", 0),
+            "applied": state.get("applied", []),
+        }
+
+    def save(
+        self,
+        user_id,
+        zi: np.ndarray,
+        tail: np.ndarray,
+        timestamps: List[str],
+        fs: int,
+        last_timestamp: str,
+        version: int,
+        applied: List[list],
+    ) -> None:
+        """
+        Persist filter state and the unconsumed trailing samples for a user.
+
+        version is the version the state was computed from (0 for a new
+        stream); raises StreamStateConflict if the stored state has moved on.
+        """
+        key = self._key(user_id)
+        value = json.dumps({
+            "zi": zi.tolist(),
+            "tail": tail.tolist(),
+            "timestamps": list(timestamps),
+            "fs": fs,
+            "last_timestamp": last_timestamp,
+            "version": version + 1,
+            "applied": applied[-STREAM_STATE_REPLAY_BATCHES:],
+        })
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                current = json.loads(raw).get("version", 0) if raw is not None else 0
+                if current != version:
+                    raise StreamStateConflict(f"stream state of user {user_id} is at version {current}, not {version}")
+                pipe.multi()
+                pipe.set(key, value, ex=self.ttl)
+                pipe.execute()
+            except redis.WatchError:
+                raise StreamStateConflict(f"stream state of user {user_id} changed while saving")
+
+    def reset(self, user_id) -> None:
+        """Drop a user's state so the next batch starts a new stream."""
+        self._client.delete(self._key(user_id))
+
+
+_store: Optional[StreamStateStore] = None
+
+
+def get_stream_state_store() -> StreamStateStore:
+    """Return the process-wide state store, creating it on first use."""
+    global _store
+    if _store is None:
+        _store = StreamStateStore()
+    return _store
@@ -3,17 +3,40 @@ Celery tasks for CPU-intensive EEG processing.
 Offloads FFT computation and ML inference from web workers.
 """
 
+import base64
 import logging
+import os
 from typing import List, Dict, Any
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.core.celery_app import celery_app
-from app.services.fft_eeg_service import FFTEEGService
+from app.services.fft_eeg_service import get_fft_service
+from app.services.stream_state import StreamOrderError
 from app.events.kafka_producer import send_processed_eeg_event
+from app.events.async_producer import close_producer
+from app.utils.eeg_frame import check_window_duration, decode_frame
 
 logger = logging.getLogger(__name__)
 
+# Window durations to build pipelines for when a worker process starts
+PRELOAD_DURATIONS = [int(d) for d in os.getenv("EEG_FFT_PRELOAD_DURATIONS", "2").split(",") if d.strip()]
+
+
+@worker_process_init.connect
+def preload_fft_services(**kwargs):
+    """Design filters and window plans once per worker process, not per task."""
+    for duration in PRELOAD_DURATIONS:
+        get_fft_service(duration=duration)
+    logger.info(f"🔧 FFT pipelines ready for durations {PRELOAD_DURATIONS}")
+
+
+@worker_process_shutdown.connect
+def flush_kafka_producer(**kwargs):
+    """Deliver processed results still queued in the Kafka producer before the process exits."""
+    close_producer()
+
 
 @celery_app.task(name="process_eeg_fft", bind=True, max_retries=3)
-def process_eeg_fft(self, records: List[Dict[str, Any]], user_id: int, duration: int):
+def process_eeg_fft(self, records: List[Dict[str, Any]], user_id: int, duration: int, stream: bool = False):
     """
     Background task: Process EEG records using FFT pipeline.
     
@@ -24,18 +47,30 @@ def process_eeg_fft(self, records: List[Dict[str, Any]], user_id: int, duration:
         records: List of raw EEG record dictionaries
         user_id: User identifier
         duration: Processing window duration in seconds
+        stream: Treat the batch as the next chunk of the user's continuous
+            stream (causal filtering with state carried between batches)
     
     Returns:
         dict: Processing result summary
     """
+    try:
+        duration = check_window_duration(duration)
+    except ValueError as e:
+        # Invalid window: retrying will not help
+        logger.error(f"❌ Invalid EEG batch for user {user_id}: {e}")
+        raise
+
     try:
         logger.info(f"🔄 Starting FFT processing for user {user_id}, {len(records)} records")
         
-        # Initialize service (happens in worker process)
-        service = FFTEEGService()
+        # Shared per-process pipeline (filters designed at worker start)
+        service = get_fft_service(duration=duration)
         
         # CPU-intensive processing happens here
-        processed_records = service.process_eeg_records(records, duration)
+        if stream:
+            processed_records = service.process_eeg_stream(user_id, records, duration, batch_id=self.request.id)
+        else:
+            processed_records = service.process_eeg_records(records, duration)
         
         # Publish results to Kafka
         if processed_records:
@@ -49,7 +84,73 @@ def process_eeg_fft(self, records: List[Dict[str, Any]], user_id: int, duration:
             "records_received": len(records)
         }
         
+    except StreamOrderError as e:
+        # Out-of-order batch: applying it later would not put it back in order
+        logger.error(f"❌ Rejected EEG stream batch for user {user_id}: {e}")
+        raise
+
     except Exception as e:
         logger.exception(f"❌ Error in FFT processing for user {user_id}: {e}")
         # Retry with exponential backoff
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+
+@celery_app.task(name="process_eeg_frame_fft", bind=True, max_retries=3)
+def process_eeg_frame_fft(self, frame_b64: str, user_id: int, duration: int, stream: bool = False):
+    """
+    Background task: Process a binary EEG frame using the FFT pipeline.
+
+    Same as process_eeg_fft, but the samples arrive as a base64-encoded binary
+    frame (see app.utils.eeg_frame) and are decoded straight into NumPy,
+    skipping per-sample JSON parsing.
+
+    Args:
+        frame_b64: Base64-encoded binary EEG frame
+        user_id: User identifier
+        duration: Processing window duration in seconds
+        stream: Treat the frame as the next chunk of the user's continuous stream
+
+    Returns:
+        dict: Processing result summary
+    """
+    try:
+        frame = decode_frame(base64.b64decode(frame_b64))
+        duration = check_window_duration(duration)
+    except ValueError as e:
+        # Malformed frame: retrying will not help
+        logger.error(f"❌ Invalid EEG frame for user {user_id}: {e}")
+        raise
+
+    try:
+        logger.info(f"🔄 Starting FFT processing for user {user_id}, {frame.n_samples} samples (binary frame)")
+
+        # decode_frame only accepts supported (integral) sample rates
+        service = get_fft_service(fs=int(frame.sample_rate), duration=duration)
+        timestamps = frame.timestamps()
+
+        if stream:
+            processed_records = service.process_eeg_stream_array(
+                user_id, frame.data, timestamps, duration, batch_id=self.request.id
+            )
+        else:
+            processed_records = service.process_eeg_array(frame.data, timestamps, duration)
+
+        if processed_records:
+            send_processed_eeg_event(user_id, processed_records)
+            logger.info(f"✅ Published {len(processed_records)} FFT-processed records to Kafka for user {user_id}")
+
+        return {
+            "status": "success",
+            "user_id": user_id,
+            "records_processed": len(processed_records),
+            "records_received": frame.n_samples
+        }
+
+    except StreamOrderError as e:
+        # Out-of-order batch: applying it later would not put it back in order
+        logger.error(f"❌ Rejected EEG stream batch for user {user_id}: {e}")
+        raise
+
+    except Exception as e:
+        logger.exception(f"❌ Error in FFT processing for user {user_id}: {e}")
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
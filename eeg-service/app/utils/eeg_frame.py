@@ -0,0 +1,141 @@
+"""
+Binary columnar EEG frame format.
+
+Compact alternative to JSON sample lists for /ws/eeg and /bulk-fft. A frame is
+a fixed 40-byte little-endian header followed by the sample matrix stored
+channel-major (all samples of channel 0, then channel 1, ...), which decodes
+into NumPy without copying.
+
+    offset  size  field
+    0       4     magic b"NEEG"
+    4       1     version (1)
+    5       1     dtype (0 = int32 ADC counts, 1 = float32)
+    6       1     flags (bit 0 = chunk of a continuous stream)
+    7       1     processing window in seconds (0 = server default)
+    8       2     n_channels
+    10      2     reserved
+    12      4     n_samples
+    16      4     sample rate in Hz (float32)
+    20      8     start time, microseconds since Unix epoch (UTC)
+    28      8     user_id (0 if not known to the client)
+    36      4     sample_index of the first sample
+    40      ...   n_channels x n_samples values
+"""
+
+import os
+import struct
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+EEG_FRAME_CONTENT_TYPE = "application/x-niura-eeg"
+
+MAGIC = b"NEEG"
+VERSION = 1
+FLAG_STREAM = 0x01
+
+HEADER = struct.Struct("<4sBBBBHxxIfqqI")
+
+DTYPES = {
+    0: np.dtype("<i4"),
+    1: np.dtype("<f4"),
+}
+
+# Sample rates the FFT pipeline accepts: each is above twice the 45 Hz
+# bandpass edge, and one filter design is cached per rate and window length
+SUPPORTED_SAMPLE_RATES = frozenset(
+    int(rate) for rate in os.getenv("EEG_SUPPORTED_SAMPLE_RATES", "125,128,200,250,256,500,512,1000").split(",")
+    if rate.strip()
+)
+MAX_WINDOW_SECONDS = int(os.getenv("EEG_MAX_WINDOW_SECONDS", "10"))
+
+
+@dataclass
+class EEGFrame:
+    user_id: int
+    start_time_us: int
+    sample_rate: float
+    first_sample_index: int
+    duration: int
+    stream: bool
+    data: np.ndarray  # n_samples x n_channels view over the frame buffer
+
+    @property
+    def n_samples(self) -> int:
+        return self.data.shape[0]
+
+    def timestamps(self) -> List[str]:
+        """ISO timestamps for every sample, derived from start time and sample rate."""
+        start = np.datetime64(self.start_time_us, "us")
+        offsets = np.round(np.arange(self.n_samples) * (1e6 / self.sample_rate)).astype("timedelta64[us]")
+        return np.datetime_as_string(start + offsets, unit="us").tolist()
+
+
+def decode_frame(buf: bytes) -> EEGFrame:
+    """Parse a binary frame. Raises ValueError if the buffer is not a valid frame."""
+    if len(buf) < HEADER.size:
+        raise ValueError(f"EEG frame too short: {len(buf)} bytes")
+
+    (magic, version, dtype_code, flags, duration, n_channels, n_samples,
+     sample_rate, start_time_us, user_id, first_sample_index) = HEADER.unpack_from(buf)
+
+    if magic != MAGIC:
+        raise ValueError("Not an EEG frame (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported EEG frame version {version}")
+    if dtype_code not in DTYPES:
+        raise ValueError(f"Unsupported EEG frame dtype {dtype_code}")
+    if n_channels == 0 or n_samples == 0:
+        raise ValueError("EEG frame has no samples")
+    if sample_rate not in SUPPORTED_SAMPLE_RATES:
+        raise ValueError(f"Unsupported EEG sample rate {sample_rate} Hz; expected one of {sorted(SUPPORTED_SAMPLE_RATES)}")
+    if duration:
+        check_window_duration(duration)
+
+    dtype = DTYPES[dtype_code]
+    count = n_channels * n_samples
+    if len(buf) != HEADER.size + count * dtype.itemsize:
+        raise ValueError(
+            f"EEG frame size mismatch: expected {HEADER.size + count * dtype.itemsize} bytes, got {len(buf)}"
+        )
+
+    matrix = np.frombuffer(buf, dtype=dtype, count=count, offset=HEADER.size)
+    return EEGFrame(
+        user_id=user_id,
+        start_time_us=start_time_us,
+        sample_rate=float(sample_rate),
+        first_sample_index=first_sample_index,
+        duration=duration,
+        stream=bool(flags & FLAG_STREAM),
+        data=matrix.reshape(n_channels, n_samples).T,
+    )
+
+
+def check_window_duration(duration) -> int:
+    """Return the processing window length in seconds. Raises ValueError if it is not 1..MAX_WINDOW_SECONDS."""
+    if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration != int(duration):
+        raise ValueError(f"Invalid EEG window duration {duration!r}")
+    if not 1 <= duration <= MAX_WINDOW_SECONDS:
+        raise ValueError(f"EEG window duration must be 1-{MAX_WINDOW_SECONDS} seconds, got {duration}")
+    return int(duration)
+
+
+def encode_frame(
+    data: np.ndarray,
+    start_time_us: int,
+    sample_rate: float,
+    user_id: int = 0,
+    first_sample_index: int = 0,
+    duration: int = 0,
+    stream: bool = False,
+) -> bytes:
+    """Build a frame from an n_samples x n_channels array (int32 or float32)."""
+    dtype_code = 0 if np.issubdtype(data.dtype, np.integer) else 1
+    n_samples, n_channels = data.shape
+    header = HEADER.pack(
+        MAGIC, VERSION, dtype_code, FLAG_STREAM if stream else 0, duration,
+        n_channels, n_samples, sample_rate, start_time_us, user_id, first_sample_index,
+    )
+    body = np.ascontiguousarray(data.T, dtype=DTYPES[dtype_code])
+    return header + body.tobytes()
@@ -1,23 +1,423 @@
+"""
+Raw EEG archival to S3 through a local spool.
+
+The Kafka consumer appends each raw payload to a per-user, gzip-compressed
+spool file on local disk instead of PUTting one small object per message.
+A background thread rolls a file into an S3 object once it reaches
+RAW_EEG_SPOOL_MAX_BYTES or RAW_EEG_SPOOL_MAX_AGE seconds, and uploads it
+with retries; files are deleted only after a successful upload, and files
+left behind by a crashed process are uploaded on the next start.
+
+Appends are sync-flushed to disk once RAW_EEG_SPOOL_FLUSH_BYTES of input has
+built up or RAW_EEG_SPOOL_FLUSH_INTERVAL seconds have passed, not per
+message, which would cost a deflate block and a write() each. A crash loses
+at most the unflushed tail; the unclosed files it leaves lack the gzip
+trailer, so on recovery their readable prefix, cut back to the last whole
+record, is re-compressed into a valid gzip file before upload.
+
+Kafka offsets are committed once a payload is in the spool, so the spool
+directory must survive container restarts (docker-compose mounts a volume
+there). It is capped at RAW_EEG_SPOOL_MAX_DISK_BYTES: past that, append()
+raises SpoolFull and the consumer retries the message instead of
+committing it. A file that fails to upload does not hold up the others; after
+RAW_EEG_UPLOAD_MAX_ATTEMPTS failures it is moved to the spool's failed/
+directory and logged, to be dealt with by hand.
+
+Objects (per user, one per rolled file):
+    raw/user-<id>/<first>_<last>.ndjson.gz   JSON payloads, one per line
+    raw/user-<id>/<first>_<last>.neeg.gz     concatenated binary EEG frames
+
+S3_ENDPOINT_URL points the client at a local S3 stand-in (MinIO, moto
+server); tests can also pass their own client to RawEEGSpool.
+"""
+
 import boto3, json, datetime, os
+import gzip
+import logging
+import socket
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
 
-s3 = boto3.client("s3")
+from app.utils.eeg_frame import DTYPES, HEADER, MAGIC
+
+logger = logging.getLogger(__name__)
 
 RAW_BUCKET = os.getenv("RAW_EEG_BUCKET")  # add in env & terraform
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+# Persistent and local to one container/host (leftovers of dead processes are adopted)
+RAW_EEG_SPOOL_DIR = os.getenv("RAW_EEG_SPOOL_DIR", "/var/spool/raw-eeg")
+RAW_EEG_SPOOL_MAX_BYTES = int(os.getenv("RAW_EEG_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+RAW_EEG_SPOOL_MAX_AGE = float(os.getenv("RAW_EEG_SPOOL_MAX_AGE", "60"))
+RAW_EEG_SPOOL_MAX_DISK_BYTES = int(os.getenv("RAW_EEG_SPOOL_MAX_DISK_BYTES", str(2 * 1024 ** 3)))
+RAW_EEG_UPLOAD_MAX_BACKOFF = float(os.getenv("RAW_EEG_UPLOAD_MAX_BACKOFF", "60"))
+RAW_EEG_UPLOAD_MAX_ATTEMPTS = int(os.getenv("RAW_EEG_UPLOAD_MAX_ATTEMPTS", "20"))
+RAW_EEG_SPOOL_FLUSH_BYTES = int(os.getenv("RAW_EEG_SPOOL_FLUSH_BYTES", str(256 * 1024)))
+RAW_EEG_SPOOL_FLUSH_INTERVAL = float(os.getenv("RAW_EEG_SPOOL_FLUSH_INTERVAL", "1.0"))
+
+# kind -> (file suffix, content type)
+KINDS = {
+    "json": (".ndjson.gz", "application/x-ndjson"),
+    "neeg": (".neeg.gz", "application/x-niura-eeg"),
+}
+
+PART = ".part"    # being appended to
+READY = ".ready"  # rolled, waiting for upload
+TMP = ".tmp"      # recovered file being re-compressed
+FAILED_DIR = "failed"  # under the spool root: files that kept failing to upload
+
+
+class SpoolFull(Exception):
+    """The spool holds RAW_EEG_SPOOL_MAX_DISK_BYTES already (S3 uploads are behind)."""
+
+
+def _stamp(dt: datetime.datetime) -> str:
+    return dt.strftime("%Y%m%dT%H%M%S%f")
+
+
+def _whole_records(kind: str, data: bytes) -> bytes:
+    """The longest prefix of data made of complete records of kind."""
+    if kind == "json":
+        return data[: data.rfind(b"\n") + 1]
+    end = 0
+    while end + HEADER.size <= len(data):
+        magic, _, dtype_code, _, _, n_channels, n_samples = HEADER.unpack_from(data, end)[:7]
+        if magic != MAGIC or dtype_code not in DTYPES:
+            break
+        size = HEADER.size + n_channels * n_samples * DTYPES[dtype_code].itemsize
+        if end + size > len(data):
+            break
+        end += size
+    return data[:end]
+
+
+def _readable_prefix(path: str) -> bytes:
+    """Decompress a possibly unterminated gzip file up to where it stops being readable."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    with open(path, "rb") as f:
+        while not decompressor.eof:
+            block = f.read(64 * 1024)
+            if not block:
+                break
+            try:
+                chunks.append(decompressor.decompress(block))
+            except zlib.error:
+                break
+    return b"".join(chunks)
+
+
+def _repair_part(src: str, dst: str) -> None:
+    """Write the complete records readable from an unclosed spool file src as valid gzip at dst."""
+    kind = next(kind for kind, (suffix, _) in KINDS.items() if src[: -len(PART)].endswith(suffix))
+    data = _readable_prefix(src)
+    kept = _whole_records(kind, data)
+    if len(kept) < len(data):
+        logger.warning(f"⚠️ Dropped {len(data) - len(kept)} bytes of a partial record from {os.path.basename(src)}")
+    tmp = dst + TMP
+    with gzip.open(tmp, "wb") as f:
+        f.write(kept)
+    os.rename(tmp, dst)
+    os.remove(src)
+
+
+class _SpoolFile:
+    """One open per-user spool file."""
+
+    def __init__(self, directory: str, user_id, kind: str):
+        self.user_id = user_id
+        self.kind = kind
+        self.opened = time.monotonic()
+        self.flushed = self.opened
+        self.unflushed = 0
+        self.first = datetime.datetime.utcnow()
+        self.path = os.path.join(directory, f"user-{user_id}__{_stamp(self.first)}{KINDS[kind][0]}{PART}")
+        self.file = gzip.open(self.path, "wb")
+
+    def append(self, data: bytes, flush_bytes: int):
+        self.file.write(data)
+        self.unflushed += len(data)
+        if self.unflushed >= flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """Sync-flush what was appended, so a process crash does not lose it."""
+        if self.unflushed:
+            self.file.flush()
+            self.unflushed = 0
+        self.flushed = time.monotonic()
+
+    def size(self) -> int:
+        """Compressed bytes written so far."""
+        return self.file.fileobj.tell()
+
+    def roll(self) -> str:
+        """Close the file and mark it ready for upload; returns the ready path."""
+        self.file.close()
+        last = _stamp(datetime.datetime.utcnow())
+        ready = self.path[: -len(PART)].replace(KINDS[self.kind][0], f"_{last}{KINDS[self.kind][0]}") + READY
+        os.rename(self.path, ready)
+        return ready
+
+
+class RawEEGSpool:
+    def __init__(
+        self,
+        bucket: Optional[str] = RAW_BUCKET,
+        spool_dir: str = RAW_EEG_SPOOL_DIR,
+        max_bytes: int = RAW_EEG_SPOOL_MAX_BYTES,
+        max_age: float = RAW_EEG_SPOOL_MAX_AGE,
+        max_disk_bytes: int = RAW_EEG_SPOOL_MAX_DISK_BYTES,
+        max_upload_attempts: int = RAW_EEG_UPLOAD_MAX_ATTEMPTS,
+        flush_bytes: int = RAW_EEG_SPOOL_FLUSH_BYTES,
+        flush_interval: float = RAW_EEG_SPOOL_FLUSH_INTERVAL,
+        s3_client=None,
+    ):
+        self.bucket = bucket
+        self.root = spool_dir
+        # One directory per process so uvicorn workers never share open files
+        self.directory = os.path.join(spool_dir, f"{socket.gethostname()}-{os.getpid()}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_disk_bytes = max_disk_bytes
+        self.max_upload_attempts = max_upload_attempts
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.s3 = s3_client or boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+
+        self._files: Dict[Tuple[str, str], _SpoolFile] = {}
+        self._disk_bytes = 0  # open + ready files in self.directory
+        self._upload_failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="raw-eeg-uploader", daemon=True)
+        self._thread.start()
+
+    # --- hot path ---
+
+    def append(self, user_id, kind: str, data: bytes) -> None:
+        """
+        Append one raw payload to the user's spool file (local disk only).
+
+        Raises SpoolFull while the spool is at its disk cap.
+        """
+        key = (str(user_id), kind)
+        with self._lock:
+            if self._disk_bytes >= self.max_disk_bytes:
+                self._wake.set()
+                raise SpoolFull(f"raw EEG spool holds {self._disk_bytes} bytes waiting for upload")
+            spool = self._files.get(key)
+            before = 0  # a new file's gzip header counts too
+            if spool is None:
+                spool = self._files[key] = _SpoolFile(self.directory, user_id, kind)
+            else:
+                before = spool.size()
+            spool.append(data, self.flush_bytes)
+            self._disk_bytes += spool.size() - before
+            full = spool.size() >= self.max_bytes
+        if full:
+            self._wake.set()
+
+    # --- background upload ---
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            self._wake.wait(min(self.max_age, self.flush_interval, 5.0))
+            self._wake.clear()
+            self._flush_idle()
+            self._roll(force=False)
+            if self._upload_ready():
+                backoff = 1.0
+            else:
+                # S3 unavailable: keep the files and try again later
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, RAW_EEG_UPLOAD_MAX_BACKOFF)
+
+    def _flush_idle(self):
+        """Sync-flush open files whose appends have waited flush_interval or longer."""
+        now = time.monotonic()
+        with self._lock:
+            for spool in self._files.values():
+                if spool.unflushed and now - spool.flushed >= self.flush_interval:
+                    before = spool.size()
+                    spool.flush()
+                    self._disk_bytes += spool.size() - before
+
+    def _roll(self, force: bool):
+        """Close spool files that are big or old enough (all of them if force)."""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                key for key, spool in self._files.items()
+                if force or now - spool.opened >= self.max_age or spool.size() >= self.max_bytes
+            ]
+            rolled = [self._files.pop(key) for key in due]
+        # Popped under the lock, so nothing appends to these any more
+        for spool in rolled:
+            written = spool.size()
+            ready = spool.roll()
+            with self._lock:
+                self._disk_bytes += os.path.getsize(ready) - written  # gzip trailer
+
+    def _upload_ready(self) -> bool:
+        """Upload every ready file; returns False if any upload failed."""
+        ok = True
+        with self._upload_lock:
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(READY) and not self._upload(name):
+                    ok = False
+        return ok
+
+    def _upload(self, name: str) -> bool:
+        """Upload one ready file and delete it; False (file kept) on failure."""
+        path = os.path.join(self.directory, name)
+        object_name = name[: -len(READY)]
+        user, _, rest = object_name.partition("__")
+        content_type = next(ct for suffix, ct in KINDS.values() if rest.endswith(suffix))
+        size = os.path.getsize(path)
+        try:
+            with open(path, "rb") as f:
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=f"raw/{user}/{rest}",
+                    Body=f,
+                    ContentType=content_type,
+                    ContentEncoding="gzip",
+                )
+        except Exception as e:
+            failures = self._upload_failures.get(name, 0) + 1
+            if failures < self.max_upload_attempts:
+                self._upload_failures[name] = failures
+                logger.error(f"❌ Raw EEG upload failed for {name} (attempt {failures}), will retry: {e}")
+            else:
+                self._quarantine(name, size, e)
+            return False
+
+        os.remove(path)
+        self._upload_failures.pop(name, None)
+        with self._lock:
+            self._disk_bytes -= size
+        logger.info(f"📦 Archived raw EEG spool raw/{user}/{rest}")
+        return True
+
+    def _quarantine(self, name: str, size: int, error: Exception):
+        """Move a file that keeps failing out of the upload queue and the disk cap."""
+        failed_dir = os.path.join(self.root, FAILED_DIR)
+        os.makedirs(failed_dir, exist_ok=True)
+        os.rename(os.path.join(self.directory, name), os.path.join(failed_dir, name))
+        self._upload_failures.pop(name, None)
+        with self._lock:
+            self._disk_bytes -= size
+        logger.error(
+            f"❌ Raw EEG upload of {name} failed {self.max_upload_attempts} times, "
+            f"moved to {failed_dir} for manual upload: {error}"
+        )
+
+    def _recover(self):
+        """Adopt spool files left by processes that are no longer running."""
+        # After a restart the host name and pid can repeat, so this directory may hold leftovers too
+        _discard_tmp(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith(PART):
+                self._adopt(os.path.join(self.directory, name))
+        host = socket.gethostname()
+        for entry in os.listdir(self.root):
+            directory = os.path.join(self.root, entry)
+            if directory == self.directory or entry == FAILED_DIR or not os.path.isdir(directory):
+                continue
+            entry_host, _, pid = entry.rpartition("-")
+            if entry_host == host and pid.isdigit() and _alive(int(pid)):
+                continue
+            _discard_tmp(directory)
+            for name in os.listdir(directory):
+                if name.endswith(PART):
+                    self._adopt(os.path.join(directory, name))
+                else:
+                    os.rename(os.path.join(directory, name), os.path.join(self.directory, name))
+            os.rmdir(directory)
+        self._disk_bytes = sum(
+            os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)
+        )
+
+    def _adopt(self, path: str):
+        """Queue an unclosed file of a dead process for upload, as valid gzip."""
+        name = os.path.basename(path)
+        ready = os.path.join(self.directory, name[: -len(PART)] + READY)
+        try:
+            _repair_part(path, ready)
+        except Exception as e:
+            logger.error(f"❌ Could not recover raw EEG spool file {path}, uploading it as is: {e}")
+            os.rename(path, ready)
+
+    def flush(self) -> bool:
+        """Roll every open file and upload what is ready now (shutdown, tests)."""
+        self._roll(force=True)
+        return self._upload_ready()
+
+    def close(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if not self.flush():
+            logger.warning(f"⚠️ Raw EEG spool files left in {self.directory}; uploaded on next start")
+
+
+def _discard_tmp(directory: str) -> None:
+    """Remove half-written recovered files (the .part they came from is still there)."""
+    for name in os.listdir(directory):
+        if name.endswith(TMP):
+            os.remove(os.path.join(directory, name))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_spool: Optional[RawEEGSpool] = None
+_spool_lock = threading.Lock()
+
+
+def get_raw_spool() -> RawEEGSpool:
+    """Return the process-wide spool, creating it (and its uploader) on first use."""
+    global _spool
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None:
+                _spool = RawEEGSpool()
+    return _spool
+
+
+def close_raw_spool(timeout: float = 10.0) -> None:
+    """Upload what is spooled and stop the uploader, if the spool was created."""
+    if _spool is not None:
+        _spool.close(timeout)
+
 
 def save_raw_eeg_to_s3(user_id, eeg_payload):
     ts = datetime.datetime.utcnow().isoformat()
-    
-    key = f"raw/user-{user_id}/{ts}.json"
 
-    body = json.dumps({
+    line = json.dumps({
         "user_id": user_id,
         "timestamp": ts,
         "raw": eeg_payload
     })
 
-    s3.put_object(
-        Bucket=RAW_BUCKET,
-        Key=key,
-        Body=body,
-        ContentType="application/json"
-    )
+    get_raw_spool().append(user_id, "json", line.encode("utf-8") + b"\n")
+
+
+def save_raw_eeg_frame_to_s3(user_id, frame: bytes):
+    # Frames are self-delimiting (the header gives their size), so they are concatenated as-is
+    get_raw_spool().append(user_id, "neeg", frame)
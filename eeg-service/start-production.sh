@@ -16,6 +16,9 @@
 
 set -e
 
+# Shared packages (the Docker images copy them next to app/)
+export PYTHONPATH="$(cd "$(dirname "$0")/../shared" && pwd)${PYTHONPATH:+:$PYTHONPATH}"
+
 # Configuration
 PORT=${PORT:-8002}
 WORKERS=${WORKERS:-4}
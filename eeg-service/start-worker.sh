@@ -11,17 +11,30 @@
 # Environment Variables:
 #   REDIS_URL - Redis broker URL (default: redis://localhost:6379/0)
 #   WORKERS - Number of worker processes (default: 4)
+#   STREAM_SHARD - Serve ordered streaming queue eeg_stream.<n> instead of
+#                  eeg_processing, with a single process. Run one worker per
+#                  shard 0..EEG_STREAM_SHARDS-1 (default 2 shards).
 # ============================================================================
 
 set -e
 
+# Shared packages (the Docker images copy them next to app/)
+export PYTHONPATH="$(cd "$(dirname "$0")/../shared" && pwd)${PYTHONPATH:+:$PYTHONPATH}"
+
 WORKERS=${CELERY_WORKERS:-4}
 REDIS_URL=${REDIS_URL:-redis://localhost:6379/0}
+QUEUE=eeg_processing
+
+# A stream shard must run its tasks one at a time to keep each user's batches in order
+if [ -n "$STREAM_SHARD" ]; then
+    QUEUE="eeg_stream.$STREAM_SHARD"
+    WORKERS=1
+fi
 
 echo "🔧 Starting Celery Worker for EEG Processing"
 echo "   Workers: $WORKERS"
 echo "   Broker: $REDIS_URL"
-echo "   Queue: eeg_processing"
+echo "   Queue: $QUEUE"
 echo ""
 
 # Check Redis connectivity
@@ -39,5 +52,5 @@ exec celery -A app.core.celery_app worker \
     --loglevel=info \
     --concurrency="$WORKERS" \
     --prefetch-multiplier=1 \
-    -Q eeg_processing \
+    -Q "$QUEUE" \
     --max-tasks-per-child=1000
@@ -0,0 +1,170 @@
+"""
+RawEEGSpool against an in-memory S3 (moto).
+
+Run from eeg-service/: pip install -r requirements-dev.txt && python -m pytest tests
+"""
+
+import gzip
+import json
+import os
+
+import boto3
+import numpy as np
+import pytest
+from moto import mock_aws
+
+from app.utils.eeg_frame import decode_frame, encode_frame
+from app.utils.s3_raw_backup import FAILED_DIR, PART, RawEEGSpool, SpoolFull, _readable_prefix
+
+BUCKET = "raw-eeg-test"
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def make_spool(tmp_path, s3, **kwargs):
+    # Long max_age: the tests roll and upload explicitly with flush()
+    return RawEEGSpool(bucket=BUCKET, spool_dir=str(tmp_path), max_age=3600, s3_client=s3, **kwargs)
+
+
+def objects(s3):
+    return {obj["Key"]: obj for obj in s3.list_objects_v2(Bucket=BUCKET).get("Contents", [])}
+
+
+def read(s3, key):
+    return gzip.decompress(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+
+class FailingKey:
+    """S3 client whose put_object fails for keys containing `marker`."""
+
+    def __init__(self, s3, marker):
+        self.s3 = s3
+        self.marker = marker
+
+    def put_object(self, **kwargs):
+        if self.marker in kwargs["Key"]:
+            raise RuntimeError("access denied")
+        return self.s3.put_object(**kwargs)
+
+
+def test_flush_uploads_json_and_frames_per_user(tmp_path, s3):
+    spool = make_spool(tmp_path, s3)
+    spool.append(7, "json", b'{"a": 1}\n')
+    spool.append(7, "json", b'{"a": 2}\n')
+    frame = encode_frame(np.arange(8, dtype=np.int32).reshape(4, 2), start_time_us=0, sample_rate=250)
+    spool.append(7, "neeg", frame)
+    spool.append(7, "neeg", frame)
+
+    assert spool.flush()
+    spool.close()
+
+    keys = objects(s3)
+    (json_key,) = [k for k in keys if k.endswith(".ndjson.gz")]
+    (frame_key,) = [k for k in keys if k.endswith(".neeg.gz")]
+    assert json_key.startswith("raw/user-7/") and frame_key.startswith("raw/user-7/")
+    assert [json.loads(line) for line in read(s3, json_key).splitlines()] == [{"a": 1}, {"a": 2}]
+
+    frames = read(s3, frame_key)
+    assert frames == frame + frame
+    np.testing.assert_array_equal(decode_frame(frames[:len(frame)]).data, np.arange(8).reshape(4, 2))
+    assert os.listdir(spool.directory) == []
+    assert spool._disk_bytes == 0
+
+
+def test_failing_upload_does_not_block_others(tmp_path, s3):
+    spool = make_spool(tmp_path, FailingKey(s3, "user-1/"), max_upload_attempts=2)
+    spool.append(1, "json", b"{}\n")
+    spool.append(2, "json", b"{}\n")
+
+    assert not spool.flush()
+    assert [k.split("/")[1] for k in objects(s3)] == ["user-2"]
+
+    # Second failure: moved aside and no longer counted against the disk cap
+    assert not spool.flush()
+    spool.close()
+    assert len(os.listdir(tmp_path / FAILED_DIR)) == 1
+    assert os.listdir(spool.directory) == []
+    assert spool._disk_bytes == 0
+
+
+def test_disk_cap_rejects_appends_until_uploaded(tmp_path, s3):
+    spool = make_spool(tmp_path, FailingKey(s3, "raw/"), max_disk_bytes=1)
+    spool.append(1, "json", b"{}\n")
+    with pytest.raises(SpoolFull):
+        spool.append(1, "json", b"{}\n")
+
+    spool.s3 = s3
+    assert spool.flush()
+    spool.append(1, "json", b"{}\n")
+    spool.close()
+
+
+def test_leftovers_of_dead_process_are_uploaded(tmp_path, s3):
+    dead = tmp_path / "otherhost-12345"
+    dead.mkdir()
+    with gzip.open(dead / f"user-3__20240101T000000000000.ndjson.gz{PART}", "wb") as f:
+        f.write(b'{"left": "over"}\n')
+
+    spool = make_spool(tmp_path, s3)
+    assert spool.flush()
+    spool.close()
+
+    (key,) = objects(s3)
+    assert key.startswith("raw/user-3/")
+    assert json.loads(read(s3, key)) == {"left": "over"}
+    assert not dead.exists()
+
+
+def test_unclosed_leftovers_are_recompressed_to_whole_records(tmp_path, s3):
+    dead = tmp_path / "otherhost-12345"
+    dead.mkdir()
+    frame = encode_frame(np.arange(8, dtype=np.int32).reshape(4, 2), start_time_us=0, sample_rate=250)
+    for name, whole, partial in [
+        ("user-3__20240101T000000000000.ndjson.gz", b'{"a": 1}\n{"a": 2}\n', b'{"a": 3'),
+        ("user-3__20240101T000000000001.neeg.gz", frame + frame, frame[:-3]),
+    ]:
+        # Written and sync-flushed but never closed, as a killed process leaves it: no gzip trailer
+        path = dead / f"{name}{PART}"
+        raw = open(path, "wb")
+        f = gzip.GzipFile(fileobj=raw, mode="wb")
+        f.write(whole)
+        f.write(partial)
+        f.flush()
+        with pytest.raises(EOFError):
+            gzip.decompress(path.read_bytes())
+        raw.close()
+
+    spool = make_spool(tmp_path, s3)
+    assert spool.flush()
+    spool.close()
+
+    keys = objects(s3)
+    (json_key,) = [k for k in keys if k.endswith(".ndjson.gz")]
+    (frame_key,) = [k for k in keys if k.endswith(".neeg.gz")]
+    assert read(s3, json_key) == b'{"a": 1}\n{"a": 2}\n'
+    assert read(s3, frame_key) == frame + frame
+    assert not dead.exists()
+    assert os.listdir(spool.directory) == []
+
+
+def test_appends_are_flushed_by_size_or_idle_time(tmp_path, s3):
+    spool = make_spool(tmp_path, s3, flush_bytes=16, flush_interval=3600)
+    spool.append(1, "json", b'{"a": 1}\n')
+    (part,) = os.listdir(spool.directory)
+    path = os.path.join(spool.directory, part)
+    assert _readable_prefix(path) == b""
+
+    spool.append(1, "json", b'{"a": 2}\n')  # 18 bytes pending: flushed
+    assert _readable_prefix(path) == b'{"a": 1}\n{"a": 2}\n'
+
+    spool.append(1, "json", b'{"a": 3}\n')
+    spool.flush_interval = 0
+    spool._flush_idle()
+    assert _readable_prefix(path) == b'{"a": 1}\n{"a": 2}\n{"a": 3}\n'
+    spool.close()
@@ -0,0 +1,59 @@
+"""
+Shared, pooled httpx clients for proxying to upstream services.
+
+One AsyncClient per upstream base URL, created on first use and closed on
+app shutdown, so proxied requests reuse keep-alive connections instead of
+opening a new TCP connection per call. Timeouts are still set per request
+by the caller.
+"""
+
+import logging
+import os
+from typing import Dict
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:
+    h2 = None
+
+logger = logging.getLogger("gateway.http_client")
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+# HTTP/2 is only negotiated with https:// upstreams (httpx does not do h2c)
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    """Return the shared client for an upstream, creating it on first use."""
+    client = _clients.get(base_url)
+    if client is None:
+        http2 = UPSTREAM_HTTP2 and h2 is not None
+        if UPSTREAM_HTTP2 and h2 is None:
+            logger.warning("⚠️ UPSTREAM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+        client = httpx.AsyncClient(
+            follow_redirects=True,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(30.0, pool=UPSTREAM_POOL_TIMEOUT),
+        )
+        _clients[base_url] = client
+        logger.info(f"🔌 Created pooled HTTP client for {base_url} (http2={http2})")
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close every shared client (app shutdown)."""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
@@ -3,9 +3,8 @@ import time
 import uuid
 from contextvars import ContextVar
 from fastapi import Request
-from jose import jwt, JWTError
 from starlette.types import ASGIApp, Receive, Scope, Send
-from app.core.config import JWT_SECRET_KEY, ALGORITHM
+from app.core.security import verify_access_token
 
 logger = logging.getLogger("gateway.request")
 
@@ -15,7 +14,7 @@ user_id_ctx = ContextVar("user_id", default=None)
 
 
 class ContextLoggingMiddleware:
-    """Assigns a unique request ID and extracts user_id from JWT."""
+    """Assigns a unique request ID and verifies the bearer JWT to extract user_id."""
     
     def __init__(self, app: ASGIApp):
         self.app = app
@@ -36,22 +35,12 @@ class ContextLoggingMiddleware:
         
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split("Bearer ")[1]
-            try:
-                payload = jwt.decode(
-                    token, 
-                    JWT_SECRET_KEY, 
-                    algorithms=[ALGORITHM],
-                    options={"verify_aud": False}  # Don't verify audience in middleware
-                )
-                # Try 'sub' field for user_id
-                user_id = payload.get("sub")
-                
-                # Debug: log what we found (remove after testing)
-                logger.debug(f"JWT payload keys: {list(payload.keys())}")
+            # Verified once here; auth dependencies reuse the result from scope["state"]
+            claims = verify_access_token(token)
+            scope.setdefault("state", {})["token_claims"] = (token, claims)
+            if isinstance(claims, dict):
+                user_id = claims.get("sub")
                 logger.debug(f"Extracted user_id: {user_id}")
-            except JWTError as e:
-                logger.debug(f"JWT decode error: {str(e)}")
-                user_id = None
         else:
             logger.debug(f"No auth header found or invalid format. Headers: {list(headers.keys())}")
         
@@ -1,5 +1,10 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from fastapi import Depends, HTTPException, status
+from threading import Lock
+from fastapi import Depends, HTTPException, Request, status
 from jose import jwt, JWTError, ExpiredSignatureError
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
@@ -8,6 +13,12 @@ from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, JWT_AUDIENCE, JWT_ISSUE
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/login")
 
+# Recently verified tokens (sha256 digest -> claims), so repeat requests with
+# the same token skip signature verification until the token expires
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
+_verified_tokens: "OrderedDict[bytes, dict]" = OrderedDict()
+_verified_tokens_lock = Lock()
+
 
 
 def get_password_hash(password: str) -> str:
@@ -43,10 +54,36 @@ def create_access_token(data: dict, expires_delta: timedelta | None=None):
 #     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
 #     return encoded_jwt
 
+def _cached_claims(digest: bytes):
+    """Claims for a previously verified token, "EXPIRED" once past exp, or None if not cached."""
+    with _verified_tokens_lock:
+        payload = _verified_tokens.get(digest)
+        if payload is None:
+            return None
+        if payload.get("exp") is not None and payload["exp"] <= time.time():
+            del _verified_tokens[digest]
+            return "EXPIRED"
+        _verified_tokens.move_to_end(digest)
+        return payload
+
+
+def _cache_claims(digest: bytes, payload: dict):
+    with _verified_tokens_lock:
+        _verified_tokens[digest] = payload
+        _verified_tokens.move_to_end(digest)
+        while len(_verified_tokens) > JWT_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
+
 def verify_access_token(token: str):
     import logging
     logger = logging.getLogger(__name__)
-    
+
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = _cached_claims(digest)
+    if cached is not None:
+        return cached
+
     try:
         # Disable nbf validation to handle clock skew issues
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM], audience=JWT_AUDIENCE,
@@ -55,6 +92,7 @@ def verify_access_token(token: str):
         if not payload.get("sub"):
             logger.warning("❌ Token missing 'sub' claim")
             return None
+        _cache_claims(digest, payload)
         return payload
     except ExpiredSignatureError as e:
         logger.warning(f"⏰ Token expired: {str(e)}")
@@ -62,9 +100,23 @@ def verify_access_token(token: str):
     except JWTError as e:
         logger.error(f"❌ JWT validation failed: {type(e).__name__} - {str(e)}")
         return None
+
+
+def request_token_claims(request: Request, token: str):
+    """
+    Claims for the request's bearer token.
+
+    ContextLoggingMiddleware verifies the token once per request and stores
+    (token, result) on scope["state"]; reuse that instead of verifying again.
+    """
+    verified = getattr(request.state, "token_claims", None)
+    if verified is not None and verified[0] == token:
+        return verified[1]
+    return verify_access_token(token)
+
     
-def get_current_user_payload(token: str = Depends(oauth2_scheme)):
-    result=verify_access_token(token)
+def get_current_user_payload(request: Request, token: str = Depends(oauth2_scheme)):
+    result = request_token_claims(request, token)
     if result == "EXPIRED":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     if result is None:
@@ -72,13 +124,13 @@ def get_current_user_payload(token: str = Depends(oauth2_scheme)):
     return result
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
     """
     Dependency to get current user from JWT token.
     Returns user_id (string) that can be used to query the database.
     """
     try:
-        user_id = verify_access_token(token)
+        user_id = request_token_claims(request, token)
         if user_id == "EXPIRED":
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,22 +1,20 @@
 from confluent_kafka import Consumer
-import os, json, logging, threading, asyncio
+import os, json, logging
 from app.events.kafka_config import get_kafka_config
+from niura_kafka.consumer_runtime import PartitionedConsumer, dead_letter_topic
+from app.events.async_producer import get_producer
 
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
+# Messages that cannot be decoded or published go here (the gateway's own
+# DLQ: core-service dead-letters the same topic to eeg.processed.data.dlq)
+GATEWAY_METRICS_DLQ_TOPIC = os.getenv("GATEWAY_METRICS_DLQ_TOPIC", "eeg.processed.data.gateway.dlq")
 
 conf = get_kafka_config(is_consumer=True)
 conf["group.id"] = "gateway-consumer"
+conf["enable.auto.commit"] = False
 
-consumer = Consumer(conf)
-consumer.subscribe(["eeg.processed.data"])
-
-# Store reference to the event loop
-main_loop = None
-
-def set_event_loop(loop):
-    """Set the main event loop for async operations."""
-    global main_loop
-    main_loop = loop
+runtime = None
+dead_letter = None
 
 def _get_label(value, metric_type):
     """Convert numeric value to label."""
@@ -45,81 +43,91 @@ def _get_label(value, metric_type):
         else:
             return "Poor"
 
-async def broadcast_metrics(data: dict):
-    """Broadcast processed metrics to WebSocket clients."""
-    from app.websocket.metrics_manager import metrics_manager
-    
-    try:
-        user_id = str(data.get("user_id"))  # Convert to string for consistency
-        records = data.get("records", [])
-        
-        if not user_id or not records:
-            logging.warning(f"⚠️ Skipping broadcast - user_id: {user_id}, records: {len(records) if records else 0}")
-            return
-        
-        # Get latest metrics from the records
-        latest = records[-1]  # Last record has most recent data
-        
-        # Log the structure to debug
-        logging.info(f"🔍 Latest record keys: {list(latest.keys())}")
-        
-        metrics_message = {
-            "type": "PROCESSED_METRICS",
-            "user_id": user_id,
-            "timestamp": latest.get("timestamp"),
-            "metrics": {
-                "focus": {
-                    "value": latest.get("focus_label"),  # Named _label but contains value
-                    "label": _get_label(latest.get("focus_label"), "focus")
-                },
-                "stress": {
-                    "value": latest.get("stress_label"),  # Named _label but contains value
-                    "label": _get_label(latest.get("stress_label"), "stress")
-                },
-                "wellness": {
-                    "value": latest.get("wellness_label"),  # Named _label but contains value
-                    "label": _get_label(latest.get("wellness_label"), "wellness")
-                }
+def build_metrics_message(data: dict):
+    """Build the PROCESSED_METRICS WebSocket message from a processed EEG payload (None if empty)."""
+    user_id = str(data.get("user_id"))  # Convert to string for consistency
+    records = data.get("records", [])
+
+    if not user_id or not records:
+        logging.warning(f"⚠️ Skipping broadcast - user_id: {user_id}, records: {len(records) if records else 0}")
+        return None
+
+    # Get latest metrics from the records
+    latest = records[-1]  # Last record has most recent data
+
+    return {
+        "type": "PROCESSED_METRICS",
+        "user_id": user_id,
+        "timestamp": latest.get("timestamp"),
+        "metrics": {
+            "focus": {
+                "value": latest.get("focus_label"),  # Named _label but contains value
+                "label": _get_label(latest.get("focus_label"), "focus")
+            },
+            "stress": {
+                "value": latest.get("stress_label"),  # Named _label but contains value
+                "label": _get_label(latest.get("stress_label"), "stress")
+            },
+            "wellness": {
+                "value": latest.get("wellness_label"),  # Named _label but contains value
+                "label": _get_label(latest.get("wellness_label"), "wellness")
             }
         }
-        
-        await metrics_manager.send_to_user(user_id, metrics_message)
-        logging.info(f"📊 Sent metrics to user {user_id}: Focus={latest.get('focus_label'):.2f}, Stress={latest.get('stress_label'):.2f}")
-        
-    except Exception as e:
-        logging.error(f"❌ Error broadcasting metrics: {e}", exc_info=True)
-
-def handle_processed_metrics(data: dict):
-    """Handle processed metrics received from Kafka."""
-    try:
-        user_id = str(data.get("user_id"))  # Convert to string for consistency
-        records = data.get("records", [])
-        
-        logging.info(f"🎯 Gateway consuming processed metrics for user {user_id}: {len(records)} records")
-        
-        # Broadcast to WebSocket clients
-        if main_loop and not main_loop.is_closed():
-            asyncio.run_coroutine_threadsafe(broadcast_metrics(data), main_loop)
-    
-    except Exception as e:
-        logging.error(f"❌ Error handling processed metrics: {e}", exc_info=True)
+    }
 
-def consume_loop():
-    """Kafka consumer loop."""
-    logging.info("👂 Gateway consuming 'eeg.processed.data' topic")
-    while True:
-        msg = consumer.poll(1.0)
-        if msg is None:
-            continue
-        if msg.error():
-            logging.error(f"Kafka error: {msg.error()}")
+def handle_messages(messages: list) -> None:
+    """
+    PartitionedConsumer handler: publish the metrics of a batch of processed EEG messages.
+
+    Messages that are not valid JSON payloads are sent to GATEWAY_METRICS_DLQ_TOPIC
+    first, so a failed DLQ write is retried before anything is published.
+    Publish errors propagate: the runtime retries the batch, then isolates and
+    dead-letters the messages that keep failing.
+    """
+    from app.websocket.metrics_manager import metrics_manager
+
+    published = 0
+    payloads, invalid = [], []
+    for msg in messages:
+        try:
+            data = json.loads(msg.value().decode("utf-8"))
+            if not isinstance(data, dict):
+                raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+            payloads.append(data)
+        except Exception as e:
+            logging.error(f"❌ Invalid processed EEG message at {msg.topic()}[{msg.partition()}]@{msg.offset()}: {e}")
+            invalid.append((msg, e))
+
+    for msg, error in invalid:
+        dead_letter([msg], error)
+
+    for data in payloads:
+        metrics_message = build_metrics_message(data)
+        if metrics_message is None:
             continue
-        
-        data = json.loads(msg.value().decode("utf-8"))
-        handle_processed_metrics(data)
+        # Routed to whichever replica holds the user's sockets (Redis pub/sub), or delivered locally
+        metrics_manager.publish(metrics_message["user_id"], metrics_message)
+        published += 1
+    logging.info(f"📊 Published metrics from {published} of {len(messages)} messages")
+
 
 def start_consumer():
-    """Start consumer in background thread."""
-    thread = threading.Thread(target=consume_loop, daemon=True)
-    thread.start()
+    """Start the partition-parallel Kafka consumer."""
+    global runtime, dead_letter
+    logging.info("👂 Gateway consuming 'eeg.processed.data' topic")
+    dead_letter = dead_letter_topic(get_producer(), GATEWAY_METRICS_DLQ_TOPIC)
+    runtime = PartitionedConsumer(
+        Consumer(conf),
+        ["eeg.processed.data"],
+        handle_messages,
+        name="gateway-metrics-consumer",
+        dead_letter=dead_letter,
+    )
+    runtime.start()
     logging.info("✅ Gateway Kafka consumer started")
+
+
+def stop_consumer():
+    """Publish fetched messages, commit their offsets and leave the group."""
+    if runtime is not None:
+        runtime.stop()
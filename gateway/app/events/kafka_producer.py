@@ -1,5 +1,7 @@
-from confluent_kafka import Producer, KafkaException
-from app.events.kafka_config import get_kafka_config
+from confluent_kafka import KafkaException
+from app.events.async_producer import get_producer
+from app.websocket.eeg_frame import EEG_FRAME_CONTENT_TYPE
+import asyncio
 import os, json
 import logging
 
@@ -8,28 +10,56 @@ logger = logging.getLogger("kafka.producer")
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
 
 logger.info(f"Initializing Kafka producer with broker: {KAFKA_BROKER}")
-producer = Producer(get_kafka_config())
+producer = get_producer()
 
-def delivery_callback(err, msg):
-    """Callback to log Kafka delivery success/failure"""
-    if err:
-        logger.error(f"❌ Kafka delivery failed: {err}")
-    else:
-        logger.debug(f"✅ Kafka message delivered to {msg.topic()} [partition {msg.partition()}]")
+EEG_RAW_TOPIC = "eeg.raw.data"
+
+
+def _eeg_event_value(user_id: str, eeg_payload: dict) -> str:
+    return json.dumps({
+        "user_id": user_id,
+        "data" : eeg_payload
+    })
+
+def _eeg_key(user_id) -> bytes:
+    """Partition key: all of a user's messages land on one partition, in order."""
+    return str(user_id).encode()
+
+def _eeg_frame_headers(user_id: str):
+    return [("content-type", EEG_FRAME_CONTENT_TYPE.encode()), ("user_id", str(user_id).encode())]
 
 def send_eeg_event(user_id:str, eeg_payload: dict):
-    topic = "eeg.raw.data"
+    """Queue an EEG event for delivery (does not wait for the broker)."""
     try:
-        value = json.dumps({
-            "user_id": user_id,
-            "data" : eeg_payload
-        })
-        producer.produce(topic=topic, value=value, callback=delivery_callback)
-        producer.flush(timeout=5.0)
-        logger.info(f"✅ Sent EEG event for user {user_id} to topic '{topic}'")
-    except KafkaException as e:
+        producer.produce(topic=EEG_RAW_TOPIC, value=_eeg_event_value(user_id, eeg_payload), key=_eeg_key(user_id))
+        logger.debug(f"✅ Queued EEG event for user {user_id} to topic '{EEG_RAW_TOPIC}'")
+    except (KafkaException, BufferError) as e:
         logger.error(f"❌ Failed to send EEG event for user {user_id}: {e}")
         raise
     except Exception as e:
         logger.error(f"❌ Unexpected error sending EEG event: {e}")
-        raise
\ No newline at end of file
+        raise
+
+async def send_eeg_event_async(user_id: str, eeg_payload: dict) -> asyncio.Future:
+    """
+    Queue an EEG event from the event loop without blocking it.
+
+    Returns the delivery future; await it only if the broker ack is needed.
+    """
+    try:
+        return await producer.produce_async(
+            topic=EEG_RAW_TOPIC, value=_eeg_event_value(user_id, eeg_payload), key=_eeg_key(user_id)
+        )
+    except (KafkaException, BufferError) as e:
+        logger.error(f"❌ Failed to send EEG event for user {user_id}: {e}")
+        raise
+
+async def send_eeg_frame_async(user_id: str, frame: bytes) -> asyncio.Future:
+    """Queue a binary EEG frame as-is; format and user travel in message headers."""
+    try:
+        return await producer.produce_async(
+            topic=EEG_RAW_TOPIC, value=frame, key=_eeg_key(user_id), headers=_eeg_frame_headers(user_id)
+        )
+    except (KafkaException, BufferError) as e:
+        logger.error(f"❌ Failed to send EEG frame for user {user_id}: {e}")
+        raise
@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
@@ -33,10 +34,11 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
     logger.info("✅ Database initialized")
 
-    # Set event loop for Kafka consumer
-    from app.events.kafka_consumer import start_consumer, set_event_loop
+    # Metrics delivery runs on this event loop; the Kafka consumer thread hands messages to it
+    from app.events.kafka_consumer import start_consumer
+    from app.websocket.metrics_manager import metrics_manager
 
-    set_event_loop(asyncio.get_event_loop())
+    await metrics_manager.start()
     start_consumer()
 
     # ℹ️  Kafka topics are created manually via bastion host (see backEnd/KAFKA_SETUP.md)
@@ -46,6 +48,17 @@ async def lifespan(app: FastAPI):
 
     # --- Shutdown ---
     logger.info("🛑 Gateway service shutting down")
+    from app.events.kafka_consumer import stop_consumer
+    await run_in_threadpool(stop_consumer)
+    logger.info("🛑 Kafka consumer stopped")
+    from app.websocket.metrics_manager import metrics_manager
+    await metrics_manager.stop()
+    from app.events.async_producer import close_producer
+    close_producer()
+    logger.info("🛑 Kafka producer flushed")
+    from app.core.http_client import close_http_clients
+    await close_http_clients()
+    logger.info("🛑 Upstream HTTP clients closed")
     engine.dispose()
     logger.info("🛑 Database engine disposed")
 
@@ -7,6 +7,7 @@ import logging
 
 from app.core.config import CORE_SERVICE_URL, EEG_SERVICE_URL, OCR_STT_SERVICE_URL
 from app.core.security import get_current_user_payload, oauth2_scheme
+from app.core.http_client import get_http_client
 from app.core.request_logger import get_request_id
 
 
@@ -26,7 +27,7 @@ def require_roles(*allowed):
 
 
 async def _forward_request(
-    upstream_url: str, request: Request, token: str, payload: dict, timeout: float = 30.0
+    client: httpx.AsyncClient, upstream_url: str, request: Request, token: str, payload: dict, timeout: float = 30.0
 ):
     method = request.method
     headers = dict(request.headers)
@@ -38,26 +39,27 @@ async def _forward_request(
     logger.info(f"Forwarding {method} request to {upstream_url} (timeout: {timeout}s)")
 
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
-            # Stream the request body instead of buffering it all at once
-            # This prevents ClientDisconnect errors when clients close connections
-            resp = await client.request(
-                method,
-                upstream_url,
-                content=request.stream(),  # Stream instead of await request.body()
-                headers=headers,
-                params=request.query_params,
-            )
-            return StreamingResponse(
-                resp.aiter_bytes(),
-                status_code=resp.status_code,
-                headers={
-                    k: v
-                    for k, v in resp.headers.items()
-                    if k.lower()
-                    not in {"content-encoding", "transfer-encoding", "connection"}
-                },
-            )
+        # Shared pooled client: reuses keep-alive connections to the upstream
+        # Stream the request body instead of buffering it all at once
+        # This prevents ClientDisconnect errors when clients close connections
+        resp = await client.request(
+            method,
+            upstream_url,
+            content=request.stream(),  # Stream instead of await request.body()
+            headers=headers,
+            params=request.query_params,
+            timeout=timeout,
+        )
+        return StreamingResponse(
+            resp.aiter_bytes(),
+            status_code=resp.status_code,
+            headers={
+                k: v
+                for k, v in resp.headers.items()
+                if k.lower()
+                not in {"content-encoding", "transfer-encoding", "connection"}
+            },
+        )
     except ClientDisconnect:
         logger.warning(f"Client disconnected during proxy to {upstream_url}")
         raise HTTPException(status_code=499, detail="Client closed connection")
@@ -87,7 +89,7 @@ async def proxy_core(
 ):
     """Route /core/* requests to core-service"""
     upstream_url = f"{CORE_SERVICE_URL.rstrip('/')}/api/{path}"
-    return await _forward_request(upstream_url, request, token, payload)
+    return await _forward_request(get_http_client(CORE_SERVICE_URL), upstream_url, request, token, payload)
 
 
 @router.api_route(
@@ -101,7 +103,7 @@ async def proxy_eeg(
 ):
     """Route /eeg/* requests to eeg-service"""
     upstream_url = f"{EEG_SERVICE_URL.rstrip('/')}/api/{path}"
-    return await _forward_request(upstream_url, request, token, payload)
+    return await _forward_request(get_http_client(EEG_SERVICE_URL), upstream_url, request, token, payload)
 
 
 @router.api_route("/media/{media_type}/{action}", methods=["POST"])
@@ -120,4 +122,6 @@ async def proxy_media(
         raise HTTPException(status_code=404, detail="Unknown media route")
 
     # Use longer timeout for ML processing (OCR/STT can take time)
-    return await _forward_request(upstream_url, request, token, payload, timeout=120.0)
+    return await _forward_request(
+        get_http_client(OCR_STT_SERVICE_URL), upstream_url, request, token, payload, timeout=120.0
+    )
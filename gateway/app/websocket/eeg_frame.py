@@ -0,0 +1,52 @@
+"""
+Header checks for binary EEG frames received on /ws/eeg.
+
+The frame layout is defined in eeg-service (app/utils/eeg_frame.py): a fixed
+40-byte little-endian header followed by a channel-major int32/float32 sample
+matrix. The gateway only validates the header and forwards the bytes as-is.
+"""
+
+import struct
+from typing import Dict
+
+EEG_FRAME_CONTENT_TYPE = "application/x-niura-eeg"
+
+MAGIC = b"NEEG"
+VERSION = 1
+FLAG_STREAM = 0x01
+
+HEADER = struct.Struct("<4sBBBBHxxIfqqI")
+
+# dtype code -> bytes per value (0 = int32, 1 = float32)
+ITEM_SIZES = {0: 4, 1: 4}
+
+
+def read_frame_header(buf: bytes) -> Dict:
+    """Validate a frame's header and size. Raises ValueError if the frame is malformed."""
+    if len(buf) < HEADER.size:
+        raise ValueError(f"EEG frame too short: {len(buf)} bytes")
+
+    (magic, version, dtype_code, flags, duration, n_channels, n_samples,
+     sample_rate, start_time_us, user_id, first_sample_index) = HEADER.unpack_from(buf)
+
+    if magic != MAGIC:
+        raise ValueError("Not an EEG frame (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported EEG frame version {version}")
+    if dtype_code not in ITEM_SIZES:
+        raise ValueError(f"Unsupported EEG frame dtype {dtype_code}")
+    if n_channels == 0 or n_samples == 0 or sample_rate <= 0:
+        raise ValueError("EEG frame has no samples")
+
+    expected = HEADER.size + n_channels * n_samples * ITEM_SIZES[dtype_code]
+    if len(buf) != expected:
+        raise ValueError(f"EEG frame size mismatch: expected {expected} bytes, got {len(buf)}")
+
+    return {
+        "n_channels": n_channels,
+        "n_samples": n_samples,
+        "sample_rate": sample_rate,
+        "start_time_us": start_time_us,
+        "first_sample_index": first_sample_index,
+        "stream": bool(flags & FLAG_STREAM),
+    }
@@ -1,37 +1,107 @@
-
 from fastapi import WebSocket
-from typing import Set
+from typing import Dict, Set
 import asyncio
 import json
 import logging
+import os
 
 logger = logging.getLogger("websocket")
 
+# Messages waiting to be sent per connection; the oldest is dropped when full
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+
+
+def _encode(message: dict) -> str:
+    """Serialize once per message (same format as WebSocket.send_json)."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class _Subscriber:
+    """One connected socket: a bounded outbox drained by its own sender task."""
+
+    def __init__(self, websocket: WebSocket, channel: str, queue_size: int):
+        self.websocket = websocket
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.task: asyncio.Task = None
+
+    def offer(self, text: str):
+        """Queue a message without waiting; drop the oldest queued one if the outbox is full."""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(text)
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
+    """
+    Routes messages to the sockets subscribed to a channel (a user id).
+
+    Publishing only enqueues; every connection has its own sender task, so
+    sends run concurrently and a slow client only drops its own oldest
+    messages instead of stalling ingest or other clients.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.active_connections: Dict[WebSocket, _Subscriber] = {}
+        self.channels: Dict[str, Set[_Subscriber]] = {}
         self._lock = asyncio.Lock()
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, channel: str):
         await websocket.accept()
+        subscriber = _Subscriber(websocket, str(channel), self.queue_size)
         async with self._lock:
-            self.active_connections.add(websocket)
-        logger.info(f"🔌 WebSocket connected: {len(self.active_connections)} active")
+            self.active_connections[websocket] = subscriber
+            self.channels.setdefault(subscriber.channel, set()).add(subscriber)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+        logger.info(f"🔌 WebSocket connected to channel {subscriber.channel}: {len(self.active_connections)} active")
 
     async def disconnect(self, websocket: WebSocket):
         async with self._lock:
-            self.active_connections.discard(websocket)
+            subscriber = self.active_connections.pop(websocket, None)
+            if subscriber is None:
+                return
+            subscribers = self.channels.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.channels[subscriber.channel]
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        if subscriber.dropped:
+            logger.warning(f"⚠️ Dropped {subscriber.dropped} messages for slow WebSocket on channel {subscriber.channel}")
         logger.info(f"❌ WebSocket disconnected: {len(self.active_connections)} active")
 
+    async def _sender(self, subscriber: _Subscriber):
+        """Drain one connection's outbox in order."""
+        try:
+            while True:
+                text = await subscriber.queue.get()
+                await subscriber.websocket.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"WebSocket send failed on channel {subscriber.channel}: {e}")
+            await self.disconnect(subscriber.websocket)
+
+    def publish(self, channel: str, message: dict):
+        """Queue message for every socket subscribed to channel (non-blocking)."""
+        subscribers = self.channels.get(str(channel))
+        if not subscribers:
+            return
+        text = _encode(message)
+        for subscriber in list(subscribers):
+            subscriber.offer(text)
+
     async def broadcast_json(self, message: dict):
-        """Send message to all active clients."""
-        to_remove = []
-        for ws in list(self.active_connections):
-            try:
-                await ws.send_json(message)
-            except Exception:
-                to_remove.append(ws)
-        for ws in to_remove:
-            await self.disconnect(ws)
+        """Queue message for all active clients (non-blocking)."""
+        text = _encode(message)
+        for subscriber in list(self.active_connections.values()):
+            subscriber.offer(text)
 
 manager = ConnectionManager()
@@ -1,51 +1,173 @@
+"""
+Real-time processed-metrics delivery to WebSocket clients.
+
+Every gateway replica (and uvicorn worker) consumes eeg.processed.data in the
+same consumer group, so a user's metrics arrive on whichever process owns the
+Kafka partition, which may not hold the user's socket. When REDIS_URL is set
+and the redis package is installed, the consuming process publishes each
+message to the Redis channel metrics:user:<user_id>, and each process
+subscribes only to the channels of users connected to it. Without Redis,
+messages are delivered to local sockets only (single-process deployments).
+
+Delivery to local sockets only enqueues: each socket has a bounded outbox
+drained by its own sender task (as in app.websocket.manager), so one slow
+client drops its own oldest messages instead of stalling the listener and
+every other user.
+"""
+
 from fastapi import WebSocket
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 import asyncio
+import json
 import logging
+import os
+
+from app.websocket.manager import WS_SEND_QUEUE_SIZE, _encode, _Subscriber
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # Redis is optional; local delivery works on its own
+    redis = None
+    aioredis = None
 
 logger = logging.getLogger("metrics_websocket")
 
+REDIS_URL = os.getenv("REDIS_URL")
+METRICS_CHANNEL_PREFIX = "metrics:user:"
+
+
 class MetricsConnectionManager:
     """Manages WebSocket connections for real-time processed metrics."""
-    
-    def __init__(self):
-        # user_id -> set of websockets
-        self.connections: Dict[str, Set[WebSocket]] = {}
+
+    def __init__(self, redis_url: Optional[str] = REDIS_URL, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        # user_id -> subscribers (one per websocket)
+        self.connections: Dict[str, Set[_Subscriber]] = {}
+        self._subscribers: Dict[WebSocket, _Subscriber] = {}
         self._lock = asyncio.Lock()
 
+        self._redis_url = redis_url if redis is not None else None
+        self._publisher = redis.Redis.from_url(redis_url) if self._redis_url else None
+        self._subscriber = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _channel(user_id: str) -> str:
+        return f"{METRICS_CHANNEL_PREFIX}{user_id}"
+
+    async def start(self):
+        """Start the Redis listener (app startup); must run on the serving event loop."""
+        self._loop = asyncio.get_running_loop()
+        if not self._redis_url:
+            logger.info("📊 Metrics delivery: local only (REDIS_URL not set)")
+            return
+        self._subscriber = aioredis.Redis.from_url(self._redis_url)
+        self._pubsub = self._subscriber.pubsub(ignore_subscribe_messages=True)
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("📊 Metrics delivery: Redis pub/sub across replicas")
+
+    async def stop(self):
+        """Stop the Redis listener (app shutdown)."""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._subscriber is not None:
+            await self._subscriber.aclose()
+
+    async def _listen(self):
+        """Deliver messages for the users subscribed on this process."""
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                user_id = message["channel"].decode("utf-8")[len(METRICS_CHANNEL_PREFIX):]
+                self.send_to_user(user_id, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Metrics Redis listener error: {e}")
+                await asyncio.sleep(1.0)
+
     async def connect(self, user_id: str, websocket: WebSocket):
         """Connect a WebSocket for a specific user."""
         await websocket.accept()
+        subscriber = _Subscriber(websocket, user_id, self.queue_size)
         async with self._lock:
-            if user_id not in self.connections:
+            first = user_id not in self.connections
+            if first:
                 self.connections[user_id] = set()
-            self.connections[user_id].add(websocket)
+            self.connections[user_id].add(subscriber)
+            self._subscribers[websocket] = subscriber
+            if first and self._pubsub is not None:
+                await self._pubsub.subscribe(self._channel(user_id))
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
         logger.info(f"🔌 Metrics WebSocket connected for user {user_id}: {len(self.connections[user_id])} connections")
 
     async def disconnect(self, user_id: str, websocket: WebSocket):
         """Disconnect a WebSocket for a specific user."""
         async with self._lock:
+            subscriber = self._subscribers.pop(websocket, None)
+            if subscriber is None:
+                return
             if user_id in self.connections:
-                self.connections[user_id].discard(websocket)
+                self.connections[user_id].discard(subscriber)
                 if not self.connections[user_id]:
                     del self.connections[user_id]
+                    if self._pubsub is not None:
+                        await self._pubsub.unsubscribe(self._channel(user_id))
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        if subscriber.dropped:
+            logger.warning(f"⚠️ Dropped {subscriber.dropped} metrics messages for slow WebSocket of user {user_id}")
         logger.info(f"❌ Metrics WebSocket disconnected for user {user_id}")
 
-    async def send_to_user(self, user_id: str, message: dict):
-        """Send metrics data to all connections for a specific user."""
-        if user_id not in self.connections:
-            return
-        
-        to_remove = []
-        for ws in list(self.connections[user_id]):
+    async def _sender(self, subscriber: _Subscriber):
+        """Drain one connection's outbox in order."""
+        try:
+            while True:
+                text = await subscriber.queue.get()
+                await subscriber.websocket.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to send to user {subscriber.channel}: {e}")
+            await self.disconnect(subscriber.channel, subscriber.websocket)
+
+    def publish(self, user_id: str, message: dict):
+        """
+        Route a metrics message to the process holding the user's sockets.
+
+        Safe to call from the Kafka consumer thread.
+        """
+        if self._publisher is not None:
             try:
-                await ws.send_json(message)
+                self._publisher.publish(self._channel(user_id), json.dumps(message, default=str))
+                return
             except Exception as e:
-                logger.error(f"Failed to send to user {user_id}: {e}")
-                to_remove.append(ws)
-        
-        # Clean up failed connections
-        for ws in to_remove:
-            await self.disconnect(user_id, ws)
+                logger.error(f"❌ Metrics Redis publish failed, delivering locally: {e}")
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.send_to_user, user_id, message)
+
+    def send_to_user(self, user_id: str, message: dict):
+        """Queue metrics data for all local connections of a user (non-blocking)."""
+        subscribers = self.connections.get(user_id)
+        if not subscribers:
+            return
+        text = _encode(message)
+        for subscriber in list(subscribers):
+            subscriber.offer(text)
 
 metrics_manager = MetricsConnectionManager()
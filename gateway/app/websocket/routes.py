@@ -1,9 +1,10 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from jose import jwt, JWTError
+from app.core.security import verify_access_token
 from app.websocket.manager import manager
 from app.websocket.metrics_manager import metrics_manager
-from app.events.kafka_producer import send_eeg_event
-from app.core.config import JWT_AUDIENCE, JWT_ISSUER, JWT_SECRET_KEY, ALGORITHM
+from app.events.kafka_producer import send_eeg_event_async, send_eeg_frame_async
+from app.websocket.eeg_frame import read_frame_header
+from app.core.config import JWT_ISSUER
 import json
 import logging
 
@@ -12,6 +13,18 @@ logger = logging.getLogger("websocket")
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
 
 
+async def _authenticate(websocket: WebSocket, token: str, label: str):
+    """Verify the connection's JWT (shared, cached verifier); close the socket and return None if invalid."""
+    payload = verify_access_token(token)
+    if isinstance(payload, dict) and payload.get("iss") != JWT_ISSUER:
+        payload = None
+    if not isinstance(payload, dict):
+        await websocket.close(code=1008, reason="Invalid or expired token")
+        logger.warning(f"{label} WebSocket token validation failed: {payload or 'invalid token'}")
+        return None
+    return payload.get("sub")
+
+
 @router.websocket("/eeg")
 async def eeg_endpoint(websocket: WebSocket):
     """Handles EEG bulk data streaming via WebSocket with user authentication."""
@@ -23,56 +36,67 @@ async def eeg_endpoint(websocket: WebSocket):
         logger.warning("WebSocket connection rejected: No token provided")
         return
 
-    # 2️⃣ Decode the JWT (same as get_current_user)
-    try:
-        # Use same validation options as REST API to handle clock skew and be more lenient
-        payload = jwt.decode(
-            token, JWT_SECRET_KEY, algorithms=[ALGORITHM], 
-            audience=JWT_AUDIENCE,
-            issuer=JWT_ISSUER,
-            options={"verify_aud": True, "verify_nbf": False}  # Disable nbf check for clock skew
-        )
-        
-        user_id = payload.get("sub")
-        if user_id is None:
-            logger.error("❌ EEG WebSocket: Token missing 'sub' claim")
-            await websocket.close(code=1008, reason="Invalid token: missing user_id")
-            logger.warning("WebSocket token missing user_id (sub)")
-            return
-    except JWTError as e:
-        logger.error(f"❌ EEG WebSocket JWT validation failed: {type(e).__name__} - {str(e)}")
-        await websocket.close(code=1008, reason="Invalid or expired token")
-        logger.warning(f"WebSocket token validation failed: {e}")
+    # 2️⃣ Verify the JWT (same verifier as get_current_user)
+    user_id = await _authenticate(websocket, token, "EEG")
+    if user_id is None:
         return
 
     # ✅ If authenticated successfully:
     logger.info(f"WebSocket connection established for user_id={user_id}")
-    await manager.connect(websocket)
+    # Subscribed to this user's channel: frames are echoed only to the user's own sockets
+    await manager.connect(websocket, user_id)
 
     try:
         while True:
-            raw_message = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            # Binary frames (see app.websocket.eeg_frame) are forwarded untouched
+            if message.get("bytes") is not None:
+                frame = message["bytes"]
+                try:
+                    header = read_frame_header(frame)
+                    await send_eeg_frame_async(user_id=user_id, frame=frame)
+                    logger.debug(f"Received {header['n_samples']} samples (binary) for user {user_id}")
+
+                    manager.publish(user_id, {
+                        "type": "EEG_FRAME",
+                        "user_id": user_id,
+                        "count": header["n_samples"],
+                        "format": "binary",
+                        "header": header
+                    })
+
+                except ValueError as e:
+                    logger.warning(f"Invalid EEG frame received, skipping: {e}")
+                except Exception as e:
+                    logger.error(f"Kafka send failed: {e}")
+                continue
+
+            raw_message = message.get("text")
 
             try:
                 data = json.loads(raw_message)
-                send_eeg_event(user_id=user_id, eeg_payload=data)
+                await send_eeg_event_async(user_id=user_id, eeg_payload=data)
                 logger.debug(f"Received {len(data.get('records', []))} samples for user {user_id}")
 
-                await manager.broadcast_json({
+                manager.publish(user_id, {
                     "type": "EEG_FRAME",
                     "user_id": user_id,
                     "count": len(data.get("records", [])),
                     "data": data
                 })
 
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, TypeError):
                 logger.warning("Invalid JSON received, skipping...")
             except Exception as e:
                 logger.error(f"Kafka send failed: {e}")
 
     except WebSocketDisconnect:
-        await manager.disconnect(websocket)
         logger.info(f"User {user_id} disconnected")
+    finally:
+        await manager.disconnect(websocket)
 
 
 @router.websocket("/metrics")
@@ -86,27 +110,11 @@ async def metrics_endpoint(websocket: WebSocket):
         logger.warning("Metrics WebSocket connection rejected: No token provided")
         return
 
-    # 2️⃣ Decode the JWT
-    try:
-        # Use same validation options as REST API to handle clock skew and be more lenient
-        payload = jwt.decode(
-            token, JWT_SECRET_KEY, algorithms=[ALGORITHM], 
-            audience=JWT_AUDIENCE, issuer=JWT_ISSUER,
-            options={"verify_aud": True, "verify_nbf": False}  # Disable nbf check for clock skew
-        )
-        
-        user_id = payload.get("sub")
-        if user_id is None:
-            logger.error("❌ Metrics WebSocket: Token missing 'sub' claim")
-            await websocket.close(code=1008, reason="Invalid token: missing user_id")
-            logger.warning("Metrics WebSocket token missing user_id (sub)")
-            return
-        user_id = str(user_id)  # Convert to string for consistency
-    except JWTError as e:
-        logger.error(f"❌ Metrics WebSocket JWT validation failed: {type(e).__name__} - {str(e)}")
-        await websocket.close(code=1008, reason="Invalid or expired token")
-        logger.warning(f"Metrics WebSocket token validation failed: {e}")
+    # 2️⃣ Verify the JWT (same verifier as get_current_user)
+    user_id = await _authenticate(websocket, token, "Metrics")
+    if user_id is None:
         return
+    user_id = str(user_id)  # Convert to string for consistency
 
     # ✅ If authenticated successfully:
     logger.info(f"📊 Metrics WebSocket connected for user_id={user_id}")
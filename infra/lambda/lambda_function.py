@@ -1,4 +1,6 @@
 import os
+import io
+import gzip
 import json
 import boto3
 import psycopg2
@@ -28,6 +30,8 @@ def lambda_handler(event, context):
             # Process daily aggregation
             target_date = (now - timedelta(days=1)).strftime("%Y-%m-%d")
             parsed_date = datetime.strptime(target_date, "%Y-%m-%d").date()
+            ensure_eeg_record_partitions(now.date(), conn)
+            prune_minute_rollups(now, conn)
             process_daily_aggregation(parsed_date, conn)
 
         elif aggregation_type == "monthly":
@@ -68,79 +72,265 @@ def lambda_handler(event, context):
         cur.close()
         conn.close()
 
+# --- EEG_RECORDS PARTITIONS ---
+
+# eeg_records is range-partitioned by day (eeg_records_pYYYYMMDD + eeg_records_default)
+PARTITION_DAYS_AHEAD = int(os.environ.get('EEG_PARTITION_DAYS_AHEAD', '14'))
+
+def day_range(target_date):
+    """[start, end) timestamps for a day; range predicates let Postgres prune partitions"""
+    start = datetime.combine(target_date, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+def partition_name(target_date):
+    return f"eeg_records_p{target_date:%Y%m%d}"
+
+def ensure_eeg_record_partitions(start_date, conn):
+    """Create daily partitions from start_date through PARTITION_DAYS_AHEAD days later"""
+    for offset in range(PARTITION_DAYS_AHEAD + 1):
+        day = start_date + timedelta(days=offset)
+        start, end = day_range(day)
+        try:
+            execute_db(conn, f"""
+                CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF eeg_records
+                FOR VALUES FROM (%s) TO (%s)
+            """, (start, end))
+            conn.commit()
+        except Exception as e:
+            # Typically: rows for this day already sit in eeg_records_default
+            conn.rollback()
+            print(f"⚠️ Could not create partition {partition_name(day)}: {str(e)}")
+
+def drop_eeg_record_partition(target_date, conn):
+    """Drop a day's partition (plus any rows for that day in the default partition)"""
+    name = partition_name(target_date)
+    exists = query_db(conn, "SELECT to_regclass(%s)", (name,))[0][0]
+    if exists:
+        execute_db(conn, f"ALTER TABLE eeg_records DETACH PARTITION {name}")
+        execute_db(conn, f"DROP TABLE {name}")
+    execute_db(conn, """
+        DELETE FROM eeg_records_default WHERE timestamp >= %s AND timestamp < %s
+    """, day_range(target_date))
+
+# --- ROLLUP RETENTION ---
+
+MINUTE_ROLLUP_RETENTION_DAYS = int(os.environ.get('EEG_MINUTE_ROLLUP_RETENTION_DAYS', '7'))
+
+def prune_minute_rollups(now, conn):
+    """Delete per-minute rollups older than the retention window (hourly rollups are kept)"""
+    deleted = execute_db(conn, "DELETE FROM eeg_minute_rollups WHERE bucket < %s",
+                         (now - timedelta(days=MINUTE_ROLLUP_RETENTION_DAYS),))
+    conn.commit()
+    print(f"Pruned {deleted} minute rollups")
+
 # --- DAILY AGGREGATION ---
 
 def process_daily_aggregation(target_date, conn):
     """Process daily aggregation for a specific date"""
-    data_count = query_db(conn, "SELECT count(*) FROM eeg_records WHERE timestamp::date = %s", (target_date,))
+    data_count = query_db(conn, "SELECT count(*) FROM eeg_records WHERE timestamp >= %s AND timestamp < %s", day_range(target_date))[0][0]
 
     if data_count == 0:
         raise Exception(f"No EEG data found for {target_date}")
-    
-    users_with_data = query_db(conn, "SELECT DISTINCT user_id FROM eeg_records WHERE timestamp::date = %s", (target_date,))
 
-    for user_tuple in users_with_data:
-        user_id = user_tuple[0]
-        aggregate_daily_for_user(user_id, target_date, conn)
+    aggregate_daily(target_date, conn)
+
+    # Recount goals while the day's raw records still exist (they are dropped next)
+    try:
+        reconcile_goal_progress(target_date + timedelta(days=1), conn)
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Goal progress reconciliation failed: {str(e)}")
 
     # Perform backup and cleanup
     backup_and_clean_eeg_records(target_date, conn)
 
-def aggregate_daily_for_user(user_id, target_date, conn):
-    """Aggregate daily data for a specific user"""
-    daily_stats = query_db(conn, """
-        SELECT AVG(focus_label), AVG(stress_label), AVG(wellness_label)
+def aggregate_daily(target_date, conn):
+    """Upsert the day's averages for every user in one statement"""
+    start, end = day_range(target_date)
+    users = execute_db(conn, """
+        INSERT INTO daily_eeg_records (user_id, date, focus, stress, wellness)
+        SELECT user_id, %s,
+               round(avg(focus_label)::numeric, 2),
+               round(avg(stress_label)::numeric, 2),
+               round(avg(wellness_label)::numeric, 2)
         FROM eeg_records
-        WHERE user_id = %s AND timestamp::date = %s
-    """, (user_id, target_date))
-
-    if daily_stats and daily_stats[0]:
-        save_daily_aggregate(user_id, target_date, daily_stats, conn)
-    else:
-        raise Exception(f"No valid data found for user {user_id} on {target_date}")
-
-def save_daily_aggregate(user_id, target_date, daily_stats, conn):
-    """Save or update daily aggregation record"""
-    focus_val, stress_val, wellness_val = map(lambda x: round(x, 2), daily_stats)
-    
-    existing_record = query_db(conn, """
-        SELECT * FROM daily_eeg_records WHERE user_id = %s AND date = %s
-    """, (user_id, target_date))
-
-    if existing_record:
-        # Update existing record
-        query_db(conn, """
-            UPDATE daily_eeg_records
-            SET focus = %s, stress = %s, wellness = %s
-            WHERE user_id = %s AND date = %s
-        """, (focus_val, stress_val, wellness_val, user_id, target_date))
-    else:
-        # Insert new record
-        query_db(conn, """
-            INSERT INTO daily_eeg_records (user_id, date, focus, stress, wellness)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, target_date, focus_val, stress_val, wellness_val))
-
+        WHERE timestamp >= %s AND timestamp < %s
+        GROUP BY user_id
+        ON CONFLICT (user_id, date) DO UPDATE
+        SET focus = EXCLUDED.focus, stress = EXCLUDED.stress, wellness = EXCLUDED.wellness
+    """, (target_date, start, end))
+    conn.commit()
+    print(f"Aggregated daily data for {users} users on {target_date}")
+
+# --- GOAL PROGRESS RECONCILIATION ---
+
+# core-service keeps goals.current up to date on ingest; this is the nightly
+# correction (GoalsService.reconcile_progress in core-service, same rules as
+# its _GOAL_PROGRESS_SQL). Goals active or ended since yesterday are recomputed
+# from sessions, eeg_records, daily_eeg_records and today's records; MINUTES
+# goals are only raised, since raw records of earlier days are already gone.
+RECONCILE_GOALS_SQL = """
+WITH progress AS (
+    SELECT g.id,
+           LEAST(g.target, CASE g.tracking_method
+               WHEN 'SESSIONS' THEN s.sessions
+               WHEN 'MINUTES' THEN GREATEST(g.current, m.minutes)
+               WHEN 'HIGH_FOCUS' THEN d.high_focus_days + CASE WHEN t.high_focus >= 60 THEN 1 ELSE 0 END
+               WHEN 'LOW_STRESS_EPISODES' THEN d.low_stress_days + CASE WHEN t.low_stress >= 60 THEN 1 ELSE 0 END
+               ELSE g.current
+           END) AS progress
+    FROM goals g
+    LEFT JOIN LATERAL (
+        SELECT count(*) AS sessions
+        FROM sessions s
+        WHERE g.tracking_method = 'SESSIONS'
+          AND s.user_id = g.user_id
+          AND s.date >= CAST(g.start_date AS date)
+          AND s.date <= CAST(g.end_date AS date)
+          AND s.created_at >= g.created_at
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT count(*) FILTER (WHERE CASE
+                   WHEN g.goal_type = 'FOCUS' THEN r.focus_label > 0
+                   WHEN g.goal_type = 'MEDITATION'
+                       THEN r.stress_label <> 0 AND r.stress_label < 2.0 AND r.focus_label > 1.0
+                   ELSE r.focus_label > 0 OR r.stress_label > 0
+               END) AS minutes
+        FROM eeg_records r
+        WHERE g.tracking_method = 'MINUTES'
+          AND r.user_id = g.user_id
+          AND r.timestamp >= GREATEST(g.start_date, g.created_at)
+          AND r.timestamp <= g.end_date
+    ) m ON true
+    LEFT JOIN LATERAL (
+        SELECT count(*) FILTER (WHERE d.focus > 2.0) AS high_focus_days,
+               count(*) FILTER (WHERE d.stress < 1.0) AS low_stress_days
+        FROM daily_eeg_records d
+        WHERE g.tracking_method IN ('HIGH_FOCUS', 'LOW_STRESS_EPISODES')
+          AND d.user_id = g.user_id
+          AND d.date >= GREATEST(CAST(g.start_date AS date), CAST(g.created_at AS date))
+          AND d.date <= LEAST(CAST(g.end_date AS date), CAST(%(today)s AS date) - 1)
+    ) d ON true
+    LEFT JOIN LATERAL (
+        SELECT count(*) FILTER (WHERE r.focus_label > 2.0) AS high_focus,
+               count(*) FILTER (WHERE r.stress_label < 1.0) AS low_stress
+        FROM eeg_records r
+        WHERE g.tracking_method IN ('HIGH_FOCUS', 'LOW_STRESS_EPISODES')
+          AND CAST(g.start_date AS date) <= CAST(%(today)s AS date)
+          AND CAST(%(today)s AS date) <= CAST(g.end_date AS date)
+          AND r.user_id = g.user_id
+          AND r.timestamp >= GREATEST(CAST(%(today)s AS timestamp), g.created_at)
+          AND r.timestamp < CAST(%(today)s AS timestamp) + interval '1 day'
+    ) t ON true
+    WHERE g.end_date >= %(since)s
+)
+UPDATE goals g SET current = p.progress, updated_at = now() AT TIME ZONE 'utc'
+FROM progress p
+WHERE g.id = p.id AND g.current IS DISTINCT FROM p.progress
+"""
+
+# Ingest counters for crediting today's HIGH_FOCUS / LOW_STRESS_EPISODES goals;
+# earlier days are credited from daily_eeg_records
+PRUNE_THRESHOLD_COUNTS_SQL = """
+DELETE FROM eeg_daily_threshold_counts WHERE date < %(today)s
+"""
+
+def reconcile_goal_progress(today, conn):
+    """Recompute progress of goals active or ended since yesterday; returns how many changed"""
+    since = datetime.combine(today - timedelta(days=1), datetime.min.time())
+    changed = execute_db(conn, RECONCILE_GOALS_SQL, {"today": today, "since": since})
+    pruned = execute_db(conn, PRUNE_THRESHOLD_COUNTS_SQL, {"today": today})
     conn.commit()
+    print(f"🎯 Reconciled goal progress: {changed} goals changed, {pruned} old threshold counters removed")
+    return changed
 
 # --- BACKUP AND CLEANUP FUNCTION --- 
 
-def backup_and_clean_eeg_records(target_date, conn):
-    """Backup EEG records to S3 and delete from the EEGRecord table"""
-    try:
-        # Fetch all EEG records for the target date
-        records_to_backup = query_db(conn, """
-            SELECT * FROM eeg_records WHERE timestamp::date = %s
-        """, (target_date,))
-
-        if not records_to_backup:
-            print(f"No records to backup for {target_date}")
+# Rows fetched per round trip from the server-side cursor
+ARCHIVE_FETCH_ROWS = int(os.environ.get('EEG_ARCHIVE_FETCH_ROWS', '10000'))
+# Compressed bytes per multipart part (S3 minimum is 5 MiB, except the last part)
+ARCHIVE_PART_BYTES = int(os.environ.get('EEG_ARCHIVE_PART_BYTES', str(8 * 1024 * 1024)))
+
+class GzipNDJSONUpload:
+    """Streams gzip-compressed NDJSON to one S3 object, uploading fixed-size parts as they fill"""
+
+    def __init__(self, bucket, key, part_bytes=ARCHIVE_PART_BYTES):
+        self.bucket = bucket
+        self.key = key
+        self.part_bytes = part_bytes
+        self.buffer = io.BytesIO()
+        self.gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb')
+        self.upload_id = None
+        self.parts = []
+        self.rows = 0
+
+    def write(self, row):
+        self.gzip.write(json.dumps(row, default=str).encode('utf-8') + b"\n")
+        self.rows += 1
+        if self.buffer.tell() >= self.part_bytes:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType='application/x-ndjson', ContentEncoding='gzip'
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=self.buffer.getvalue()
+        )
+        self.parts.append({"ETag": response['ETag'], "PartNumber": part_number})
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def close(self):
+        self.gzip.close()
+        if self.upload_id is None:
+            # Small object: a single PUT is cheaper than a one-part multipart upload
+            s3.put_object(
+                Body=self.buffer.getvalue(), Bucket=self.bucket, Key=self.key,
+                ContentType='application/x-ndjson', ContentEncoding='gzip'
+            )
             return
+        self._upload_part()
+        s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
 
-        # Prepare data to upload to S3 (convert records to dictionary format)
-        backup_data = []
-        for record in records_to_backup:
-            backup_data.append({
+    def abort(self):
+        if self.upload_id is not None:
+            s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def archive_key(target_date, user_id):
+    return f"daily_backups/date={target_date}/user_id={user_id}/eeg_records.ndjson.gz"
+
+def archive_eeg_records(target_date, conn):
+    """Stream the day's EEG records to S3, one gzip NDJSON object per user. Returns the row count."""
+    bucket = os.environ['S3_DAILY_BUCKET']
+    # Named cursor = server-side cursor: rows arrive ARCHIVE_FETCH_ROWS at a time
+    cur = conn.cursor(name=f"eeg_archive_{partition_name(target_date)}")
+    cur.itersize = ARCHIVE_FETCH_ROWS
+    upload = None
+    current_user = None
+    total = 0
+    try:
+        # (user_id, timestamp) order is served by the unique index on the day's partition
+        cur.execute("""
+            SELECT id, user_id, timestamp, focus_label, stress_label, wellness_label
+            FROM eeg_records WHERE timestamp >= %s AND timestamp < %s
+            ORDER BY user_id, timestamp
+        """, day_range(target_date))
+
+        for record in cur:
+            if upload is None or record[1] != current_user:
+                if upload is not None:
+                    upload.close()
+                    total += upload.rows
+                current_user = record[1]
+                upload = GzipNDJSONUpload(bucket, archive_key(target_date, current_user))
+            upload.write({
                 "id": record[0],
                 "user_id": record[1],
                 "timestamp": record[2].isoformat() if record[2] else None,
@@ -148,20 +338,32 @@ def backup_and_clean_eeg_records(target_date, conn):
                 "stress_label": record[4],
                 "wellness_label": record[5]
             })
-        
-        # Upload data to S3 DAILY BACKUP BUCKET
-        s3.put_object(
-            Body=json.dumps(backup_data, default=str),
-            Bucket=os.environ['S3_DAILY_BUCKET'],
-            Key=f"daily_backups/{target_date}/eeg_records_backup.json"
-        )
 
-        # Delete from the main table after successful backup
-        query_db(conn, """
-            DELETE FROM eeg_records WHERE timestamp::date = %s
-        """, (target_date,))
+        if upload is not None:
+            upload.close()
+            total += upload.rows
+            upload = None
+        return total
+    except Exception:
+        if upload is not None:
+            upload.abort()
+        raise
+    finally:
+        cur.close()
+
+def backup_and_clean_eeg_records(target_date, conn):
+    """Backup EEG records to S3 and delete from the EEGRecord table"""
+    try:
+        backed_up = archive_eeg_records(target_date, conn)
+
+        if not backed_up:
+            print(f"No records to backup for {target_date}")
+            return
+
+        # Drop the day's partition after successful backup (no table-wide DELETE)
+        drop_eeg_record_partition(target_date, conn)
         conn.commit()
-        print(f"✅ Backup and cleanup successful for {target_date} - {len(backup_data)} records")
+        print(f"✅ Backup and cleanup successful for {target_date} - {backed_up} records")
 
     except Exception as e:
         # Log any error that occurs in backup or cleanup
@@ -176,20 +378,13 @@ def process_monthly_aggregation(year, month, conn):
     try:
         # Check if we have daily data for this month
         daily_count = query_db(conn, """
-            SELECT count(*) FROM daily_eeg_records WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-        """, (year, month))
+            SELECT count(*) FROM daily_eeg_records WHERE date >= %s AND date < %s
+        """, month_range(year, month))[0][0]
 
         if daily_count == 0:
             raise Exception(f"No daily records found for {year}-{month:02d}")
         
-        # Get all users who have daily records for the target month
-        users_with_data = query_db(conn, """
-            SELECT DISTINCT user_id FROM daily_eeg_records WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-        """, (year, month))
-
-        for user_tuple in users_with_data:
-            user_id = user_tuple[0]
-            aggregate_monthly_for_user(user_id, year, month, conn)
+        aggregate_monthly(year, month, conn)
 
         # Clean up daily records for this month after successful aggregation
         cleanup_daily_records_for_month(year, month, conn)
@@ -203,8 +398,8 @@ def cleanup_daily_records_for_month(year, month, conn):
     try:
         # Fetch records to be backed up
         records_to_backup = query_db(conn, """
-            SELECT * FROM daily_eeg_records WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-        """, (year, month))
+            SELECT * FROM daily_eeg_records WHERE date >= %s AND date < %s
+        """, month_range(year, month))
 
         if not records_to_backup:
             print(f"No daily records found for {year}-{month:02d}")
@@ -232,9 +427,9 @@ def cleanup_daily_records_for_month(year, month, conn):
         print(f"Deleting {len(records_to_backup)} daily records for {year}-{month:02d}")
         
         # Delete the records for this month from daily_eeg_records table
-        query_db(conn, """
-            DELETE FROM daily_eeg_records WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-        """, (year, month))
+        execute_db(conn, """
+            DELETE FROM daily_eeg_records WHERE date >= %s AND date < %s
+        """, month_range(year, month))
         conn.commit()
         print(f"✅ Successfully backed up and deleted {len(records_to_backup)} daily records for {year}-{month:02d}")
 
@@ -245,90 +440,64 @@ def cleanup_daily_records_for_month(year, month, conn):
         raise
    
 
-def aggregate_monthly_for_user(user_id, year, month, conn):
-    """Aggregate monthly data for a specific user"""
-    monthly_stats = query_db(conn, """
-        SELECT AVG(focus), AVG(stress), AVG(wellness)
+def month_range(year, month):
+    """[first day, first day of next month) for a month"""
+    start = datetime(year, month, 1).date()
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+def aggregate_monthly(year, month, conn):
+    """Upsert the month's averages for every user in one statement"""
+    start, end = month_range(year, month)
+    users = execute_db(conn, """
+        INSERT INTO monthly_eeg_records (user_id, year, month, focus, stress, wellness)
+        SELECT user_id, %s, %s,
+               round(avg(focus)::numeric, 2),
+               round(avg(stress)::numeric, 2),
+               round(avg(wellness)::numeric, 2)
         FROM daily_eeg_records
-        WHERE user_id = %s AND EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-    """, (user_id, year, month))
-
-    if monthly_stats and monthly_stats[0]:
-        save_monthly_aggregate(user_id, year, month, monthly_stats, conn)
-
-def save_monthly_aggregate(user_id, year, month, monthly_stats, conn):
-    """Save or update monthly aggregation record"""
-    focus_val, stress_val, wellness_val = map(lambda x: round(x, 2), monthly_stats)
-
-    existing_record = query_db(conn, """
-        SELECT * FROM monthly_eeg_records WHERE user_id = %s AND year = %s AND month = %s
-    """, (user_id, year, month))
-
-    if existing_record:
-        query_db(conn, """
-            UPDATE monthly_eeg_records
-            SET focus = %s, stress = %s, wellness = %s
-            WHERE user_id = %s AND year = %s AND month = %s
-        """, (focus_val, stress_val, wellness_val, user_id, year, month))
-    else:
-        query_db(conn, """
-            INSERT INTO monthly_eeg_records (user_id, year, month, focus, stress, wellness)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (user_id, year, month, focus_val, stress_val, wellness_val))
-
+        WHERE date >= %s AND date < %s
+        GROUP BY user_id
+        ON CONFLICT (user_id, year, month) DO UPDATE
+        SET focus = EXCLUDED.focus, stress = EXCLUDED.stress, wellness = EXCLUDED.wellness
+    """, (year, month, start, end))
     conn.commit()
+    print(f"Aggregated monthly data for {users} users for {year}-{month:02d}")
 
 # --- YEARLY AGGREGATION ---
 
 def process_yearly_aggregation(year, conn):
     """Process yearly aggregation"""
     try:
-        users_with_data = query_db(conn, """
-            SELECT DISTINCT user_id FROM monthly_eeg_records WHERE year = %s
-        """, (year,))
-
-        for user_tuple in users_with_data:
-            user_id = user_tuple[0]
-            aggregate_yearly_for_user(user_id, year, conn)
+        aggregate_yearly(year, conn)
 
     except Exception as e:
         raise Exception(f"Error in yearly aggregation for {year}: {str(e)}")
 
-def aggregate_yearly_for_user(user_id, year, conn):
-    """Aggregate yearly data for a specific user"""
-    yearly_stats = query_db(conn, """
-        SELECT AVG(focus), AVG(stress), AVG(wellness)
+def aggregate_yearly(year, conn):
+    """Upsert the year's averages for every user in one statement"""
+    users = execute_db(conn, """
+        INSERT INTO yearly_eeg_records (user_id, year, focus, stress, wellness)
+        SELECT user_id, %s,
+               round(avg(focus)::numeric, 2),
+               round(avg(stress)::numeric, 2),
+               round(avg(wellness)::numeric, 2)
         FROM monthly_eeg_records
-        WHERE user_id = %s AND year = %s
-    """, (user_id, year))
-
-    if yearly_stats and yearly_stats[0]:
-        save_yearly_aggregate(user_id, year, yearly_stats, conn)
-
-def save_yearly_aggregate(user_id, year, yearly_stats, conn):
-    """Save or update yearly aggregation record"""
-    focus_val, stress_val, wellness_val = map(lambda x: round(x, 2), yearly_stats)
-
-    existing_record = query_db(conn, """
-        SELECT * FROM yearly_eeg_records WHERE user_id = %s AND year = %s
-    """, (user_id, year))
-
-    if existing_record:
-        query_db(conn, """
-            UPDATE yearly_eeg_records
-            SET focus = %s, stress = %s, wellness = %s
-            WHERE user_id = %s AND year = %s
-        """, (focus_val, stress_val, wellness_val, user_id, year))
-    else:
-        query_db(conn, """
-            INSERT INTO yearly_eeg_records (user_id, year, focus, stress, wellness)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, year, focus_val, stress_val, wellness_val))
-
+        WHERE year = %s
+        GROUP BY user_id
+        ON CONFLICT (user_id, year) DO UPDATE
+        SET focus = EXCLUDED.focus, stress = EXCLUDED.stress, wellness = EXCLUDED.wellness
+    """, (year, year))
     conn.commit()
+    print(f"Aggregated yearly data for {users} users for {year}")
 
 def query_db(conn, query, params):
     """Helper function for executing SQL queries"""
     cur = conn.cursor()
     cur.execute(query, params)
     return cur.fetchall()
+
+def execute_db(conn, query, params=None):
+    """Helper function for executing SQL statements that return no rows"""
+    cur = conn.cursor()
+    cur.execute(query, params)
+    return cur.rowcount
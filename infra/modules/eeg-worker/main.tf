@@ -95,6 +95,108 @@ resource "aws_ecs_service" "eeg_worker" {
   }
 }
 
+# Ordered streaming workers: exactly one single-process task per eeg_stream.<n>
+# queue, so a user's streaming batches run one at a time in arrival order.
+# Never autoscaled - a second consumer on a shard would break that ordering.
+resource "aws_ecs_task_definition" "eeg_stream_worker" {
+  count                    = var.stream_shards
+  family                   = "${var.project_name}-${var.environment}-eeg-stream-worker-${count.index}"
+  network_mode             = "awsvpc"
+  requires_compatibilities = ["FARGATE"]
+  cpu                      = var.stream_worker_cpu
+  memory                   = var.stream_worker_memory
+  execution_role_arn       = var.ecs_execution_role_arn
+  task_role_arn            = var.ecs_task_role_arn
+
+  container_definitions = jsonencode([
+    {
+      name      = "eeg-stream-worker"
+      image     = "${var.ecr_repository_url}:latest"
+      cpu       = var.stream_worker_cpu
+      memory    = var.stream_worker_memory
+      essential = true
+
+      command = [
+        "celery", "-A", "app.core.celery_app", "worker",
+        "--loglevel=info",
+        "--concurrency=1",
+        "--prefetch-multiplier=1",
+        "-Q", "eeg_stream.${count.index}"
+      ]
+
+      environment = [
+        {
+          name  = "REDIS_URL"
+          value = var.redis_url
+        },
+        {
+          name  = "KAFKA_BROKER"
+          value = var.kafka_bootstrap_servers
+        },
+        {
+          name  = "ENVIRONMENT"
+          value = var.environment
+        },
+        {
+          name  = "EEG_STREAM_SHARDS"
+          value = tostring(var.stream_shards)
+        }
+      ]
+
+      logConfiguration = {
+        logDriver = "awslogs"
+        options = {
+          "awslogs-group"         = "/ecs/${var.project_name}-${var.environment}/eeg-worker"
+          "awslogs-region"        = var.aws_region
+          "awslogs-stream-prefix" = "stream-${count.index}"
+        }
+      }
+
+      healthCheck = {
+        command     = ["CMD-SHELL", "celery -A app.core.celery_app inspect ping || exit 1"]
+        interval    = 30
+        timeout     = 5
+        retries     = 3
+        startPeriod = 60
+      }
+    }
+  ])
+
+  tags = {
+    Name        = "${var.project_name}-${var.environment}-eeg-stream-worker-${count.index}"
+    Environment = var.environment
+    Project     = var.project_name
+    Service     = "eeg-worker"
+  }
+}
+
+resource "aws_ecs_service" "eeg_stream_worker" {
+  count           = var.stream_shards
+  name            = "${var.project_name}-${var.environment}-eeg-stream-worker-${count.index}"
+  cluster         = var.ecs_cluster_id
+  task_definition = aws_ecs_task_definition.eeg_stream_worker[count.index].arn
+  desired_count   = 1
+  launch_type     = "FARGATE"
+
+  # Stop the old task before starting the new one so a shard never has two consumers
+  deployment_minimum_healthy_percent = 0
+  deployment_maximum_percent         = 100
+
+  network_configuration {
+    subnets          = var.private_subnet_ids
+    security_groups  = [var.ecs_security_group_id]
+    assign_public_ip = false
+  }
+
+  force_new_deployment = true
+
+  tags = {
+    Name        = "${var.project_name}-${var.environment}-eeg-stream-worker-${count.index}-service"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
 # Auto Scaling for Celery Workers
 resource "aws_appautoscaling_target" "eeg_worker" {
   max_capacity       = var.worker_max_count
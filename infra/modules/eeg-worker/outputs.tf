@@ -12,3 +12,8 @@ output "eeg_worker_log_group" {
   description = "EEG worker CloudWatch log group"
   value       = aws_cloudwatch_log_group.eeg_worker.name
 }
+
+output "eeg_stream_worker_service_names" {
+  description = "EEG stream shard worker service names, one per eeg_stream.<n> queue"
+  value       = aws_ecs_service.eeg_stream_worker[*].name
+}
@@ -93,3 +93,21 @@ variable "log_retention_days" {
   type        = number
   default     = 7
 }
+
+variable "stream_shards" {
+  description = "Number of eeg_stream.<n> queues (EEG_STREAM_SHARDS); each gets one single-process worker"
+  type        = number
+  default     = 2
+}
+
+variable "stream_worker_cpu" {
+  description = "CPU units for each stream shard worker"
+  type        = number
+  default     = 1024
+}
+
+variable "stream_worker_memory" {
+  description = "Memory for each stream shard worker in MB"
+  type        = number
+  default     = 2048
+}
@@ -0,0 +1,7 @@
+"""
+Kafka building blocks shared by the services.
+
+Copied into each service image next to its app package (see the services'
+Dockerfiles and the shared build context in docker-compose.yml), so it is
+imported as a top-level package: from niura_kafka.async_producer import ...
+"""
@@ -0,0 +1,191 @@
+"""
+Batched, non-blocking Kafka producer.
+
+Wraps a single confluent_kafka Producer configured for linger/batching and
+compression. Messages are handed to librdkafka's local queue and sent in the
+background; a poll thread serves delivery callbacks, so callers never wait
+for a broker round trip unless they ask to (by awaiting the delivery future
+or calling flush()).
+
+The number of messages awaiting delivery is bounded: sync callers block and
+async callers await once the limit is reached, instead of growing memory
+without bound while the broker is slow. The same applies when librdkafka's
+local queue is full (BufferError): produce() sleeps and retries, while
+produce_async() awaits between retries so the event loop keeps running.
+
+Each service builds its process-wide instance from its own Kafka config
+(app.events.async_producer).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from confluent_kafka import KafkaException, Producer
+
+logger = logging.getLogger("kafka.producer")
+
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")  # lz4 | zstd | none
+KAFKA_MAX_IN_FLIGHT = int(os.getenv("KAFKA_MAX_IN_FLIGHT", "10000"))
+KAFKA_PRODUCE_TIMEOUT = float(os.getenv("KAFKA_PRODUCE_TIMEOUT", "5.0"))
+# murmur2 matches the Java client, so a key maps to the same partition from any producer
+KAFKA_PARTITIONER = os.getenv("KAFKA_PARTITIONER", "murmur2_random")
+
+# Wait between produce() attempts while librdkafka's local queue is full
+QUEUE_FULL_RETRY_INTERVAL = 0.01
+
+DeliveryCallback = Callable[[Optional[Exception], object], None]
+
+
+class AsyncKafkaProducer:
+    def __init__(
+        self,
+        config: dict,
+        linger_ms: int = KAFKA_LINGER_MS,
+        compression: str = KAFKA_COMPRESSION,
+        max_in_flight: int = KAFKA_MAX_IN_FLIGHT,
+        produce_timeout: float = KAFKA_PRODUCE_TIMEOUT,
+    ):
+        config = dict(config)
+        config.update({
+            "linger.ms": linger_ms,
+            "compression.type": compression,
+            "batch.size": 1024 * 1024,
+            "queue.buffering.max.messages": max_in_flight * 2,
+            "partitioner": KAFKA_PARTITIONER,
+        })
+        self._producer = Producer(config)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.produce_timeout = produce_timeout
+
+        self._closed = threading.Event()
+        self._poll_thread = threading.Thread(target=self._poll_loop, name="kafka-producer-poll", daemon=True)
+        self._poll_thread.start()
+
+    def _poll_loop(self):
+        """Serve delivery callbacks until the producer is closed."""
+        while not self._closed.is_set():
+            self._producer.poll(0.1)
+
+    def _delivery_handler(self, on_delivery: Optional[DeliveryCallback]):
+        """Delivery callback that frees the message's slot and logs the outcome."""
+        def delivered(err, msg):
+            self._slots.release()
+            if err:
+                logger.error(f"❌ Kafka delivery failed: {err}")
+            else:
+                logger.debug(f"✅ Kafka message delivered to {msg.topic()} [partition {msg.partition()}]")
+            if on_delivery is not None:
+                on_delivery(KafkaException(err) if err else None, msg)
+        return delivered
+
+    def _try_produce(self, topic: str, value, key, headers, delivered) -> bool:
+        """Hand one message to librdkafka; False if its local queue is full."""
+        try:
+            self._producer.produce(topic=topic, value=value, key=key, headers=headers, on_delivery=delivered)
+            return True
+        except BufferError:
+            return False
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _queue_full(self, topic: str) -> BufferError:
+        self._slots.release()
+        return BufferError(f"Kafka producer queue full ({topic})")
+
+    def _enqueue(self, topic: str, value, key, headers, on_delivery: Optional[DeliveryCallback]):
+        """Hand one message to librdkafka; the caller must already hold a slot."""
+        delivered = self._delivery_handler(on_delivery)
+        deadline = time.monotonic() + self.produce_timeout
+        # Local queue full: wait for the poll thread to drain it
+        while not self._try_produce(topic, value, key, headers, delivered):
+            if time.monotonic() >= deadline:
+                raise self._queue_full(topic)
+            time.sleep(QUEUE_FULL_RETRY_INTERVAL)
+
+    async def _enqueue_async(self, topic: str, value, key, headers, on_delivery: Optional[DeliveryCallback]):
+        """_enqueue for coroutines: awaits instead of sleeping while the local queue is full."""
+        delivered = self._delivery_handler(on_delivery)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.produce_timeout
+        while not self._try_produce(topic, value, key, headers, delivered):
+            if loop.time() >= deadline:
+                raise self._queue_full(topic)
+            await asyncio.sleep(QUEUE_FULL_RETRY_INTERVAL)
+
+    def produce(
+        self,
+        topic: str,
+        value,
+        key=None,
+        headers: Optional[List[Tuple[str, bytes]]] = None,
+        on_delivery: Optional[DeliveryCallback] = None,
+    ) -> None:
+        """
+        Queue a message without waiting for delivery.
+
+        Blocks (up to produce_timeout) only when max_in_flight messages are
+        already awaiting delivery; raises BufferError if no slot frees up.
+        """
+        if not self._slots.acquire(timeout=self.produce_timeout):
+            raise BufferError(f"Kafka producer backlog full ({topic})")
+        self._enqueue(topic, value, key, headers, on_delivery)
+
+    async def produce_async(
+        self,
+        topic: str,
+        value,
+        key=None,
+        headers: Optional[List[Tuple[str, bytes]]] = None,
+    ) -> asyncio.Future:
+        """
+        Queue a message from a coroutine and return its delivery future.
+
+        Awaiting this call only waits for a free slot (backpressure); await the
+        returned future as well to wait for the broker acknowledgement.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.produce_timeout
+        while not self._slots.acquire(blocking=False):
+            if loop.time() >= deadline:
+                raise BufferError(f"Kafka producer backlog full ({topic})")
+            await asyncio.sleep(0.005)
+
+        future = loop.create_future()
+        # Failures are already logged; don't warn if nobody awaits the future
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        def resolve(err, msg):
+            if future.cancelled():
+                return
+            if err is not None:
+                future.set_exception(err)
+            else:
+                future.set_result(msg)
+
+        def on_delivery(err, msg):
+            try:
+                loop.call_soon_threadsafe(resolve, err, msg)
+            except RuntimeError:
+                pass  # event loop already closed (shutdown)
+
+        await self._enqueue_async(topic, value, key, headers, on_delivery)
+        return future
+
+    def flush(self, timeout: float = 10.0) -> int:
+        """Wait for queued messages to be delivered. Returns how many are still pending."""
+        return self._producer.flush(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Deliver what is queued and stop the poll thread."""
+        remaining = self.flush(timeout)
+        if remaining:
+            logger.warning(f"⚠️ Kafka producer closed with {remaining} undelivered messages")
+        self._closed.set()
+        self._poll_thread.join(timeout=1.0)
+
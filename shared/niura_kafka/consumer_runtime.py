@@ -0,0 +1,362 @@
+"""
+Partition-parallel Kafka consumer runtime.
+
+One poll thread fetches messages in batches with consume() and hands each
+partition's messages to a fixed worker thread (chosen by partition), so
+partitions are handled in parallel while each partition, and therefore each
+user key, stays in offset order. Offsets are committed only up to messages
+whose handler has returned.
+
+Backpressure: a partition with too many fetched-but-unhandled messages is
+paused, and resumed once its worker catches up, so memory stays bounded
+while a handler is slow or retrying. stop() lets the workers finish what was
+fetched, commits, and closes the consumer (called from the app lifespan).
+
+Failed handler calls are retried with exponential backoff, at most
+max_attempts times. After that the messages that keep failing are given up
+on: handed to the dead_letter callback (e.g. dead_letter_topic(), which
+copies them to a DLQ topic) or, without one or if it fails, logged in full.
+Their offsets are then committed, so one poison message cannot stall its
+partition. When the handler failed a whole batch without saying which
+message was at fault (anything but RetryBatch), the batch is retried one
+message at a time first, so only the messages that fail on their own are
+given up on.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from confluent_kafka import Consumer, TopicPartition
+
+logger = logging.getLogger("kafka.consumer")
+
+KAFKA_CONSUMER_WORKERS = int(os.getenv("KAFKA_CONSUMER_WORKERS", "4"))
+KAFKA_CONSUMER_MAX_PENDING = int(os.getenv("KAFKA_CONSUMER_MAX_PENDING", "2000"))
+KAFKA_COMMIT_INTERVAL = float(os.getenv("KAFKA_COMMIT_INTERVAL", "1.0"))
+KAFKA_REVOKE_TIMEOUT = float(os.getenv("KAFKA_REVOKE_TIMEOUT", "30.0"))
+# Handler calls per message before it is dead-lettered; the wait between them
+# doubles from retry_backoff up to KAFKA_MAX_RETRY_BACKOFF
+KAFKA_HANDLER_MAX_ATTEMPTS = max(1, int(os.getenv("KAFKA_HANDLER_MAX_ATTEMPTS", "8")))
+KAFKA_MAX_RETRY_BACKOFF = float(os.getenv("KAFKA_MAX_RETRY_BACKOFF", "60.0"))
+
+Partition = Tuple[str, int]
+DeadLetterHandler = Callable[[list, Exception], None]
+
+
+class RetryBatch(Exception):
+    """Raised by a handler that finished only the first `handled` messages; the rest are retried."""
+
+    def __init__(self, handled: int, cause: Exception):
+        super().__init__(str(cause))
+        self.handled = handled
+        self.cause = cause
+
+
+class PartitionedConsumer:
+    def __init__(
+        self,
+        consumer: Consumer,
+        topics: List[str],
+        handler: Callable[[list], None],
+        name: str,
+        workers: int = KAFKA_CONSUMER_WORKERS,
+        batch_size: int = 500,
+        batch_timeout: float = 1.0,
+        max_pending: int = KAFKA_CONSUMER_MAX_PENDING,
+        retry_backoff: float = 2.0,
+        max_attempts: int = KAFKA_HANDLER_MAX_ATTEMPTS,
+        dead_letter: Optional[DeadLetterHandler] = None,
+    ):
+        """
+        handler(messages) is called from a worker thread with messages in
+        offset order per partition. It raises to have them retried (after
+        retry_backoff, doubling) or RetryBatch to retry only the unfinished
+        tail. dead_letter(messages, error) receives messages that still fail
+        after max_attempts; they are logged if it is None or raises.
+        """
+        self.consumer = consumer
+        self.topics = topics
+        self.handler = handler
+        self.name = name
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.max_pending = max_pending
+        self.retry_backoff = retry_backoff
+        self.max_attempts = max(1, max_attempts)
+        self.dead_letter = dead_letter
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._assigned: Set[Partition] = set()
+        self._revoking: Set[Partition] = set()
+        self._paused: Set[Partition] = set()
+        self._pending: Dict[Partition, int] = defaultdict(int)
+        self._done: Dict[Partition, int] = {}  # next offset to commit
+        self._stopping = threading.Event()
+
+        self._queues = [queue.Queue() for _ in range(max(1, workers))]
+        self._workers = [
+            threading.Thread(target=self._work, args=(q,), name=f"{name}-worker-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        self._poller = threading.Thread(target=self._poll_loop, name=f"{name}-poll", daemon=True)
+
+    # --- lifecycle ---
+
+    def start(self):
+        self.consumer.subscribe(self.topics, on_assign=self._on_assign, on_revoke=self._on_revoke)
+        for worker in self._workers:
+            worker.start()
+        self._poller.start()
+        logger.info(f"🚀 {self.name}: consuming {self.topics} with {len(self._workers)} workers")
+
+    def stop(self, timeout: float = 30.0):
+        """Stop polling, let workers finish fetched messages, commit and close."""
+        deadline = time.monotonic() + timeout
+        self._stopping.set()
+        self._poller.join(timeout)
+        for q in self._queues:
+            q.put(None)
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self._commit()
+        self.consumer.close()
+        logger.info(f"🛑 {self.name}: stopped")
+
+    # --- poll thread ---
+
+    def _poll_loop(self):
+        last_commit = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                self._dispatch(self.consumer.consume(num_messages=self.batch_size, timeout=self.batch_timeout))
+                self._apply_backpressure()
+                if time.monotonic() - last_commit >= KAFKA_COMMIT_INTERVAL:
+                    self._commit()
+                    last_commit = time.monotonic()
+            except Exception as e:
+                logger.exception(f"❌ {self.name}: error in poll loop: {e}")
+                time.sleep(1.0)
+
+    def _dispatch(self, messages):
+        """Group a fetched batch by partition and queue each group on its partition's worker."""
+        by_partition: Dict[Partition, list] = {}
+        for msg in messages:
+            if msg.error():
+                logger.error(f"Kafka error: {msg.error()}")
+                continue
+            by_partition.setdefault((msg.topic(), msg.partition()), []).append(msg)
+
+        for tp, batch in by_partition.items():
+            with self._lock:
+                self._pending[tp] += len(batch)
+            self._queues[hash(tp) % len(self._queues)].put(batch)
+
+    def _apply_backpressure(self):
+        with self._lock:
+            pause = [tp for tp in self._assigned - self._paused if self._pending[tp] >= self.max_pending]
+            resume = [tp for tp in self._paused if self._pending[tp] <= self.max_pending // 2]
+            self._paused.update(pause)
+            self._paused.difference_update(resume)
+        if pause:
+            self.consumer.pause([TopicPartition(t, p) for t, p in pause])
+            logger.warning(f"⏸️ {self.name}: paused {len(pause)} partitions (handlers behind)")
+        if resume:
+            self.consumer.resume([TopicPartition(t, p) for t, p in resume])
+            logger.info(f"▶️ {self.name}: resumed {len(resume)} partitions")
+
+    def _commit(self):
+        with self._lock:
+            done, self._done = self._done, {}
+        if not done:
+            return
+        try:
+            self.consumer.commit(offsets=[TopicPartition(t, p, o) for (t, p), o in done.items()], asynchronous=False)
+        except Exception as e:
+            logger.error(f"❌ {self.name}: offset commit failed, will retry: {e}")
+            with self._lock:
+                for tp, offset in done.items():
+                    self._done[tp] = max(offset, self._done.get(tp, 0))
+
+    def _on_assign(self, consumer, partitions):
+        with self._lock:
+            for p in partitions:
+                self._assigned.add((p.topic, p.partition))
+                self._pending[(p.topic, p.partition)] = 0
+
+    def _on_revoke(self, consumer, partitions):
+        """Let in-flight work on revoked partitions finish and commit it before giving them up."""
+        revoked = {(p.topic, p.partition) for p in partitions}
+        with self._changed:
+            # Queued messages for these partitions are dropped; the next owner re-reads them
+            self._revoking.update(revoked)
+            self._changed.wait_for(lambda: all(self._pending[tp] <= 0 for tp in revoked), KAFKA_REVOKE_TIMEOUT)
+            self._assigned.difference_update(revoked)
+            self._revoking.difference_update(revoked)
+            done = {tp: self._done.pop(tp) for tp in revoked if tp in self._done}
+            for tp in revoked:
+                self._pending.pop(tp, None)
+                self._paused.discard(tp)
+        if done:
+            try:
+                consumer.commit(offsets=[TopicPartition(t, p, o) for (t, p), o in done.items()], asynchronous=False)
+            except Exception as e:
+                logger.error(f"❌ {self.name}: commit on revoke failed: {e}")
+
+    # --- worker threads ---
+
+    def _work(self, q: "queue.Queue"):
+        while True:
+            batch = q.get()
+            if batch is None:
+                return
+            # Coalesce whatever else is already queued for this worker into one handler call
+            while len(batch) < self.batch_size:
+                try:
+                    more = q.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    q.put(None)
+                    break
+                batch.extend(more)
+            self._handle(batch)
+
+    def _handle(self, messages: list):
+        attempts = 0
+        while messages:
+            messages = self._drop_unassigned(messages)
+            if not messages:
+                return
+            try:
+                self.handler(messages)
+                self._finish(messages, committed=True)
+                return
+            except RetryBatch as e:
+                if e.handled:
+                    attempts = 0  # progress: the remaining messages start over
+                self._finish(messages[:e.handled], committed=True)
+                messages, error, culprit_known = messages[e.handled:], e.cause, True
+            except Exception as e:
+                error, culprit_known = e, len(messages) == 1
+            attempts += 1
+
+            if self._stopping.is_set():
+                # Not committed: these (and later messages of their partitions) are re-read after restart
+                logger.warning(f"⚠️ {self.name}: abandoning {len(messages)} unhandled messages on shutdown: {error}")
+                with self._lock:
+                    self._assigned.difference_update((m.topic(), m.partition()) for m in messages)
+                self._finish(messages, committed=False)
+                return
+
+            if attempts >= self.max_attempts:
+                if culprit_known:
+                    self._give_up(messages[:1], error)
+                    messages = messages[1:]
+                else:
+                    messages = self._isolate(messages)
+                attempts = 0
+                continue
+
+            delay = min(self.retry_backoff * 2 ** (attempts - 1), KAFKA_MAX_RETRY_BACKOFF)
+            logger.error(
+                f"❌ {self.name}: handler failed for {len(messages)} messages "
+                f"(attempt {attempts}/{self.max_attempts}), retrying in {delay}s: {error}"
+            )
+            time.sleep(delay)
+
+    def _isolate(self, messages: list) -> list:
+        """
+        Run a batch that keeps failing one message at a time, giving up on each
+        message that fails alone. Returns the messages left unhandled (on shutdown).
+        """
+        logger.warning(f"⚠️ {self.name}: retrying {len(messages)} failed messages one at a time")
+        for i, msg in enumerate(messages):
+            if self._stopping.is_set():
+                return messages[i:]
+            try:
+                self.handler([msg])
+                self._finish([msg], committed=True)
+            except Exception as e:
+                self._give_up([msg], e.cause if isinstance(e, RetryBatch) else e)
+        return []
+
+    def _give_up(self, messages: list, error: Exception):
+        """Dead-letter (or log) messages that cannot be handled, and commit past them."""
+        if self.dead_letter is not None:
+            try:
+                self.dead_letter(messages, error)
+                logger.error(f"☠️ {self.name}: dead-lettered {len(messages)} messages: {error}")
+                self._finish(messages, committed=True)
+                return
+            except Exception as e:
+                logger.exception(f"❌ {self.name}: dead-letter handler failed, logging the messages instead: {e}")
+        for msg in messages:
+            value = msg.value() or b""
+            logger.error(
+                f"☠️ {self.name}: giving up on {msg.topic()}[{msg.partition()}]@{msg.offset()} "
+                f"key={msg.key()!r} ({len(value)} bytes): {error}; value={value[:1024]!r}"
+            )
+        self._finish(messages, committed=True)
+
+    def _drop_unassigned(self, messages: list) -> list:
+        with self._lock:
+            assigned = self._assigned - self._revoking
+        keep = [m for m in messages if (m.topic(), m.partition()) in assigned]
+        if len(keep) != len(messages):
+            self._finish([m for m in messages if (m.topic(), m.partition()) not in assigned], committed=False)
+        return keep
+
+    def _finish(self, messages: list, committed: bool):
+        if not messages:
+            return
+        with self._changed:
+            for msg in messages:
+                tp = (msg.topic(), msg.partition())
+                self._pending[tp] -= 1
+                if committed and tp in self._assigned:
+                    self._done[tp] = max(msg.offset() + 1, self._done.get(tp, 0))
+            self._changed.notify_all()
+
+
+def dead_letter_topic(producer, topic: str, timeout: float = 10.0) -> DeadLetterHandler:
+    """
+    dead_letter handler that copies messages (value, key and headers) to
+    `topic` and waits for delivery. The error and the original position are
+    added as dlq.error / dlq.source headers.
+
+    producer: anything with produce(topic, value, key, headers, on_delivery)
+    that serves delivery callbacks, e.g. niura_kafka.async_producer.AsyncKafkaProducer.
+    """
+    def send(messages: list, error: Exception) -> None:
+        done = threading.Event()
+        lock = threading.Lock()
+        pending = [len(messages)]
+        failures: List[Exception] = []
+
+        def delivered(err, msg):
+            with lock:
+                if err is not None:
+                    failures.append(err)
+                pending[0] -= 1
+                if pending[0] == 0:
+                    done.set()
+
+        for msg in messages:
+            headers = list(msg.headers() or []) + [
+                ("dlq.error", str(error).encode("utf-8", "replace")[:1024]),
+                ("dlq.source", f"{msg.topic()}[{msg.partition()}]@{msg.offset()}".encode()),
+            ]
+            producer.produce(topic, msg.value(), key=msg.key(), headers=headers, on_delivery=delivered)
+
+        if not done.wait(timeout):
+            raise TimeoutError(f"dead-letter messages to {topic} not delivered within {timeout}s")
+        if failures:
+            raise failures[0]
+
+    return send